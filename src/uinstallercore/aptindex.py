@@ -0,0 +1,82 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import gzip
+import bz2
+
+__all__ = ['PackageIndex']
+
+class PackageIndex(object):
+    ''' The names of the packages APT knows about, read once from its list files
+    (/var/lib/apt/lists/*_Packages), so no aptitude has to be started to ask for them. '''
+
+    def __init__(self, lists_dir="/var/lib/apt/lists"):
+        ''' Creates a new index of the lists found in lists_dir '''
+        self._lists_dir = lists_dir
+        self._names = None
+
+    def load(self):
+        ''' (Re)read the list files, i.e. after an apt-get update '''
+        names = set()
+        if(os.path.isdir(self._lists_dir)):
+            for filename in sorted(os.listdir(self._lists_dir)):
+                listfh = self._open(os.path.join(self._lists_dir, filename))
+                if(listfh is None):
+                    continue
+                try:
+                    for line in listfh:
+                        if(line.startswith("Package:")):
+                            names.add(line[8:].strip().lower())
+                finally:
+                    listfh.close()
+        self._names = names
+        return self
+
+    def __len__(self):
+        return len(self._get_names())
+
+    def has_package(self, name):
+        ''' Returns True/False as to whether a package with that name exists '''
+        return name.lower() in self._get_names()
+
+    def find_localized(self, prefix, locale):
+        ''' Return the package localizing prefix for locale, or for its language if there is none for
+        the locale (i.e. 'firefox-l10n-', 'pt_BR' -> firefox-l10n-pt-br or firefox-l10n-pt); None if neither exists '''
+        candidates = [locale.replace("_", "-")]
+        if("_" in locale):
+            candidates.append(locale.split("_")[0])
+        for candidate in candidates:
+            name = (prefix + candidate).lower()
+            if(name in self._get_names()):
+                return name
+        return None
+
+    def get_localized_packages(self, prefixes, locale):
+        ''' Return the packages localizing every one of prefixes for locale (skipping the ones that don't exist) '''
+        packages = []
+        for prefix in prefixes:
+            name = self.find_localized(prefix, locale)
+            if(name is not None):
+                packages.append(name)
+        return packages
+
+    def _get_names(self):
+        if(self._names is None):
+            self.load()
+        return self._names
+
+    def _open(self, path):
+        if(path.endswith("_Packages")):
+            return open(path, "r")
+        elif(path.endswith("_Packages.gz")):
+            return gzip.open(path, "rb")
+        elif(path.endswith("_Packages.bz2")):
+            return bz2.BZ2File(path, "r")
+        return None
@@ -0,0 +1,381 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+# Measures the copy phase of the install on synthetic source trees, no live media, mounts or root needed:
+#   python -m uinstallercore.benchmark [--shape tiny --shape huge ...] [--save results.json] [--compare old.json]
+# With --cold the source is dropped from the page cache before it is copied, to see the cost of seeking, i.e.:
+#   python -m uinstallercore.benchmark --cold --shape scattered --save walk.json
+#   python -m uinstallercore.benchmark --cold --shape scattered --set COPY_ORDER=physical --compare walk.json
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import __builtin__
+from optparse import OptionParser
+
+from uinstallercore.tracing import CallbackSink
+from uinstallercore.syscalls import posix_fadvise, POSIX_FADV_DONTNEED
+
+__all__ = ['SHAPES', 'generate_tree', 'drop_cache', 'BenchmarkResult', 'run_benchmark', 'compare_results']
+
+MB = 1024 * 1024
+
+def _data(rand, size):
+    # pseudo random data, the same for every run with the same seed
+    return "".join([chr(rand.getrandbits(8)) for i in xrange(min(size, 4096))]) * (size // 4096 + 1)
+
+def _write(path, data, size):
+    fh = open(path, "wb")
+    try:
+        while(size > 0):
+            chunk = data[:size]
+            fh.write(chunk)
+            size -= len(chunk)
+    finally:
+        fh.close()
+
+def _tiny(root, rand, scale):
+    # lots of small files, the per-file cost of the walk and of copy_file() dominates
+    for i in xrange(int(5000 * scale)):
+        directory = os.path.join(root, "d%03d" % (i % 50))
+        if(not os.path.isdir(directory)):
+            os.mkdir(directory)
+        size = rand.randint(0, 2048)
+        _write(os.path.join(directory, "f%05d" % i), _data(rand, size), size)
+
+def _huge(root, rand, scale):
+    # a few big files, the data path dominates
+    block = _data(rand, MB)
+    for i in xrange(3):
+        _write(os.path.join(root, "huge%d" % i), block, int(64 * MB * scale))
+
+def _deep(root, rand, scale):
+    # long chains of directories with a file on every level
+    for chain in xrange(max(int(10 * scale), 1)):
+        directory = os.path.join(root, "chain%02d" % chain)
+        for level in xrange(64):
+            directory = os.path.join(directory, "l%02d" % level)
+            os.makedirs(directory)
+            _write(os.path.join(directory, "file"), _data(rand, 100), rand.randint(0, 100))
+
+def _symlinks(root, rand, scale):
+    # symlinks to files, to directories and dangling ones
+    os.mkdir(os.path.join(root, "targets"))
+    for i in xrange(100):
+        _write(os.path.join(root, "targets", "t%03d" % i), "target\n", 7)
+    os.mkdir(os.path.join(root, "links"))
+    for i in xrange(int(2000 * scale)):
+        kind = i % 3
+        if(kind == 0):
+            target = "../targets/t%03d" % rand.randint(0, 99)
+        elif(kind == 1):
+            target = "../targets"
+        else:
+            target = "../missing/m%d" % i
+        os.symlink(target, os.path.join(root, "links", "l%05d" % i))
+
+def _fifos(root, rand, scale):
+    for i in xrange(max(int(50 * scale), 1)):
+        os.mkfifo(os.path.join(root, "fifo%03d" % i))
+
+def _hardlinks(root, rand, scale):
+    # sets of names for the same inode
+    for i in xrange(int(200 * scale)):
+        first = os.path.join(root, "h%04d.0" % i)
+        size = rand.randint(0, 16384)
+        _write(first, _data(rand, size), size)
+        for link in xrange(1, 4):
+            os.link(first, os.path.join(root, "h%04d.%d" % (i, link)))
+
+def _sparse(root, rand, scale):
+    # big apparent sizes, a few MB of real data
+    block = _data(rand, MB)
+    for i in xrange(4):
+        fh = open(os.path.join(root, "sparse%d" % i), "wb")
+        try:
+            size = int(256 * MB * scale)
+            for offset in xrange(0, size, size // 4):
+                fh.seek(offset)
+                fh.write(block)
+            fh.truncate(size)
+        finally:
+            fh.close()
+
+def _scattered(root, rand, scale):
+    # medium files written in a random order, so their data isn't laid out in the order of their directories
+    names = [("d%02d" % (i % 20), "f%04d" % i) for i in xrange(int(400 * scale))]
+    rand.shuffle(names)
+    block = _data(rand, 256 * 1024)
+    for (directory, name) in names:
+        directory = os.path.join(root, directory)
+        if(not os.path.isdir(directory)):
+            os.mkdir(directory)
+        path = os.path.join(directory, name)
+        _write(path, block, 256 * 1024)
+        # have the blocks allocated now, in this order
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+# the shapes of source tree, name -> generator(root, random, scale)
+SHAPES = {"tiny": _tiny, "huge": _huge, "deep": _deep, "symlinks": _symlinks,
+          "fifos": _fifos, "hardlinks": _hardlinks, "sparse": _sparse, "scattered": _scattered}
+SHAPE_ORDER = ["tiny", "huge", "deep", "symlinks", "fifos", "hardlinks", "sparse", "scattered"]
+
+def generate_tree(root, shapes, scale=1.0, seed=0):
+    ''' Fill root with the given shapes (every one in its own directory); the same seed and scale always give the same tree '''
+    for shape in shapes:
+        directory = os.path.join(root, shape)
+        os.makedirs(directory)
+        SHAPES[shape](directory, random.Random("%s-%d" % (shape, seed)), scale)
+
+class BenchmarkResult(object):
+    ''' The measures of copying one source tree '''
+
+    def __init__(self, shape, files, nbytes, elapsed, phases, peak_rss, syscalls, methods, holes=0):
+        ''' Creates a new result;
+        * shape is the name of the tree, files and nbytes its size (the data, without holes).
+        * elapsed is the wall time of the whole copy phase, phases the time of every phase traced in it.
+        * peak_rss is the peak resident memory in KiB.
+        * syscalls the read and write system calls made (from /proc/self/io), None if unknown.
+        * methods the files and bytes done by every copy method.
+        * holes the bytes of the sparse files that are holes, they weren't copied. '''
+        self.shape = shape
+        self.files = files
+        self.bytes = nbytes
+        self.elapsed = elapsed
+        self.phases = phases
+        self.peak_rss = peak_rss
+        self.syscalls = syscalls
+        self.methods = methods
+        self.holes = holes
+
+    def get_files_rate(self):
+        ''' Return the files copied per second '''
+        return self.files / max(self.elapsed, 0.000001)
+
+    def get_bytes_rate(self):
+        ''' Return the MB copied per second '''
+        return self.bytes / max(self.elapsed, 0.000001) / MB
+
+    def to_dict(self):
+        ''' Return the result as a dict, to be saved as JSON '''
+        return {"shape": self.shape, "files": self.files, "bytes": self.bytes, "elapsed": self.elapsed,
+                "phases": self.phases, "peak_rss": self.peak_rss, "syscalls": self.syscalls, "methods": self.methods,
+                "holes": self.holes, "files_rate": self.get_files_rate(), "bytes_rate": self.get_bytes_rate()}
+
+    @classmethod
+    def from_dict(cls, values):
+        ''' Creates a result from a dict made by to_dict() '''
+        return cls(values["shape"], values["files"], values["bytes"], values["elapsed"], values["phases"],
+                   values["peak_rss"], values["syscalls"], values["methods"], values.get("holes", 0))
+
+def _read_io():
+    # read and write system calls made by this process (every thread) so far
+    try:
+        iofh = open("/proc/self/io", "r")
+    except IOError:
+        return None
+    counters = dict()
+    try:
+        for line in iofh:
+            (name, value) = line.split(":")
+            counters[name.strip()] = int(value)
+    finally:
+        iofh.close()
+    return counters
+
+def _new_engine(workdir, settings):
+    # the engine reads its configuration from uinstaller.conf in the current directory
+    if(not hasattr(__builtin__, "_")):
+        __builtin__._ = lambda message: message
+    conffh = open(os.path.join(workdir, "uinstaller.conf"), "w")
+    conffh.write("[distribution]\nDISTRIBUTION_NAME = benchmark\nDISTRIBUTION_VERSION = 0\n")
+    conffh.write("[install]\nLIVE_USER_NAME = benchmark\nLIVE_MEDIA_SOURCE = none\nLIVE_MEDIA_TYPE = none\n")
+    for (key, value) in settings:
+        conffh.write("%s = %s\n" % (key, value))
+    conffh.close()
+    from uinstallercore.core import UInstallerEngine
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        # not the snapshot of the installer, its configuration isn't ours
+        engine = UInstallerEngine(config_cache=None)
+    finally:
+        os.chdir(cwd)
+    engine.set_progress_hook(lambda **kwargs: None)
+    engine.set_error_hook(lambda **kwargs: None)
+    return engine
+
+def _measure(shape, source, target, workdir, settings):
+    engine = _new_engine(workdir, settings)
+    phases = dict()
+    def trace(event):
+        if(event["event"] == "end"):
+            phases[event["phase"]] = phases.get(event["phase"], 0) + event["elapsed"]
+    engine.set_trace_sink(CallbackSink(trace))
+    stdout = sys.stdout
+    cwd = os.getcwd()
+    before = _read_io()
+    start = time.time()
+    sys.stdout = open(os.devnull, "w") # the engine is chatty
+    try:
+        engine.copy_system(source + "/", target + "/")
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        os.chdir(cwd)
+    elapsed = time.time() - start
+    after = _read_io()
+    syscalls = None
+    if(before is not None and after is not None):
+        syscalls = {"read": after.get("syscr", 0) - before.get("syscr", 0), "write": after.get("syscw", 0) - before.get("syscw", 0)}
+    counters = engine.get_tracer().get_counters()
+    files = sum([value for (name, value) in counters.items() if name.startswith("files_")])
+    stats = engine.get_copy_stats()
+    from uinstallercore.filecopy import COPY_METHODS
+    methods = dict([(method, [stats.get_files(method), stats.get_bytes(method)]) for method in COPY_METHODS])
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes_copied is the apparent size of the files, the holes of the sparse ones were never read nor written
+    holes = stats.get_hole_bytes()
+    return BenchmarkResult(shape, files, counters.get("bytes_copied", 0) - holes, elapsed, phases, peak_rss, syscalls, methods, holes)
+
+def drop_cache(root):
+    ''' Write the files below root to disk and drop them from the page cache, so the next copy reads them from the disk '''
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if(os.path.islink(path) or not os.path.isfile(path)):
+                continue
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                posix_fadvise(fd, 0, 0, POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+def run_benchmark(shape, scale=1.0, seed=0, settings=(), tmpdir=None, cold=False):
+    ''' Generate the tree of shape, copy it with the engine and return the BenchmarkResult.
+    The copy runs in a child process, so the peak memory is its own; settings are (key, value) for the [install] section.
+    With cold, the tree is dropped from the page cache before it is copied. '''
+    workdir = tempfile.mkdtemp(prefix="uinstaller-benchmark-", dir=tmpdir)
+    try:
+        source = os.path.join(workdir, "source")
+        target = os.path.join(workdir, "target")
+        generate_tree(source, [shape], scale, seed)
+        os.mkdir(target)
+        if(cold):
+            drop_cache(source)
+        (readfd, writefd) = os.pipe()
+        pid = os.fork()
+        if(pid == 0):
+            code = 0
+            try:
+                try:
+                    os.close(readfd)
+                    result = _measure(shape, source, target, workdir, settings)
+                    os.write(writefd, json.dumps(result.to_dict()))
+                except:
+                    import traceback
+                    traceback.print_exc()
+                    code = 1
+            finally:
+                os._exit(code)
+        os.close(writefd)
+        output = []
+        while(True):
+            data = os.read(readfd, 65536)
+            if not data:
+                break
+            output.append(data)
+        os.close(readfd)
+        (pid, status) = os.waitpid(pid, 0)
+        if(status != 0 or not output):
+            raise RuntimeError("The benchmark of %s failed" % shape)
+        return BenchmarkResult.from_dict(json.loads("".join(output)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare_results(old, new):
+    ''' Return the lines comparing two lists of results, by shape (old or new may miss some) '''
+    lines = []
+    old = dict([(result.shape, result) for result in old])
+    for result in new:
+        if(result.shape not in old):
+            continue
+        before = old[result.shape]
+        change = lambda a, b: (b - a) * 100.0 / max(a, 0.000001)
+        lines.append("%-10s files/s %+6.1f%%  MB/s %+6.1f%%  peak RSS %+6.1f%%" % (result.shape,
+                     change(before.get_files_rate(), result.get_files_rate()), change(before.get_bytes_rate(), result.get_bytes_rate()),
+                     change(before.peak_rss, result.peak_rss)))
+    return lines
+
+def _format(result):
+    phases = " ".join(["%s=%.2fs" % (phase, result.phases[phase]) for phase in sorted(result.phases)])
+    if(result.syscalls is None):
+        syscalls = "n/a"
+    else:
+        syscalls = "%d/%d" % (result.syscalls["read"], result.syscalls["write"])
+    if(result.holes):
+        phases += " holes=%.1fMB" % (float(result.holes) / MB)
+    return "%-10s %7d files %9.1f MB %7.2fs %9.0f files/s %8.1f MB/s %8d KiB %15s  %s" % (result.shape, result.files,
+           float(result.bytes) / MB, result.elapsed, result.get_files_rate(), result.get_bytes_rate(), result.peak_rss, syscalls, phases)
+
+def main(args=None):
+    parser = OptionParser(usage="%prog [options]", description="Benchmark the copy phase of the install on synthetic source trees.")
+    parser.add_option("--shape", action="append", dest="shapes", choices=SHAPE_ORDER, help="tree to copy, can be repeated (default: all of them)")
+    parser.add_option("--scale", type="float", default=1.0, help="size factor of the trees (default: 1)")
+    parser.add_option("--seed", type="int", default=0, help="seed of the generated trees (default: 0)")
+    parser.add_option("--repeat", type="int", default=1, help="copies of every tree, the fastest one is kept (default: 1)")
+    parser.add_option("--set", action="append", dest="settings", default=[], metavar="KEY=VALUE", help="engine setting, i.e. COPY_WORKERS=8")
+    parser.add_option("--cold", action="store_true", default=False, help="drop the source from the page cache before copying it")
+    parser.add_option("--tmpdir", default=None, help="where the trees are generated (default: the system temporary directory)")
+    parser.add_option("--save", default=None, metavar="FILE", help="write the results as JSON to FILE")
+    parser.add_option("--compare", default=None, metavar="FILE", help="compare with the results saved in FILE")
+    (options, args) = parser.parse_args(args)
+    settings = []
+    for setting in options.settings:
+        if("=" not in setting):
+            parser.error("--set needs KEY=VALUE, not %s" % setting)
+        settings.append(tuple(setting.split("=", 1)))
+    results = []
+    print "%-10s %13s %12s %8s %17s %13s %12s %15s  %s" % ("shape", "files", "size", "time", "rate", "throughput", "peak RSS", "syscalls r/w", "phases")
+    for shape in (options.shapes or SHAPE_ORDER):
+        best = None
+        for i in xrange(max(options.repeat, 1)):
+            result = run_benchmark(shape, options.scale, options.seed, settings, options.tmpdir, options.cold)
+            if(best is None or result.elapsed < best.elapsed):
+                best = result
+        print _format(best)
+        sys.stdout.flush()
+        results.append(best)
+    if(options.save is not None):
+        savefh = open(options.save, "w")
+        json.dump({"scale": options.scale, "seed": options.seed, "settings": settings, "cold": options.cold,
+                   "results": [result.to_dict() for result in results]}, savefh, indent=1, sort_keys=True)
+        savefh.close()
+    if(options.compare is not None):
+        comparefh = open(options.compare, "r")
+        saved = json.load(comparefh)
+        comparefh.close()
+        if(saved["scale"] != options.scale or saved["seed"] != options.seed):
+            print "Warning: %s was made with another scale or seed" % options.compare
+        print "Compared with %s:" % options.compare
+        for line in compare_results([BenchmarkResult.from_dict(values) for values in saved["results"]], results):
+            print line
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import re
+import fnmatch
+
+from uinstallercore.config import ConfigError
+
+__all__ = ['Blacklist', 'EXTRACT_DEPTH']
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+# how deep (in path components) a glob is followed when it's given to unsquashfs, see get_extract_patterns
+EXTRACT_DEPTH = 32
+
+# a glob needing more unsquashfs patterns than this is refused
+_MAX_EXTRACT_PATTERNS = 1024
+
+# the characters with a meaning in a POSIX extended regular expression
+_ERE_SPECIAL = re.compile(r"([\\.\[\]()*+?{}|^$])")
+
+class Blacklist(object):
+    ''' The paths of the live system that are not copied onto the new filesystem.
+    Paths are relative to the root of the live system (a leading '/' is ignored) and are one of:
+    * an exact path, i.e. '/home/mint': that file, or that directory and everything in it.
+    * a prefix, ending with '/', i.e. '/var/cache/apt/archives/': everything in the directory, which is kept empty.
+    * a glob pattern, i.e. '/usr/share/doc/*' or '*.pyc', where '*' also matches '/'.
+    The patterns are compiled into a single set lookup and two regular expressions. '''
+
+    def __init__(self, patterns=()):
+        ''' Creates a new blacklist with the given patterns '''
+        self._patterns = []
+        self._exact = set()
+        self._prefixes = []
+        self._globs = []
+        self._compiled = True
+        self._prefix_re = None
+        self._glob_re = None
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        ''' Add a pattern, returns True if it's a new one '''
+        pattern = pattern.strip()
+        relative = pattern.lstrip("/")
+        if(not relative or pattern in self._patterns):
+            return False
+        self._patterns.append(pattern)
+        if(_GLOB_CHARS.search(relative)):
+            self._globs.append(relative)
+        elif(relative.endswith("/")):
+            self._prefixes.append(relative)
+        else:
+            self._exact.add(relative)
+        self._compiled = False
+        return True
+
+    def get_patterns(self):
+        ''' Return our list of patterns, as they were added '''
+        return self._patterns
+
+    def get_extract_patterns(self, depth=EXTRACT_DEPTH):
+        ''' Return the patterns in the form unsquashfs -excludes -regex takes them, pruning the same paths than matches().
+        unsquashfs matches every path component on its own, so a glob where '*' (or '?', '[...]') can stand for a '/'
+        is given once for every way it spans the components, up to depth components.
+        Raises ConfigError if a glob needs too many patterns. '''
+        patterns = []
+        for path in sorted(self._exact):
+            patterns.append("/".join([_ere_literal(name) for name in path.split("/")]))
+        for prefix in self._prefixes:
+            patterns.append("/".join([_ere_literal(name) for name in prefix.rstrip("/").split("/")] + ["^.*$"]))
+        for glob in self._globs:
+            patterns.extend(_expand_glob(glob, depth))
+        return patterns
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def matches(self, path):
+        ''' Returns True/False as to whether the relative path is blacklisted.
+        A directory that matches is not walked, so nothing below it is ever looked at. '''
+        if(not self._compiled):
+            self._compile()
+        if(path in self._exact):
+            return True
+        if(self._prefix_re is not None and self._prefix_re.match(path)):
+            return True
+        if(self._glob_re is not None and self._glob_re.match(path)):
+            return True
+        return False
+
+    def _compile(self):
+        self._prefix_re = None
+        self._glob_re = None
+        if(self._prefixes):
+            self._prefix_re = re.compile("|".join([re.escape(prefix) for prefix in self._prefixes]))
+        if(self._globs):
+            self._glob_re = re.compile("|".join(["(?:%s)" % fnmatch.translate(glob) for glob in self._globs]))
+        self._compiled = True
+
+def _ere_literal(name):
+    return "^%s$" % _ERE_SPECIAL.sub(r"\\\1", name)
+
+def _tokenize(glob):
+    # the same parsing than fnmatch.translate: (kind, text) with kind one of '/', 'char', '*', '?' and '['
+    tokens = []
+    (i, n) = (0, len(glob))
+    while(i < n):
+        c = glob[i]
+        i += 1
+        if(c == "[" and i < n):
+            j = i
+            if(j < n and glob[j] == "!"):
+                j += 1
+            if(j < n and glob[j] == "]"):
+                j += 1
+            while(j < n and glob[j] != "]"):
+                j += 1
+            if(j < n):
+                tokens.append(("[", glob[i:j]))
+                i = j + 1
+                continue
+        if(c in "/*?"):
+            tokens.append((c, c))
+        else:
+            tokens.append(("char", c))
+    return tokens
+
+def _bracket(stuff, glob):
+    # a fnmatch set as a POSIX one, the only differences are the negation and the classes ([:alpha:]...)
+    if(re.search(r"\[[:.=]", stuff)):
+        raise ConfigError("The blacklist pattern %s can't be given to unsquashfs: POSIX reads %r as a character class" % (glob, stuff))
+    if(stuff.startswith("!")):
+        return "[^%s]" % stuff[1:]
+    if(stuff == "^"):
+        return "\\^"
+    if(stuff.startswith("^")):
+        return "[%s^]" % stuff[1:] # a literal '^', as long as it isn't first
+    return "[%s]" % stuff
+
+def _can_match_slash(token):
+    if(token[0] == "?"):
+        return True
+    if(token[0] == "["):
+        return fnmatch.fnmatchcase("/", "[%s]" % token[1])
+    return token[0] == "*"
+
+def _expand_glob(glob, depth):
+    # fnmatch lets '*', '?' and '[...]' match '/'; every way of placing those extra '/' is a pattern of its own
+    tokens = _tokenize(glob)
+    budget = depth - 1 - len([token for token in tokens if token[0] == "/"])
+    choices = []
+    for (index, token) in enumerate(tokens):
+        last = (index == len(tokens) - 1)
+        if(last or not _can_match_slash(token)):
+            # a trailing '*' spanning directories only matches below a directory it matched already
+            choices.append([(0, [token])])
+        elif(token[0] == "*"):
+            choices.append([(slashes, [token] + [("/", "/"), token] * slashes) for slashes in range(max(budget, 0) + 1)])
+        elif(index == 0 or tokens[index - 1][0] == "/" or tokens[index + 1][0] == "/"):
+            choices.append([(0, [token])]) # a '/' there would be an empty component
+        else:
+            choices.append([(0, [token]), (1, [("/", "/")])])
+    expansions = [(0, [])]
+    for options in choices:
+        expanded = []
+        for (used, prefix) in expansions:
+            for (slashes, replacement) in options:
+                if(used + slashes <= budget or slashes == 0):
+                    expanded.append((used + slashes, prefix + replacement))
+        if(len(expanded) > _MAX_EXTRACT_PATTERNS):
+            raise ConfigError("The blacklist pattern %s can't be given to unsquashfs, it spans too many directories; "
+                              "use the copy backend or a narrower pattern" % glob)
+        expansions = expanded
+    patterns = []
+    for (used, expansion) in expansions:
+        components = [[]]
+        for token in expansion:
+            if(token[0] == "/"):
+                components.append([])
+            else:
+                components[-1].append(token)
+        if([] in components):
+            continue # two '/' in a row, no path has an empty component
+        patterns.append("/".join([_ere_component(component, glob) for component in components]))
+    return patterns
+
+def _ere_component(tokens, glob):
+    parts = []
+    for (kind, text) in tokens:
+        if(kind == "*"):
+            parts.append(".*")
+        elif(kind == "?"):
+            parts.append(".")
+        elif(kind == "["):
+            parts.append(_bracket(text, glob))
+        else:
+            parts.append(_ERE_SPECIAL.sub(r"\\\1", text))
+    return "^%s$" % "".join(parts)
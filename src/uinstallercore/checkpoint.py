@@ -0,0 +1,130 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import time
+import errno
+import threading
+
+from uinstallercore.syscalls import sync, syncfs
+from uinstallercore.checksums import escape_path, unescape_path
+
+__all__ = ['CopyCheckpoint']
+
+class CopyCheckpoint(object):
+    ''' A journal, kept in the target, of the regular files completely copied.
+    Lines are only appended after the filesystem of the journal (the target) is flushed with syncfs(),
+    so whatever the journal says is really on the disk.
+    When an interrupted install is run again the files in the journal whose size, mtime and mode
+    still match the source are skipped. '''
+
+    def __init__(self, filename, interval=30):
+        ''' Creates a new checkpoint journal in filename, committed every interval seconds '''
+        self._filename = filename
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._done = dict()
+        self._pending = []
+        self._last_commit = time.time()
+        self._syncfs = True
+
+    def get_filename(self):
+        ''' Return the file holding this journal '''
+        return self._filename
+
+    def load(self):
+        ''' Read the files already done by a previous run, if there was one '''
+        self._done = dict()
+        if(os.path.exists(self._filename)):
+            journalfh = open(self._filename, "r")
+            for line in journalfh:
+                if(not line.endswith("\n")):
+                    break # cut while it was being written
+                (digest, path) = line.rstrip("\n").split(" ", 1)
+                if(digest == "-"):
+                    digest = None
+                self._done[unescape_path(path)] = digest
+            journalfh.close()
+        return self
+
+    def __len__(self):
+        return len(self._done)
+
+    def is_done(self, entry, targetpath):
+        ''' Returns True/False as to whether the entry (a ManifestEntry) was copied by a previous run and still matches the source '''
+        if(entry.path not in self._done):
+            return False
+        try:
+            st = os.lstat(targetpath)
+        except OSError:
+            return False
+        return (st.st_size == entry.st_size and st.st_mode == entry.st_mode and int(st.st_mtime) == int(entry.st_mtime))
+
+    def get_digest(self, path):
+        ''' Return the digest recorded for path, None if we don't know it '''
+        return self._done.get(path)
+
+    def record(self, path, digest=None):
+        ''' Add a completely copied file to the journal (it's safe to call it from any thread) '''
+        self._lock.acquire()
+        try:
+            self._pending.append("%s %s\n" % (digest or "-", escape_path(path)))
+            due = (time.time() - self._last_commit >= self._interval)
+        finally:
+            self._lock.release()
+        if(due):
+            self.commit()
+
+    def commit(self, wait=False):
+        ''' Flush the copied data to disk and then append the pending files to the journal.
+        Unless wait is True nothing is done while another thread is committing. '''
+        if(not self._commit_lock.acquire(wait)):
+            return # somebody else is doing it
+        try:
+            self._lock.acquire()
+            try:
+                pending = self._pending
+                self._pending = []
+                self._last_commit = time.time()
+            finally:
+                self._lock.release()
+            if(not pending):
+                return
+            journalfh = open(self._filename, "a")
+            try:
+                self._flush(journalfh.fileno())
+                journalfh.writelines(pending)
+                journalfh.flush()
+                os.fsync(journalfh.fileno())
+            finally:
+                journalfh.close()
+        finally:
+            self._commit_lock.release()
+
+    def _flush(self, fd):
+        # the copied files live in the filesystem of the journal, the other ones needn't be flushed
+        if(self._syncfs):
+            try:
+                syncfs(fd)
+                return
+            except OSError, e:
+                if(e.errno not in (errno.ENOSYS, errno.EINVAL)):
+                    raise
+                self._syncfs = False # an old kernel (or libc)
+        sync()
+
+    def remove(self):
+        ''' Forget the journal, the install is complete '''
+        self._pending = []
+        self._done = dict()
+        try:
+            os.unlink(self._filename)
+        except OSError:
+            pass
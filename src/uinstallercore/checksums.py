@@ -0,0 +1,135 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import re
+import hashlib
+import threading
+
+from uinstallercore.workers import WorkerPool
+
+__all__ = ['ChecksumManifest', 'escape_path', 'unescape_path']
+
+_HEADER = "# uinstaller checksums"
+
+def escape_path(path):
+    ''' Escape backslashes and newlines so path fits in a line '''
+    return path.replace("\\", "\\\\").replace("\n", "\\n")
+
+def unescape_path(path):
+    ''' Undo escape_path() '''
+    return re.sub(r"\\(.)", lambda match: match.group(1) == "n" and "\n" or match.group(1), path)
+
+class ChecksumManifest(object):
+    ''' The digest and size of every regular file installed, computed while the files are copied.
+    It's saved into the target so the install can be verified later without the source. '''
+
+    def __init__(self, algorithm="md5"):
+        ''' Creates a new, empty, manifest using the given hashlib algorithm '''
+        hashlib.new(algorithm) # fail now if the algorithm doesn't exist
+        self._algorithm = algorithm
+        self._lock = threading.Lock()
+        self._files = dict()
+
+    def get_algorithm(self):
+        ''' Return the name of the hashlib algorithm used '''
+        return self._algorithm
+
+    def new_digest(self):
+        ''' Return a new hashlib object to be fed with the data of a file '''
+        return hashlib.new(self._algorithm)
+
+    def add(self, path, size, digest):
+        ''' Record the size and (hex) digest of the relative path '''
+        self._lock.acquire()
+        try:
+            self._files[path] = (digest, size)
+        finally:
+            self._lock.release()
+
+    def get(self, path):
+        ''' Return the (digest, size) of path, None if we don't know it '''
+        return self._files.get(path)
+
+    def get_paths(self):
+        ''' Return the sorted list of the paths we know '''
+        paths = self._files.keys()
+        paths.sort()
+        return paths
+
+    def get_total_size(self):
+        ''' Return the sum of the sizes of the files we know '''
+        return sum([size for (digest, size) in self._files.values()])
+
+    def __len__(self):
+        return len(self._files)
+
+    def save(self, filename):
+        ''' Write this manifest into filename, one "digest size path" line per file '''
+        manifestfh = open(filename, "w")
+        manifestfh.write("%s %s\n" % (_HEADER, self._algorithm))
+        for path in self.get_paths():
+            (digest, size) = self._files[path]
+            manifestfh.write("%s %d %s\n" % (digest, size, escape_path(path)))
+        manifestfh.close()
+
+    @classmethod
+    def load(cls, filename):
+        ''' Read a manifest written by save() '''
+        manifestfh = open(filename, "r")
+        try:
+            header = manifestfh.readline().rstrip("\n")
+            if(not header.startswith(_HEADER + " ")):
+                raise ValueError("%s is not a checksum manifest" % filename)
+            manifest = cls(header[len(_HEADER) + 1:])
+            for line in manifestfh:
+                (digest, size, path) = line.rstrip("\n").split(" ", 2)
+                manifest._files[unescape_path(path)] = (digest, int(size))
+        finally:
+            manifestfh.close()
+        return manifest
+
+    def verify(self, root, workers=4, progress=None, buffer_size=1024 * 1024):
+        ''' Check the files below root against this manifest with a pool of workers.
+        progress, if given, is called as progress(path, size) for every file checked.
+        Returns a list of (path, problem) for every file that does not match. '''
+        failures = []
+        pool = WorkerPool(workers)
+        try:
+            for path in self.get_paths():
+                pool.submit(self._verify_file, root, path, failures, progress, buffer_size)
+        finally:
+            pool.join()
+        failures.sort()
+        return failures
+
+    def _verify_file(self, root, path, failures, progress, buffer_size):
+        (digest, size) = self._files[path]
+        try:
+            filefh = open(os.path.join(root, path), "rb")
+        except IOError:
+            failures.append((path, "missing"))
+            return
+        try:
+            found = self.new_digest()
+            found_size = 0
+            while(True):
+                data = filefh.read(buffer_size)
+                if not data:
+                    break
+                found.update(data)
+                found_size += len(data)
+        finally:
+            filefh.close()
+        if(found_size != size):
+            failures.append((path, "size %d, expected %d" % (found_size, size)))
+        elif(found.hexdigest() != digest):
+            failures.append((path, "%s mismatch" % self._algorithm))
+        if(progress is not None):
+            progress(path, size)
@@ -0,0 +1,137 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import time
+import random
+import threading
+import subprocess
+from subprocess import Popen
+
+__all__ = ['ChrootSession', 'ChrootResult', 'ChrootError']
+
+class ChrootError(Exception):
+    ''' Raised when the shell of a chroot session is gone '''
+    pass
+
+class ChrootResult(object):
+    ''' The outcome of a command run in a chroot session '''
+
+    def __init__(self, command, returncode, output, elapsed):
+        ''' Creates a new result; elapsed is the wall time in seconds, None if unknown '''
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+        self.elapsed = elapsed
+
+class ChrootSession(object):
+    ''' A single long-lived shell inside a chroot, fed with commands through a pipe.
+    Every command runs in its own subshell (so it can't change the environment of the next ones),
+    with no stdin, and its output and exit code are sent back separately. '''
+
+    def __init__(self, root="/target/", shell="/bin/sh"):
+        ''' Creates a new (not started) session in root '''
+        self._root = root
+        self._shell = shell
+        self._process = None
+        self._lock = threading.Lock()
+        self._marker = "__UINSTALLER_%08x__" % random.getrandbits(32)
+
+    def start(self):
+        ''' Start the shell inside the chroot '''
+        self._process = Popen(["chroot", self._root, self._shell], stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+        return self
+
+    def is_running(self):
+        ''' Returns True/False as to whether the shell is alive '''
+        return self._process is not None and self._process.poll() is None
+
+    def run(self, command, output=None):
+        ''' Run command in the chroot and return its ChrootResult.
+        output, if given, is called with every line of output as soon as it arrives. '''
+        self._lock.acquire()
+        try:
+            start = time.time()
+            self._send("( %s\n) </dev/null 2>&1\nprintf '\\n%s %%d\\n' $?\n" % (command, self._marker))
+            (returncode, text, times) = self._receive(output)
+            return ChrootResult(command, returncode, text, time.time() - start)
+        finally:
+            self._lock.release()
+
+    def run_batch(self, commands):
+        ''' Run independent commands at the same time, returns their ChrootResult list in the same order.
+        The wall time of every command is measured inside the chroot (from /proc/uptime). '''
+        self._lock.acquire()
+        try:
+            script = ["_ub=$(mktemp -d)"]
+            for (i, command) in enumerate(commands):
+                script.append("( read _s _r </proc/uptime; ( %s\n) >$_ub/%d.out 2>&1 </dev/null; _rc=$?; read _e _r </proc/uptime; echo $_rc $_s $_e >$_ub/%d.rc ) &" % (command, i, i))
+            script.append("wait")
+            for i in range(len(commands)):
+                script.append("cat $_ub/%d.out; read _rc _s _e <$_ub/%d.rc; printf '\\n%s %%s %%s %%s\\n' $_rc $_s $_e" % (i, i, self._marker))
+            script.append("rm -rf $_ub\n")
+            self._send("\n".join(script))
+            results = []
+            for command in commands:
+                (returncode, output, times) = self._receive()
+                elapsed = None
+                if(len(times) == 2):
+                    elapsed = float(times[1]) - float(times[0])
+                results.append(ChrootResult(command, returncode, output, elapsed))
+            return results
+        finally:
+            self._lock.release()
+
+    def close(self):
+        ''' Leave the chroot, returns the exit code of the shell '''
+        if(self._process is None):
+            return None
+        try:
+            self._process.stdin.close()
+        except IOError:
+            pass
+        returncode = self._process.wait()
+        self._process.stdout.close()
+        self._process = None
+        return returncode
+
+    def _send(self, script):
+        if(not self.is_running()):
+            raise ChrootError("The chroot shell in %s is not running" % self._root)
+        try:
+            self._process.stdin.write(script)
+            self._process.stdin.flush()
+        except IOError, e:
+            raise ChrootError("The chroot shell in %s went away (%s)" % (self._root, e))
+
+    def _receive(self, callback=None):
+        lines = []
+        prefix = self._marker + " "
+        held = False
+        while(True):
+            line = self._process.stdout.readline()
+            if not line:
+                raise ChrootError("The chroot shell in %s went away" % self._root)
+            if(line.startswith(prefix)):
+                fields = line.split()
+                # drop the newline we print before the marker
+                output = "".join(lines)[:-1]
+                try:
+                    returncode = int(fields[1])
+                except (IndexError, ValueError):
+                    returncode = None
+                return (returncode, output, fields[2:])
+            if(callback is not None):
+                # an empty line may be the one we print before the marker, wait for the next one
+                if(held):
+                    callback("\n")
+                held = (line == "\n")
+                if(not held):
+                    callback(line)
+            lines.append(line)
@@ -0,0 +1,207 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import marshal
+
+__all__ = ['InstallerConfig', 'ConfigError', 'SCHEMA', 'CHOICES', 'CACHE_FILE']
+
+# where the parsed configuration is kept between runs, UINSTALLER_CONFIG_CACHE overrides it
+CACHE_FILE = os.environ.get("UINSTALLER_CONFIG_CACHE", "/tmp/uinstaller-config.cache")
+
+# bumped whenever SCHEMA or the snapshot layout changes, so old snapshots are thrown away
+_CACHE_VERSION = 2
+
+# a required key has no default
+REQUIRED = object()
+
+# section -> key -> (type, default); the keys not listed here are kept as they are written
+SCHEMA = {
+    'distribution': {
+        'DISTRIBUTION_NAME': (str, REQUIRED),
+        'DISTRIBUTION_VERSION': (str, REQUIRED),
+    },
+    'install': {
+        'LIVE_USER_NAME': (str, REQUIRED),
+        'LIVE_MEDIA_SOURCE': (str, REQUIRED),
+        'LIVE_MEDIA_TYPE': (str, REQUIRED),
+        'BLACKLIST': (list, []),
+        'COPY_WORKERS': (int, 4),
+        'COPY_ORDER': (str, 'walk'),
+        'COPY_BACKEND': (str, 'copy'),
+        'COPY_METHODS': (list, None),
+        'COPY_BUFFER_SIZE': (int, 1024 * 1024),
+        'FD_RELATIVE_COPY': (bool, True),
+        'SPARSE_THRESHOLD': (int, 16 * 1024 * 1024),
+        'LOW_MEMORY_COPY': (bool, False),
+        'WRITEBACK_BATCH': (int, 32 * 1024 * 1024),
+        'PROGRESS_FREQUENCY': (float, 10.0),
+        'CHECKSUM_ALGORITHM': (str, None),
+        'CHECKSUMS_FILE': (str, 'var/log/uinstaller.checksums'),
+        'RESUME_COPY': (bool, False),
+        'CHECKPOINT_FILE': (str, '.uinstaller-copy.journal'),
+        'CHECKPOINT_INTERVAL': (int, 30),
+        'EXTRACT_PROCESSORS': (int, None),
+        'GRUB_THEME_PATTERN': (str, 'linuxmint.png'),
+        'GRUB_ENTRY_PATTERN': (str, 'Mint'),
+        'GRUB_ATTEMPTS': (int, 5),
+        'GRUB_RETRY_DELAY': (float, 1.0),
+        'STAGE_WORKERS': (int, 4),
+        'TRACE_FILE': (str, None),
+    },
+}
+
+# (section, key) -> the values allowed for it
+CHOICES = {
+    ('install', 'COPY_ORDER'): ('walk', 'physical'),
+    ('install', 'COPY_BACKEND'): ('copy', 'unsquashfs'),
+}
+
+class ConfigError(ValueError):
+    ''' Raised when the configuration file can't be parsed, misses a required key or has a wrong value '''
+    pass
+
+class InstallerConfig(object):
+    ''' The validated contents of uinstaller.conf.
+    The file is only parsed (with ConfigObj) when it changed since the last time: the checked values are
+    kept in a snapshot (see CACHE_FILE) that is used as long as the size and mtime of the file match. '''
+
+    def __init__(self, filename, values):
+        ''' Creates a new configuration from the values (section -> key -> value) read from filename '''
+        self._filename = filename
+        self._values = values
+
+    @classmethod
+    def load(cls, filename, cache=CACHE_FILE):
+        ''' Return the configuration of filename, from the snapshot in cache if it's still good (None to not use any).
+        Raises ConfigError if the file isn't valid. '''
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        key = (_CACHE_VERSION, path, st.st_size, st.st_mtime)
+        if(cache is not None):
+            values = _read_snapshot(cache, key)
+            if(values is not None):
+                return cls(path, values)
+        values = cls.validate(cls.parse(path))
+        if(cache is not None):
+            _write_snapshot(cache, key, values)
+        return cls(path, values)
+
+    @staticmethod
+    def parse(filename):
+        ''' Return the raw sections (dicts of strings and lists) of the configuration file '''
+        # only needed when the snapshot is stale, it's a big import to read from a live CD
+        from configobj import ConfigObj, ConfigObjError
+        try:
+            configuration = ConfigObj(filename)
+        except ConfigObjError, e:
+            raise ConfigError("%s is not a valid configuration file: %s" % (filename, e))
+        return dict([(name, _plain(section)) for (name, section) in configuration.items() if isinstance(section, dict)])
+
+    @staticmethod
+    def validate(sections):
+        ''' Check the raw sections against SCHEMA and CHOICES, returns them with typed values and the defaults filled in '''
+        values = dict()
+        for (name, section) in sections.items():
+            values[name] = dict(section)
+        for (name, keys) in SCHEMA.items():
+            section = values.setdefault(name, dict())
+            for (key, (kind, default)) in keys.items():
+                if(key not in section or section[key] in ("", None)):
+                    if(default is REQUIRED):
+                        raise ConfigError("%s is missing from the [%s] section" % (key, name))
+                    section[key] = default
+                    continue
+                try:
+                    section[key] = _convert(section[key], kind)
+                except ValueError:
+                    raise ConfigError("%s in the [%s] section should be a %s, not %r" % (key, name, kind.__name__, section[key]))
+        for ((name, key), choices) in CHOICES.items():
+            if(values[name][key] not in choices):
+                raise ConfigError("%s in the [%s] section should be one of %s, not %r" % (key, name, ", ".join(choices), values[name][key]))
+        return values
+
+    def get_filename(self):
+        ''' Return the configuration file these values come from '''
+        return self._filename
+
+    def get_section(self, section):
+        ''' Return the values of a section, as a dict '''
+        return self._values.get(section, dict())
+
+    def get(self, section, key, default=None):
+        ''' Return the value of key in section, default if it has none '''
+        return self.get_section(section).get(key, default)
+
+def _plain(section):
+    # ConfigObj sections (and their subsections) as dicts, marshal only knows the builtin types
+    values = dict()
+    for (key, value) in section.items():
+        if(isinstance(value, dict)):
+            value = _plain(value)
+        elif(isinstance(value, list)):
+            value = list(value)
+        values[key] = value
+    return values
+
+def _convert(value, kind):
+    if(kind is list):
+        if(isinstance(value, basestring)):
+            return [value]
+        return list(value)
+    if(isinstance(value, list)):
+        raise ValueError(value)
+    if(kind is bool):
+        if(isinstance(value, bool)):
+            return value
+        if(value.lower() in ('1', 'true', 'yes', 'on')):
+            return True
+        if(value.lower() in ('0', 'false', 'no', 'off')):
+            return False
+        raise ValueError(value)
+    return kind(value)
+
+def _read_snapshot(cache, key):
+    try:
+        cachefh = open(cache, "rb")
+    except IOError:
+        return None
+    try:
+        # anybody can write in /tmp, only trust our own snapshots
+        if(os.fstat(cachefh.fileno()).st_uid != os.getuid()):
+            return None
+        (snapshot_key, values) = marshal.load(cachefh)
+    except (EOFError, ValueError, TypeError):
+        return None
+    finally:
+        cachefh.close()
+    if(snapshot_key != key):
+        return None
+    return values
+
+def _write_snapshot(cache, key, values):
+    # a fresh file (O_EXCL, mode 0600) next to the cache, nobody can have planted a symlink in its place
+    import tempfile
+    try:
+        (fd, temporary) = tempfile.mkstemp(prefix=os.path.basename(cache) + ".", dir=os.path.dirname(cache) or ".")
+    except (IOError, OSError):
+        return # i.e. a read-only /tmp, we'll just parse the file again next time
+    try:
+        cachefh = os.fdopen(fd, "wb")
+        try:
+            marshal.dump((key, values), cachefh)
+        finally:
+            cachefh.close()
+        os.rename(temporary, cache)
+    except (IOError, OSError, ValueError):
+        # ValueError is marshal not knowing a value, the configuration is still good
+        try:
+            os.unlink(temporary)
+        except OSError:
+            pass
@@ -0,0 +1,523 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import stat
+import errno
+import threading
+
+from uinstallercore.workers import WorkerPool
+from uinstallercore.manifest import SourceManifest
+from uinstallercore.syscalls import openat, mkdirat, mknodat, symlinkat, readlinkat, unlinkat, fchownat, fchmodat, \
+    utimensat, futimens, supports_dir_fd, AT_SYMLINK_NOFOLLOW, O_DIRECTORY, O_NOFOLLOW
+
+__all__ = ['CopyEngine', 'FdCopyEngine', 'FanoutCopyEngine']
+
+class CopyEngine(object):
+    ''' Copies a whole filesystem tree (i.e. the live system) onto the target.
+    Directories are created by the walking thread before any of their children, the regular files
+    (data and meta-information) are copied by a pool of workers and the directory timestamps are
+    deferred until everything inside them has been written. The other links of an inode are made
+    hard links to its first copy once every file has been copied. '''
+
+    def __init__(self, copy_file, workers=4, progress=None, checksums=None, checkpoint=None):
+        ''' Creates a new copy engine;
+        * copy_file is the function used to copy the data of a regular file, copy_file(source, dest, digest=None).
+        * workers is the number of threads copying regular files.
+        * progress, if given, is called as progress(entry) every time an entry of the manifest is copied, maybe from a worker.
+        * checksums, if given, is a ChecksumManifest getting the digest of every regular file copied.
+        * checkpoint, if given, is a CopyCheckpoint recording the regular files copied; the ones it has from a previous run are skipped. '''
+        self._copy_file = copy_file
+        self._workers = workers
+        self._progress = progress
+        self._checksums = checksums
+        self._checkpoint = checkpoint
+        self._manifest = None
+        self._dest = None
+
+    def copy_tree(self, source, dest, manifest=None):
+        ''' Copy everything below source into dest, returns the number of copied entries.
+        The SourceManifest of source is built here unless it is given. '''
+        if(manifest is None):
+            manifest = SourceManifest(source).scan()
+        self._manifest = manifest
+        self._dest = dest
+        count = 0
+        links = []
+        pool = WorkerPool(self._workers)
+        try:
+            for entry in manifest:
+                count += 1
+                if(entry.link is not None):
+                    links.append(entry)
+                    continue
+                sourcepath = os.path.join(source, entry.path)
+                targetpath = os.path.join(dest, entry.path)
+                if stat.S_ISREG(entry.st_mode):
+                    pool.submit(self._copy_and_report, sourcepath, targetpath, entry)
+                else:
+                    self._copy_and_report(sourcepath, targetpath, entry)
+            pool.join()
+            self._link_entries(source, links)
+        finally:
+            try:
+                pool.join()
+            finally:
+                if(self._checkpoint is not None):
+                    self._checkpoint.commit(wait=True)
+        return count
+
+    def _link_entries(self, source, entries):
+        for entry in entries:
+            targetpath = os.path.join(self._dest, entry.path)
+            try:
+                os.unlink(targetpath)
+            except OSError, e:
+                if(e.errno != errno.ENOENT):
+                    raise
+            try:
+                os.link(os.path.join(self._dest, entry.link), targetpath)
+            except OSError, e:
+                if(e.errno != errno.EXDEV):
+                    raise
+                # the two names end up in different filesystems of the target, it gets its own copy
+                self._copy_single(source, entry)
+                continue
+            if(self._checksums is not None):
+                known = self._checksums.get(entry.link)
+                if(known is not None):
+                    self._checksums.add(entry.path, known[1], known[0])
+            if(self._progress is not None):
+                self._progress(entry)
+
+    def _copy_single(self, source, entry):
+        self._copy_and_report(os.path.join(source, entry.path), os.path.join(self._dest, entry.path), entry)
+
+    def _copy_and_report(self, sourcepath, targetpath, entry):
+        if(self._checkpoint is None or not stat.S_ISREG(entry.st_mode)):
+            self.copy_entry(sourcepath, targetpath, entry, entry.path)
+        elif(not self._resume_entry(targetpath, entry)):
+            digest = self.copy_entry(sourcepath, targetpath, entry, entry.path)
+            self._checkpoint.record(entry.path, digest)
+        if(self._progress is not None):
+            self._progress(entry)
+
+    def _resume_entry(self, targetpath, entry):
+        # True when a previous run already copied this file
+        if(not self._checkpoint.is_done(entry, targetpath)):
+            return False
+        if(self._checksums is not None):
+            digest = self._checkpoint.get_digest(entry.path)
+            if(digest is None):
+                return False # copied without checksums, we need it again
+            self._checksums.add(entry.path, entry.st_size, digest)
+        return True
+
+    def copy_entry(self, sourcepath, targetpath, st, rpath=None):
+        ''' Copy a single entry (whatever its type) and apply its owner, mode and times; st is its lstat() or ManifestEntry.
+        Returns the digest of regular files when we have checksums, None otherwise. '''
+        mode = stat.S_IMODE(st.st_mode)
+        hexdigest = None
+        if os.path.exists(targetpath):
+            if not os.path.isdir(targetpath):
+                os.remove(targetpath)
+
+        if stat.S_ISLNK(st.st_mode):
+            if os.path.lexists(targetpath):
+                os.unlink(targetpath)
+            linkto = os.readlink(sourcepath)
+            os.symlink(linkto, targetpath)
+        elif stat.S_ISDIR(st.st_mode):
+            if not os.path.isdir(targetpath):
+                os.mkdir(targetpath, mode)
+        elif stat.S_ISCHR(st.st_mode):
+            os.mknod(targetpath, stat.S_IFCHR | mode, st.st_rdev)
+        elif stat.S_ISBLK(st.st_mode):
+            os.mknod(targetpath, stat.S_IFBLK | mode, st.st_rdev)
+        elif stat.S_ISFIFO(st.st_mode):
+            os.mknod(targetpath, stat.S_IFIFO | mode)
+        elif stat.S_ISSOCK(st.st_mode):
+            os.mknod(targetpath, stat.S_IFSOCK | mode)
+        elif stat.S_ISREG(st.st_mode):
+            try:
+                os.unlink(targetpath)
+            except:
+                pass
+            if(self._checksums is not None and rpath is not None):
+                digest = self._checksums.new_digest()
+                size = self._copy_file(sourcepath, targetpath, digest)
+                hexdigest = digest.hexdigest()
+                self._checksums.add(rpath, size, hexdigest)
+            else:
+                self._copy_file(sourcepath, targetpath)
+        os.lchown(targetpath, st.st_uid, st.st_gid)
+        if not stat.S_ISLNK(st.st_mode):
+            os.chmod(targetpath, mode)
+        # os.utime() sets timestamp of target, not link, directories are done at the end
+        if not stat.S_ISLNK(st.st_mode) and not stat.S_ISDIR(st.st_mode):
+            os.utime(targetpath, (st.st_atime, st.st_mtime))
+        return hexdigest
+
+    def restore_directory_times(self, progress=None):
+        ''' Apply timestamps to all directories now that the items within them have been copied '''
+        for entry in self._manifest.get_directories():
+            directory = os.path.join(self._dest, entry.path)
+            try:
+                if(progress is not None):
+                    progress(directory)
+                os.utime(directory, (entry.st_atime, entry.st_mtime))
+            except OSError:
+                pass
+
+class _DirectoryHandle(object):
+    # the open descriptors of a directory in the source and in the target,
+    # closed when the last one using them (the walker or a worker) releases them, then released(handle) is called
+
+    def __init__(self, src_fd, dst_fd, released=None):
+        self.src_fd = src_fd
+        self.dst_fd = dst_fd
+        self._users = 1
+        self._lock = threading.Lock()
+        self._released = released
+
+    def acquire(self):
+        self._lock.acquire()
+        try:
+            self._users += 1
+        finally:
+            self._lock.release()
+        return self
+
+    def release(self):
+        self._lock.acquire()
+        try:
+            self._users -= 1
+            if(self._users == 0):
+                self.close()
+                if(self._released is not None):
+                    self._released(self)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        if(self.src_fd is not None):
+            os.close(self.src_fd)
+            os.close(self.dst_fd)
+            self.src_fd = None
+            self.dst_fd = None
+
+class FdCopyEngine(CopyEngine):
+    ''' A CopyEngine working relative to open descriptors of the source and target directories: entries are
+    created and read with the *at system calls and regular files get their owner, mode and times through
+    their open descriptor, so the kernel resolves every directory once instead of the whole path of every entry
+    several times. The copied tree is the same than the one of CopyEngine. '''
+
+    def __init__(self, copy_fd, workers=4, progress=None, checksums=None, checkpoint=None):
+        ''' Creates a new copy engine;
+        * copy_fd is the function used to copy the data between two open files, copy_fd(src_fd, dst_fd, digest=None).
+        * the other arguments are the ones of CopyEngine. '''
+        CopyEngine.__init__(self, None, workers, progress, checksums, checkpoint)
+        self._copy_fd = copy_fd
+        self._handles = set()
+        self._handles_lock = threading.Lock()
+
+    def is_supported():
+        ''' Returns True/False as to whether the system calls this engine needs are available '''
+        return supports_dir_fd()
+    is_supported = staticmethod(is_supported)
+
+    def copy_tree(self, source, dest, manifest=None):
+        ''' Copy everything below source into dest, returns the number of copied entries.
+        The SourceManifest of source is built here unless it is given. '''
+        if(manifest is None):
+            manifest = SourceManifest(source).scan()
+        self._manifest = manifest
+        self._dest = dest
+        count = 0
+        links = []
+        root = None
+        handle = None
+        current = None
+        pool = WorkerPool(self._workers)
+        try:
+            root = self._open_handle(source, dest)
+            for entry in manifest:
+                count += 1
+                if(entry.link is not None):
+                    links.append(entry)
+                    continue
+                (dirpath, name) = os.path.split(entry.path)
+                if(dirpath != current):
+                    # the manifest keeps the entries of a directory together, we are done with the previous one
+                    if(handle is not None):
+                        handle.release()
+                        handle = None
+                    if(dirpath):
+                        handle = self._open_handle(dirpath, dirpath, root)
+                    else:
+                        handle = root.acquire()
+                    current = dirpath
+                if stat.S_ISREG(entry.st_mode):
+                    pool.submit(self._copy_and_report_at, handle.acquire(), name, entry)
+                else:
+                    self._copy_and_report_at(handle.acquire(), name, entry)
+            pool.join()
+            self._link_entries(source, links)
+        finally:
+            if(handle is not None):
+                handle.release()
+            if(root is not None):
+                root.release()
+            try:
+                pool.join()
+            finally:
+                # the jobs a failure left in the queue never released their directories
+                self._close_handles()
+                if(self._checkpoint is not None):
+                    self._checkpoint.commit(wait=True)
+        return count
+
+    def _open_handle(self, source, dest, root=None):
+        # source and dest are relative to the directories of root, if given
+        flags = os.O_RDONLY | O_DIRECTORY | O_NOFOLLOW
+        if(root is None):
+            src_fd = os.open(source, flags)
+        else:
+            src_fd = openat(root.src_fd, source, flags)
+        try:
+            if(root is None):
+                dst_fd = os.open(dest, flags)
+            else:
+                dst_fd = openat(root.dst_fd, dest, flags)
+        except:
+            os.close(src_fd)
+            raise
+        handle = _DirectoryHandle(src_fd, dst_fd, self._forget_handle)
+        self._handles_lock.acquire()
+        try:
+            self._handles.add(handle)
+        finally:
+            self._handles_lock.release()
+        return handle
+
+    def _copy_single(self, source, entry):
+        (dirpath, name) = os.path.split(entry.path)
+        handle = self._open_handle(os.path.join(source, dirpath), os.path.join(self._dest, dirpath))
+        self._copy_and_report_at(handle, name, entry)
+
+    def _forget_handle(self, handle):
+        self._handles_lock.acquire()
+        try:
+            self._handles.discard(handle)
+        finally:
+            self._handles_lock.release()
+
+    def _close_handles(self):
+        self._handles_lock.acquire()
+        try:
+            for handle in self._handles:
+                handle.close()
+            self._handles = set()
+        finally:
+            self._handles_lock.release()
+
+    def _copy_and_report_at(self, handle, name, entry):
+        try:
+            if(self._checkpoint is None or not stat.S_ISREG(entry.st_mode)):
+                self.copy_entry_at(handle.src_fd, handle.dst_fd, name, entry, entry.path)
+            elif(not self._resume_entry(os.path.join(self._dest, entry.path), entry)):
+                digest = self.copy_entry_at(handle.src_fd, handle.dst_fd, name, entry, entry.path)
+                self._checkpoint.record(entry.path, digest)
+        finally:
+            handle.release()
+        if(self._progress is not None):
+            self._progress(entry)
+
+    def copy_entry_at(self, src_dir, dst_dir, name, st, rpath=None):
+        ''' Copy the entry name of the source directory src_dir (a descriptor) into the target directory dst_dir, as copy_entry() does.
+        Returns the digest of regular files when we have checksums, None otherwise. '''
+        mode = stat.S_IMODE(st.st_mode)
+        times = (st.st_atime, st.st_mtime)
+        if stat.S_ISDIR(st.st_mode):
+            try:
+                mkdirat(dst_dir, name, mode)
+            except OSError, e:
+                if(e.errno != errno.EEXIST):
+                    raise
+                # whatever is in the way is replaced, unless it's a directory (or a link to one)
+                if(not self._is_directory_at(dst_dir, name)):
+                    unlinkat(dst_dir, name)
+                    mkdirat(dst_dir, name, mode)
+            fchownat(dst_dir, name, st.st_uid, st.st_gid, AT_SYMLINK_NOFOLLOW)
+            fchmodat(dst_dir, name, mode)
+            # directory times are done at the end
+            return None
+
+        try:
+            unlinkat(dst_dir, name)
+        except OSError, e:
+            if(e.errno != errno.ENOENT):
+                raise
+
+        if stat.S_ISLNK(st.st_mode):
+            symlinkat(readlinkat(src_dir, name), dst_dir, name)
+            fchownat(dst_dir, name, st.st_uid, st.st_gid, AT_SYMLINK_NOFOLLOW)
+            return None
+        if stat.S_ISREG(st.st_mode):
+            return self._copy_regular_at(src_dir, dst_dir, name, st, mode, times, rpath)
+        node = stat.S_IFMT(st.st_mode) | mode
+        try:
+            mknodat(dst_dir, name, node, st.st_rdev)
+        except OSError, e:
+            if(e.errno != errno.ENOSYS or rpath is None):
+                raise
+            os.mknod(os.path.join(self._dest, rpath), node, st.st_rdev)
+        fchownat(dst_dir, name, st.st_uid, st.st_gid, AT_SYMLINK_NOFOLLOW)
+        fchmodat(dst_dir, name, mode)
+        utimensat(dst_dir, name, times, AT_SYMLINK_NOFOLLOW)
+        return None
+
+    def _copy_regular_at(self, src_dir, dst_dir, name, st, mode, times, rpath):
+        hexdigest = None
+        src = openat(src_dir, name, os.O_RDONLY | O_NOFOLLOW)
+        try:
+            dst = openat(dst_dir, name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_NOFOLLOW, 0666)
+            try:
+                if(self._checksums is not None and rpath is not None):
+                    digest = self._checksums.new_digest()
+                    size = self._copy_fd(src, dst, digest)
+                    hexdigest = digest.hexdigest()
+                    self._checksums.add(rpath, size, hexdigest)
+                else:
+                    self._copy_fd(src, dst)
+                os.fchown(dst, st.st_uid, st.st_gid)
+                os.fchmod(dst, mode)
+                futimens(dst, times)
+            finally:
+                os.close(dst)
+        finally:
+            os.close(src)
+        return hexdigest
+
+    def _is_directory_at(self, dir_fd, name):
+        try:
+            fd = openat(dir_fd, name, os.O_RDONLY | O_DIRECTORY)
+        except OSError:
+            return False
+        os.close(fd)
+        return True
+
+class FanoutCopyEngine(CopyEngine):
+    ''' A CopyEngine copying one tree into several targets at once (i.e. the same live system onto several disks).
+    The source is walked once and every regular file is read once, its data being written to all the targets;
+    there's no checkpoint, the targets of a fan-out copy are always copied from scratch. '''
+
+    def __init__(self, copy_fanout, workers=4, progress=None, checksums=None):
+        ''' Creates a new copy engine;
+        * copy_fanout is the function used to copy the data of a regular file to several files, copy_fanout(source, dests, digest=None).
+        * progress is called once per entry, when it's done in every target.
+        * the other arguments are the ones of CopyEngine. '''
+        CopyEngine.__init__(self, None, workers, progress, checksums, None)
+        self._copy_fanout = copy_fanout
+        self._dests = []
+
+    def copy_tree(self, source, dests, manifest=None):
+        ''' Copy everything below source into every directory of dests, returns the number of copied entries.
+        The SourceManifest of source is built here unless it is given. '''
+        if(manifest is None):
+            manifest = SourceManifest(source).scan()
+        self._manifest = manifest
+        self._dests = list(dests)
+        count = 0
+        links = []
+        pool = WorkerPool(self._workers)
+        try:
+            for entry in manifest:
+                count += 1
+                if(entry.link is not None):
+                    links.append(entry)
+                    continue
+                sourcepath = os.path.join(source, entry.path)
+                targetpaths = [os.path.join(dest, entry.path) for dest in self._dests]
+                if stat.S_ISREG(entry.st_mode):
+                    pool.submit(self._fanout_and_report, sourcepath, targetpaths, entry)
+                else:
+                    for targetpath in targetpaths:
+                        self.copy_entry(sourcepath, targetpath, entry)
+                    if(self._progress is not None):
+                        self._progress(entry)
+            pool.join()
+            self._link_entries(source, links)
+        finally:
+            pool.join()
+        return count
+
+    def _link_entries(self, source, entries):
+        for entry in entries:
+            for dest in self._dests:
+                targetpath = os.path.join(dest, entry.path)
+                try:
+                    os.unlink(targetpath)
+                except OSError, e:
+                    if(e.errno != errno.ENOENT):
+                        raise
+                try:
+                    os.link(os.path.join(dest, entry.link), targetpath)
+                except OSError, e:
+                    if(e.errno != errno.EXDEV):
+                        raise
+                    # the two names end up in different filesystems of this target, it gets its own copy
+                    self.copy_regular(os.path.join(source, entry.path), [targetpath], entry, None)
+            if(self._checksums is not None):
+                known = self._checksums.get(entry.link)
+                if(known is not None):
+                    self._checksums.add(entry.path, known[1], known[0])
+            if(self._progress is not None):
+                self._progress(entry)
+
+    def _fanout_and_report(self, sourcepath, targetpaths, entry):
+        self.copy_regular(sourcepath, targetpaths, entry, entry.path)
+        if(self._progress is not None):
+            self._progress(entry)
+
+    def copy_regular(self, sourcepath, targetpaths, st, rpath=None):
+        ''' Copy a regular file into every path of targetpaths and apply its owner, mode and times; st is its lstat() or ManifestEntry.
+        Returns its digest when we have checksums, None otherwise. '''
+        mode = stat.S_IMODE(st.st_mode)
+        hexdigest = None
+        for targetpath in targetpaths:
+            try:
+                os.unlink(targetpath)
+            except OSError, e:
+                if(e.errno != errno.ENOENT):
+                    raise
+        if(self._checksums is not None and rpath is not None):
+            digest = self._checksums.new_digest()
+            size = self._copy_fanout(sourcepath, targetpaths, digest)
+            hexdigest = digest.hexdigest()
+            self._checksums.add(rpath, size, hexdigest)
+        else:
+            self._copy_fanout(sourcepath, targetpaths)
+        for targetpath in targetpaths:
+            os.lchown(targetpath, st.st_uid, st.st_gid)
+            os.chmod(targetpath, mode)
+            os.utime(targetpath, (st.st_atime, st.st_mtime))
+        return hexdigest
+
+    def restore_directory_times(self, progress=None):
+        ''' Apply timestamps to all directories of every target now that the items within them have been copied '''
+        for entry in self._manifest.get_directories():
+            for dest in self._dests:
+                directory = os.path.join(dest, entry.path)
+                try:
+                    if(progress is not None):
+                        progress(directory)
+                    os.utime(directory, (entry.st_atime, entry.st_mtime))
+                except OSError:
+                    pass
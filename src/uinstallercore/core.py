@@ -8,17 +8,23 @@
 #
 
 import os
-import subprocess
-from subprocess import Popen
 import time
-import shutil
-import gettext
 import stat
-import commands
 import sys
-from configobj import ConfigObj
+import threading
+import re
 
-__all__ = ['SystemUser', 'HostMachine', 'FSTab', 'FSTabEntry', 'UInstallerEngine']
+from uinstallercore.config import InstallerConfig, CACHE_FILE
+from uinstallercore.blacklist import Blacklist
+from uinstallercore.progress import ProgressReporter
+# the rest (the copy, chroot and mount machinery, tracing, subprocess...) is imported where it's used,
+# so a frontend can create the engine and ask its questions without paying for the install
+
+__all__ = ['SystemUser', 'HostMachine', 'FSTab', 'FSTabEntry', 'InstallTarget', 'UInstallerEngine', 'InstallCancelled']
+
+# the names of the file types counted by the tracer
+_FILE_TYPES = {stat.S_IFREG: "regular", stat.S_IFDIR: "directory", stat.S_IFLNK: "symlink",
+               stat.S_IFCHR: "device", stat.S_IFBLK: "device", stat.S_IFIFO: "fifo", stat.S_IFSOCK: "socket"}
 
 class SystemUser:
     ''' Represents the main user, it has a username property, a realname property and a property called password'''
@@ -30,58 +36,68 @@ class SystemUser:
         self.password = password
 
 class HostMachine:
-    ''' Used to probe information about the host '''
+    ''' Used to probe information about the host, it is probed once (see HostProbe) '''
+
+    def __init__(self, sysfs="/sys", profile=None):
+        ''' Creates a new HostMachine reading the sysfs mounted on sysfs, or using profile (a HostProfile) if given '''
+        from uinstallercore.hostprobe import HostProbe
+        self._probe = HostProbe(sysfs)
+        if(profile is not None):
+            self._probe.set_profile(profile)
+
+    def get_profile(self):
+        ''' Return the HostProfile of the host, to save it or send it somewhere '''
+        return self._probe.get_profile()
 
     def is_laptop(self):
         ''' Returns True/False as to whether the host is a laptop '''
-        ret = False
-        try:
-            p = Popen("laptop-detect", shell=True)
-            if(p.wait() == 0 ): # we want the return code
-                ret = True # its a laptop
-        except:
-            pass # doesn't matter, laptop-detect doesnt exist on the host
-        return ret
+        return self._probe.get_profile().laptop
 
     def get_model(self):
         ''' return the model of the pc '''
-        ret = None
-        try:
-            model = commands.getoutput("dmidecode --string system-product-name")
-            ret = model.rstrip("\r\n").lstrip()
-        except:
-            pass # doesn't matter.
-        return ret
+        return self._probe.get_profile().model
 
     def get_manufacturer(self):
         ''' return the system manufacturer '''
-        ret = None
-        try:
-            manu = commands.getoutput("dmidecode --string system-manufacturer")
-            ret = manu.rstrip("\r\n ").lstrip()
-        except:
-            pass # doesn't matter
-        return ret
+        return self._probe.get_profile().manufacturer
 
 class FSTab(object):
     ''' This represents the filesystem table (/etc/fstab) '''
     def __init__(self):
         ''' This creates a new filesystem table. '''
         self._mapping = dict()
+        self._mounts = dict()
+        self._devices = []
 
     def add_mount(self, device=None, mountpoint=None, filesystem=None, options=None, format=False):
         ''' This adds a new entry to this fstab, with the device name, mountpoint, filesystem, options and if we want to format the device. '''
         if(not self._mapping.has_key(device)):
-            self._mapping[device] = FSTabEntry(device, mountpoint, filesystem, options, format)
+            entry = FSTabEntry(device, mountpoint, filesystem, options, format)
+            self._mapping[device] = entry
+            self._devices.append(device)
+            if(not self._mounts.has_key(mountpoint)):
+                self._mounts[mountpoint] = entry
 
     def remove_mount(self, device):
         ''' This removes a entry in this fstb. '''
         if(self._mapping.has_key(device)):
-            del self._mapping[device]
+            entry = self._mapping.pop(device)
+            self._devices.remove(device)
+            if(self._mounts.get(entry.mountpoint) is entry):
+                del self._mounts[entry.mountpoint]
+                # another device may use the same mountpoint
+                for other in self.get_entries():
+                    if(other.mountpoint == entry.mountpoint):
+                        self._mounts[other.mountpoint] = other
+                        break
 
     def get_entries(self):
-        ''' Return our list of entries '''
-        return self._mapping.values()
+        ''' Return our list of entries, in the order they were added '''
+        return [self._mapping[device] for device in self._devices]
+
+    def get_entry(self, mountpoint):
+        ''' Return the entry mounted on mountpoint, None if there is none '''
+        return self._mounts.get(mountpoint)
 
     def has_device(self, device):
         ''' Returns True/False as to whether the device exists in this fstab. '''
@@ -89,10 +105,60 @@ class FSTab(object):
 
     def has_mount(self, mountpoint):
         ''' Returns True/False as to whether the mountpoint exists in this fstab. '''
+        return self._mounts.has_key(mountpoint)
+
+    def get_mount_plan(self, root="/target"):
+        ''' Return the MountPlan mounting the entries of this fstab below root '''
+        from uinstallercore.mounting import MountPlan
+        return MountPlan(self.get_entries(), root)
+
+    def read(self, lines):
+        ''' Add the entries of the lines of an fstab file (any iterable of lines, i.e. an open file), they are not formatted '''
+        for line in lines:
+            fields = line.split("#", 1)[0].split()
+            if(len(fields) < 3):
+                continue
+            fields = [_unescape_fstab(field) for field in fields]
+            options = None
+            if(len(fields) > 3):
+                options = fields[3]
+            self.add_mount(fields[0], fields[1], fields[2], options, False)
+        return self
+
+    def write(self, output):
+        ''' Write the entries of this fstab to the file output '''
         for item in self.get_entries():
-            if(item.mountpoint == mountpoint):
-                return True
-        return False
+            if(item.filesystem == "swap"):
+                # special case..
+                output.write("%s\tswap\tswap\tsw\t0\t0\n" % _escape_fstab(item.device))
+            else:
+                options = item.options
+                if(options is None):
+                    options = "rw,errors=remount-ro"
+                output.write("%s\t%s\t%s\t%s\t%s\t%s\n" % (_escape_fstab(item.device), _escape_fstab(item.mountpoint), item.filesystem, options, "0", "0"))
+
+    def load(self, filename="/etc/fstab"):
+        ''' Add the entries of an existing fstab file '''
+        fstab = open(filename, "r")
+        try:
+            return self.read(fstab)
+        finally:
+            fstab.close()
+
+    def dump(self, filename):
+        ''' Write this fstab to filename '''
+        fstab = open(filename, "w")
+        try:
+            self.write(fstab)
+        finally:
+            fstab.close()
+
+def _escape_fstab(field):
+    return field.replace("\\", "\\134").replace(" ", "\\040").replace("\t", "\\011")
+
+def _unescape_fstab(field):
+    # spaces and the like are written as octal escapes, i.e. \040
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), field)
 
 class FSTabEntry(object):
     ''' Represents an entry in /etc/fstab '''
@@ -110,25 +176,87 @@ class FSTabEntry(object):
         self.options = options
         self.format = format
 
+class InstallTarget(object):
+    ''' One of the disks of a fan-out install (see UInstallerEngine.install_fanout) '''
+
+    def __init__(self, fstab, hostname=None, user=None, grub_device=None):
+        ''' Creates a new target;
+        * fstab is the FSTab of the disk, it must have a root ('/') entry.
+        * hostname and user (a SystemUser) are the ones of the new system, the ones of the engine if not given.
+        * grub_device is where the bootloader of this disk is installed, None for no bootloader. '''
+        self.fstab = fstab
+        self.hostname = hostname
+        self.user = user
+        self.grub_device = grub_device
+
+class InstallCancelled(Exception):
+    ''' Raised inside the install once it has been cancelled '''
+    pass
+
 class UInstallerEngine:
     ''' This is central to the UInstaller, for the correct setting for this we need two main '.conf' files:
 		UInstaller.conf: Is generic, has the configurations about directories, classes and files needed for the UInstallerEngine
 		install.conf: Is specific, has to define the environment (GTK, QT, ncurses, etc.), distro name, version, live user name, etc.'''
 
-    def __init__(self):
-        ''' This creates a new InstallerEngine and setups initial configurations'''
+    def __init__(self, config_cache=CACHE_FILE):
+        ''' This creates a new InstallerEngine and setups initial configurations;
+        config_cache is where the checked configuration is kept between runs (None to always parse it) '''
         self._conf_file = 'uinstaller.conf'
-        configuration = ConfigObj(self._conf_file)
-        distribution = configuration['distribution']
-        install = configuration['install']
+        # validated against config.SCHEMA, the file is only parsed again when it changes
+        self._config = InstallerConfig.load(self._conf_file, config_cache)
+        distribution = self._config.get_section('distribution')
+        install = self._config.get_section('install')
         self._distribution_name = distribution['DISTRIBUTION_NAME']
         self._distribution_version = distribution['DISTRIBUTION_VERSION']
 
         self._user = None
+        self._hostname = None
+        self._fstab = None
         self._live_user = install['LIVE_USER_NAME']
+        self._blacklist = Blacklist(install['BLACKLIST'])
+        # the live user is removed from the new system anyway
+        self._blacklist.add("/home/%s" % self._live_user)
         self.set_install_media(media=install['LIVE_MEDIA_SOURCE'], type=install['LIVE_MEDIA_TYPE'])
+        self.set_copy_workers(install['COPY_WORKERS'])
+        self._fd_relative_copy = install['FD_RELATIVE_COPY']
+        self.set_copy_order(install['COPY_ORDER'])
+        self._progress = ProgressReporter(frequency=install['PROGRESS_FREQUENCY'])
+        # the FileCopier is created the first time a file is copied (see _get_file_copier)
+        self._file_copier = None
+        self._copy_methods = install['COPY_METHODS']
+        self._copy_buffer_size = install['COPY_BUFFER_SIZE']
+        self._sparse_threshold = install['SPARSE_THRESHOLD']
+        self.set_low_memory_copy(install['LOW_MEMORY_COPY'], install['WRITEBACK_BATCH'])
+        self.set_checksum_algorithm(install['CHECKSUM_ALGORITHM'])
+        self._checksums_file = install['CHECKSUMS_FILE']
+        self._checksums = None
+        self.set_resume(install['RESUME_COPY'])
+        self._checkpoint_file = install['CHECKPOINT_FILE']
+        self._checkpoint_interval = install['CHECKPOINT_INTERVAL']
+        self._checkpoint = None
+        self.set_copy_backend(install['COPY_BACKEND'], install['EXTRACT_PROCESSORS'])
 
         self._grub_device = None
+        # where the system being installed is mounted
+        self._target = "/target"
+        self._grub_theme_pattern = install['GRUB_THEME_PATTERN']
+        self._grub_entry_pattern = install['GRUB_ENTRY_PATTERN']
+        self._grub_attempts = max(install['GRUB_ATTEMPTS'], 1)
+        self._grub_retry_delay = install['GRUB_RETRY_DELAY']
+        self._chroot_open = False
+        self._chroot_local = threading.local()
+        self._chroot_sessions = []
+        self._chroot_idle = []
+        self._chroot_lock = threading.Lock()
+        self._chroot_results = []
+        self._stage_workers = max(install['STAGE_WORKERS'], 1)
+        self._stages_total = 0
+        self._stages_done = 0
+        self._cancel = threading.Event()
+        self._mounted = []
+        # the Tracer is created the first time it's needed (see get_tracer)
+        self._tracer = None
+        self._trace_file = install['TRACE_FILE']
 
     def set_main_user(self, user):
         ''' Set the main user to be used by the installer '''
@@ -141,20 +269,126 @@ class UInstallerEngine:
 
     def format_device(self, device, filesystem):
         ''' Format the given device to the specified filesystem '''
+        self.check_cancelled()
         if filesystem == "swap":
             cmd = "mkswap %s" % device
         else:
             cmd = "mkfs -t %s %s" % (filesystem, device)
         print "EXECUTING: '%s'" % cmd
+        from subprocess import Popen
         p = Popen(cmd, shell=True)
         p.wait() # this blocks
         return p.returncode
 
+    def format_partitions(self, items):
+        ''' Format the given fstab entries, at the same time when they are on different disks.
+        Returns the list of FormatResult, raises an exception (after telling the error hook) if any failed. '''
+        from uinstallercore.formatting import FormatScheduler
+        scheduler = FormatScheduler(self.format_device)
+        for item in items:
+            scheduler.add(item.device, item.format)
+        spans = dict()
+        def started(result):
+            # well now, we gets to nuke stuff.
+            self.update_progress(total=4, current=1, pulse=True, message=_("Formatting %s as %s...") % (result.device, result.filesystem))
+            spans[result.device] = self.get_tracer().begin_command("format", device=result.device, filesystem=result.filesystem, disk=result.disk)
+        def finished(result):
+            if(result.device in spans):
+                spans[result.device].end(returncode=result.returncode)
+            print " ------ Formatted %s (disk %s) as %s in %.1fs, return code %s" % (result.device, result.disk, result.filesystem, result.elapsed, result.returncode)
+            if(result.succeeded()):
+                self.update_progress(total=4, current=1, pulse=True, message=_("Formatted %s as %s in %.1fs") % (result.device, result.filesystem, result.elapsed))
+        results = scheduler.run(started, finished)
+        self.check_cancelled()
+        # the partitions a cancel() stopped didn't fail
+        failed = [result for result in results if not result.succeeded() and not isinstance(result.error, InstallCancelled)]
+        for result in failed:
+            if(result.error is not None):
+                reason = str(result.error)
+            else:
+                reason = _("return code %s") % result.returncode
+            self.error_message(critical=True, message=_("Could not format %s as %s (%s)") % (result.device, result.filesystem, reason))
+        if(failed):
+            raise Exception("Could not format %s" % ", ".join([result.device for result in failed]))
+        return results
+
+    def mount_partitions(self, plan):
+        ''' Mount the partitions of a MountPlan, a mountpoint only after the ones holding it and the rest at the same time '''
+        def started(result):
+            print " ------ Mounting %s on %s" % (result.entry.device, result.target)
+        def finished(result):
+            if(result.error is not None):
+                print " ------ Could not mount %s on %s: %s" % (result.entry.device, result.target, result.error)
+        results = plan.mount(lambda entry, target: self.do_mount(entry.device, target, entry.filesystem, None), started, finished)
+        failed = [result for result in results if not result.succeeded()]
+        if(failed):
+            raise Exception("Could not mount %s" % ", ".join([result.entry.device for result in failed]))
+
     def set_install_media(self, media=None, type=None):
         ''' Sets the location of our install source '''
         self._media = media
         self._media_type = type
 
+    def set_copy_workers(self, workers):
+        ''' Set how many threads copy the regular files of the live system '''
+        self._copy_workers = max(int(workers), 1)
+
+    def set_copy_order(self, order):
+        ''' Set the order the regular files are copied in:
+        * 'walk' goes directory by directory.
+        * 'physical' follows where their data is in the source, for DVDs, slow USB sticks and other media where seeking is expensive. '''
+        if(order not in ('walk', 'physical')):
+            raise ValueError("Unknown copy order: %s" % order)
+        self._copy_order = order
+
+    def set_copy_backend(self, backend, processors=None):
+        ''' Set how the live system gets onto the target:
+        * 'copy' loop-mounts the media and copies it file by file.
+        * 'unsquashfs' extracts a squashfs media straight onto the target, with processors threads (all of them by default). '''
+        if(backend not in ('copy', 'unsquashfs')):
+            raise ValueError("Unknown copy backend: %s" % backend)
+        if(backend == 'unsquashfs'):
+            # raises ConfigError now for a blacklist unsquashfs can't prune, not halfway through the install
+            self._blacklist.get_extract_patterns()
+        self._copy_backend = backend
+        self._extract_processors = processors
+
+    def set_low_memory_copy(self, enabled, batch_size=32 * 1024 * 1024):
+        ''' Set whether the copy keeps the page cache small (see PageCacheLimiter), for live sessions with little RAM:
+        the copied data is dropped from the cache and written back every batch_size bytes, with a single sync at the end '''
+        self._low_memory_copy = enabled
+        self._writeback_batch = batch_size
+        if(self._file_copier is not None):
+            self._file_copier.set_cache_limiter(self._get_cache_limiter())
+
+    def _get_cache_limiter(self):
+        if(not self._low_memory_copy):
+            return None
+        from uinstallercore.pagecache import PageCacheLimiter
+        return PageCacheLimiter(self._writeback_batch)
+
+    def _get_file_copier(self):
+        if(self._file_copier is None):
+            from uinstallercore.filecopy import FileCopier, COPY_METHODS
+            methods = self._copy_methods
+            if(methods is None):
+                methods = COPY_METHODS
+            self._file_copier = FileCopier(buffer_size=self._copy_buffer_size, methods=methods, cache=self._get_cache_limiter(),
+                                           sparse_threshold=self._sparse_threshold)
+        return self._file_copier
+
+    def set_checksum_algorithm(self, algorithm):
+        ''' Set the hashlib algorithm (i.e. 'md5', 'sha1') used to checksum the files while they are copied, None to disable it '''
+        if(algorithm in ("", "none", "None")):
+            algorithm = None
+        self._checksum_algorithm = algorithm
+
+    def set_resume(self, resume):
+        ''' Set whether install() resumes an interrupted install: the partitions aren't formatted again
+        and the files already copied (according to the checkpoint journal in the target) are skipped.
+        The journal is only kept while resume is set, an install without it can't be resumed. '''
+        self._resume = resume
+
     def set_keyboard_options(self, layout=None, model=None):
         ''' Set the required keyboard layout and model with console-setup '''
         self._keyboard_layout = layout
@@ -170,20 +404,53 @@ class UInstallerEngine:
 
     def add_to_blacklist(self, blacklistee):
         ''' This will add a directory or file to the blacklist, so that '''
-        ''' it is not copied onto the new filesystem '''
-        try:
-            self.blacklist.index(blacklistee)
-            self.blacklist.append(blacklistee)
-        except:
-        # We haven't got this item yet
-            pass
+        ''' it is not copied onto the new filesystem (see Blacklist for the kinds of patterns) '''
+        if(self._copy_backend == 'unsquashfs'):
+            Blacklist([blacklistee]).get_extract_patterns() # raises ConfigError if unsquashfs can't prune it
+        self._blacklist.add(blacklistee)
+
+    def get_blacklist(self):
+        ''' Return the Blacklist of the paths that are not copied '''
+        return self._blacklist
 
     def set_progress_hook(self, progresshook):
         ''' Set a callback to be called on progress updates '''
         ''' i.e. def my_callback(progress_type, message, current_progress, total) '''
         ''' Where progress_type is any off PROGRESS_START, PROGRESS_UPDATE, PROGRESS_COMPLETE, PROGRESS_ERROR '''
         self.update_progress = progresshook
+        self._progress.set_hook(progresshook)
+
+    def get_progress_reporter(self):
+        ''' Return the ProgressReporter, it knows the live throughput and ETA of the copy '''
+        return self._progress
         
+    def set_trace_sink(self, sink):
+        ''' Set where the trace events of the install go (a FileSink, a CallbackSink or None to disable the tracing) '''
+        self.get_tracer().set_sink(sink)
+
+    def get_tracer(self):
+        ''' Return the Tracer timing the phases of the install and keeping its counters '''
+        if(self._tracer is None):
+            from uinstallercore.tracing import Tracer, FileSink
+            if(self._trace_file):
+                self._tracer = Tracer(FileSink(self._trace_file))
+            else:
+                self._tracer = Tracer()
+        return self._tracer
+
+    def cancel(self):
+        ''' Ask the running install to stop; it stops at the next safe point and unmounts what it mounted '''
+        self._cancel.set()
+
+    def is_cancelled(self):
+        ''' Returns True/False as to whether the install has been cancelled '''
+        return self._cancel.isSet()
+
+    def check_cancelled(self):
+        ''' Raise InstallCancelled if the install has been cancelled '''
+        if(self._cancel.isSet()):
+            raise InstallCancelled("The installation was cancelled")
+
     def set_error_hook(self, errorhook):
         ''' Set a callback to be called on errors '''
         self.error_message = errorhook
@@ -216,12 +483,17 @@ class UInstallerEngine:
         return self._fstab
 
     def install(self):
-        ''' Install this baby to disk '''
+        ''' Install this baby to disk; returns True if it was installed, False if it failed or was cancelled (see cancel()) '''
+        # a cancel() of a previous install doesn't stop this one
+        self._cancel.clear()
+        return self._install()
+
+    def _install(self):
         # mount the media location. GENERIC
         print " --> Installation started"
+        span = self.get_tracer().begin("install")
+        self._mounted = []
         try:
-            if(not os.path.exists("/target")):
-                os.mkdir("/target")
             if(not os.path.exists("/source")):
                 os.mkdir("/source")
             # find the squashfs..
@@ -230,358 +502,671 @@ class UInstallerEngine:
             if(not os.path.exists(root)):
                 print "Base filesystem does not exist! Critical error (exiting)."
                 sys.exit(1) # change to report
-            root_device = None
             # format partitions as appropriate
-            for item in self._fstab.get_entries():
-                if(item.mountpoint == "/"):
-                    root_device = item                    
-                if(item.format is not None and item.format):
-                    # well now, we gets to nuke stuff.
-                    # report it. should grab the total count of filesystems to be formatted ..
-                    self.update_progress(total=4, current=1, pulse=True, message=_("Formatting %s as %s..." % (item.device, item.format)))
-                    self.format_device(item.device, item.format)    
-                    item.filesystem = item.format
+            self.format_fstabs([self._fstab])
+            self.check_cancelled()
 
             # mount filesystem GENERIC
+            extract = (self._copy_backend == 'unsquashfs' and root_type == 'squashfs')
             print " --> Mounting partitions"
-            self.update_progress(total=4, current=2, message=_("Mounting %s on %s") % (root, "/source/"))
-            print " ------ Mounting %s on %s" % (root, "/source/")
-            self.do_mount(root, "/source/", root_type, options="loop")
-            self.update_progress(total=4, current=3, message=_("Mounting %s on %s") % (root_device.device, "/target/"))
-            print " ------ Mounting %s on %s" % (root_device.device, "/target/")
-            self.do_mount(root_device.device, "/target", root_device.filesystem, None)
-            for item in self._fstab.get_entries():
-                if(item.mountpoint != "/" and item.mountpoint != "swap"):
-                    print " ------ Mounting %s on %s" % (item.device, "/target" + item.mountpoint)
-                    os.system("mkdir -p /target" + item.mountpoint)
-                    self.do_mount(item.device, "/target" + item.mountpoint, item.filesystem, None)
-            
-            # walk root filesystem. we're too lazy though :P GENERIC
-            SOURCE = "/source/"
-            DEST = "/target/"
-            directory_times = []
-            our_total = 0
-            our_current = -1
-            os.chdir(SOURCE)
-            # index the files
-            print " --> Indexing files"
-            for top,dirs,files in os.walk(SOURCE, topdown=False):
-                our_total += len(dirs) + len(files)
-                self.update_progress(pulse=True, message=_("Indexing files to be copied.."))
-            our_total += 1 # safenessness
-            print " --> Copying files"
-            for top,dirs,files in os.walk(SOURCE):
-                # Sanity check. Python is a bit schitzo
-                dirpath = top
-                if(dirpath.startswith(SOURCE)):
-                    dirpath = dirpath[len(SOURCE):]
-                for name in dirs + files:
-                    # following is hacked/copied from Ubiquity
-                    rpath = os.path.join(dirpath, name)
-                    sourcepath = os.path.join(SOURCE, rpath)
-                    targetpath = os.path.join(DEST, rpath)
-                    st = os.lstat(sourcepath)
-                    mode = stat.S_IMODE(st.st_mode)
-
-                    # now show the world what we're doing                    
-                    our_current += 1
-                    self.update_progress(total=our_total, current=our_current, message=_("Copying %s" % rpath))
-
-                    if os.path.exists(targetpath):
-                        if not os.path.isdir(targetpath):
-                            os.remove(targetpath)                        
-
-                    if stat.S_ISLNK(st.st_mode):
-                        if os.path.lexists(targetpath):
-                            os.unlink(targetpath)
-                        linkto = os.readlink(sourcepath)
-                        os.symlink(linkto, targetpath)
-                    elif stat.S_ISDIR(st.st_mode):
-                        if not os.path.isdir(targetpath):
-                            os.mkdir(targetpath, mode)
-                    elif stat.S_ISCHR(st.st_mode):                        
-                        os.mknod(targetpath, stat.S_IFCHR | mode, st.st_rdev)
-                    elif stat.S_ISBLK(st.st_mode):
-                        os.mknod(targetpath, stat.S_IFBLK | mode, st.st_rdev)
-                    elif stat.S_ISFIFO(st.st_mode):
-                        os.mknod(targetpath, stat.S_IFIFO | mode)
-                    elif stat.S_ISSOCK(st.st_mode):
-                        os.mknod(targetpath, stat.S_IFSOCK | mode)
-                    elif stat.S_ISREG(st.st_mode):
-                        # we don't do blacklisting yet..
-                        try:
-                            os.unlink(targetpath)
-                        except:
-                            pass
-                        self.copy_file(sourcepath, targetpath)
-                    os.lchown(targetpath, st.st_uid, st.st_gid)
-                    if not stat.S_ISLNK(st.st_mode):
-                        os.chmod(targetpath, mode)
-                    if stat.S_ISDIR(st.st_mode):
-                        directory_times.append((targetpath, st.st_atime, st.st_mtime))
-                    # os.utime() sets timestamp of target, not link
-                    elif not stat.S_ISLNK(st.st_mode):
-                        os.utime(targetpath, (st.st_atime, st.st_mtime))
-                # Apply timestamps to all directories now that the items within them
-                # have been copied.
-            print " --> Restoring meta-info"
-            for dirtime in directory_times:
-                (directory, atime, mtime) = dirtime
-                try:
-                    self.update_progress(pulse=True, message=_("Restoring meta-information on %s" % directory))
-                    os.utime(directory, (atime, mtime))
-                except OSError:
-                    pass
-                    
-            # Steps:
-            our_total = 10
-            our_current = 0
-            # chroot GENERIC
-            print " --> Chrooting"
-            self.update_progress(total=our_total, current=our_current, message=_("Entering new system.."))            
-            os.system("mount --bind /dev/ /target/dev/")
-            os.system("mount --bind /dev/shm /target/dev/shm")
-            os.system("mount --bind /dev/pts /target/dev/pts")
-            os.system("mount --bind /sys/ /target/sys/")
-            os.system("mount --bind /proc/ /target/proc/")
-            os.system("cp -f /etc/resolv.conf /target/etc/resolv.conf")
-                                          
-            # remove live user GENERIC
-            print " --> Removing live user"
-            live_user = self._live_user
-            our_current += 1
-            self.update_progress(total=our_total, current=our_current, message=_("Removing live configuration (user)"))
-            self.run_in_chroot("deluser %s" % live_user)
-            # can happen GENERIC
-            if(os.path.exists("/target/home/%s" % live_user)):
-                self.run_in_chroot("rm -rf /home/%s" % live_user)
-            
-            # remove live-initramfs (or w/e) SPECIFIC (here's using APT)
-            print " --> Removing live-initramfs"
-            our_current += 1
-            self.update_progress(total=our_total, current=our_current, message=_("Removing live configuration (packages)"))
-            self.run_in_chroot("apt-get remove --purge --yes --force-yes live-initramfs live-installer")
-            
-            # add new user GENERIC
-            print " --> Adding new user"
-            our_current += 1
-            self.update_progress(total=our_total, current=our_current, message=_("Adding user to system"))
-            user = self.get_main_user()
-            self.run_in_chroot("useradd -s %s -c \'%s\' -G sudo -m %s" % ("/bin/bash", user.realname, user.username))
-            newusers = open("/target/tmp/newusers.conf", "w")
-            newusers.write("%s:%s\n" % (user.username, user.password))
-            newusers.write("root:%s\n" % user.password)
-            newusers.close()
-            self.run_in_chroot("cat /tmp/newusers.conf | chpasswd")
-            self.run_in_chroot("rm -rf /tmp/newusers.conf")
-            
-            # write the /etc/fstab GENERIC
-            print " --> Writing fstab"
-            our_current += 1
-            self.update_progress(total=our_total, current=our_current, message=_("Writing filesystem mount information"))
-            # make sure fstab has default /proc and /sys entries
-            if(not os.path.exists("/target/etc/fstab")):
-                os.system("echo \"#### Static Filesystem Table File\" > /target/etc/fstab")
-            fstabber = open("/target/etc/fstab", "a")
-            fstabber.write("proc\t/proc\tproc\tnodev,noexec,nosuid\t0\t0\n")
-            for item in self._fstab.get_entries():
-                if(item.options is None):
-                    item.options = "rw,errors=remount-ro"
-                if(item.filesystem == "swap"):
-                    # special case..
-                    fstabber.write("%s\tswap\tswap\tsw\t0\t0\n" % item.device)
-                else:
-                    fstabber.write("%s\t%s\t%s\t%s\t%s\t%s\n" % (item.device, item.mountpoint, item.filesystem, item.options, "0", "0"))
-            fstabber.close()
-            
-            # write host+hostname infos GENERIC
-            print " --> Writing hostname"
-            our_current += 1
-            self.update_progress(total=our_total, current=our_current, message=_("Setting hostname"))
-            hostnamefh = open("/target/etc/hostname", "w")
-            hostnamefh.write("%s\n" % self._hostname)
-            hostnamefh.close()
-            hostsfh = open("/target/etc/hosts", "w")
-            hostsfh.write("127.0.0.1\tlocalhost\n")
-            hostsfh.write("127.0.1.1\t%s\n" % self._hostname)
-            hostsfh.write("# The following lines are desirable for IPv6 capable hosts\n")
-            hostsfh.write("::1     localhost ip6-localhost ip6-loopback\n")
-            hostsfh.write("fe00::0 ip6-localnet\n")
-            hostsfh.write("ff00::0 ip6-mcastprefix\n")
-            hostsfh.write("ff02::1 ip6-allnodes\n")
-            hostsfh.write("ff02::2 ip6-allrouters\n")
-            hostsfh.write("ff02::3 ip6-allhosts\n")
-            hostsfh.close()
-
-            # gdm overwrite (specific to Debian/live-initramfs) SPECIFIC (here's using GDM and its config files)
-            print " --> Configuring GDM"
-            gdmconffh = open("/target/etc/gdm3/daemon.conf", "w")
-            gdmconffh.write("# GDM configuration storage\n")
-            gdmconffh.write("\n[daemon]\n")
-            gdmconffh.write("\n[security]\n")
-            gdmconffh.write("\n[xdmcp]\n")
-            gdmconffh.write("\n[greeter]\n")
-            gdmconffh.write("\n[chooser]\n")
-            gdmconffh.write("\n[debug]\n")
-            gdmconffh.close()
-
-            # set the locale REVISE, update-locale is general???
-            print " --> Setting the locale"
-            our_current += 1
-            self.update_progress(total=our_total, current=our_current, message=_("Setting locale"))
-            os.system("echo \"%s.UTF-8 UTF-8\" >> /target/etc/locale.gen" % self._locale)
-            self.run_in_chroot("locale-gen")
-            os.system("echo \"\" > /target/etc/default/locale")
-            self.run_in_chroot("update-locale LANG=\"%s.UTF-8\"" % self._locale)
-            self.run_in_chroot("update-locale LANG=%s.UTF-8" % self._locale)
-
-            # set the timezone GENERAL
-            print " --> Setting the timezone"
-            os.system("echo \"%s\" > /target/etc/timezone" % self._timezone_code)
-            os.system("cp /target/home/ariel/Documentos/live-installer_2010.12.16.1_all/usr/share/zoneinfo/%s /target/etc/localtime" % self._timezone)
-            
-            # localize Firefox and Thunderbird SPECIFIC (here's using APT, FIREFOX, THUNDERBIRD, APTITUDE)
-            print " --> Localizing Firefox and Thunderbird"
-            self.update_progress(total=our_total, current=our_current, message=_("Localizing Firefox and Thunderbird"))
-            if self._locale != "en_US":
-                import commands
-                os.system("apt-get update")
-                self.run_in_chroot("apt-get update")
-                locale = self._locale.replace("_", "-")
-                               
-                num_res = commands.getoutput("aptitude search firefox-l10n-%s | grep firefox-l10n-%s | wc -l" % (locale, locale))
-                if num_res != "0":                    
-                    self.run_in_chroot("apt-get install --yes --force-yes firefox-l10n-" + locale)
-                else:
-                    if "_" in self._locale:
-                        language_code = self._locale.split("_")[0]
-                        num_res = commands.getoutput("aptitude search firefox-l10n-%s | grep firefox-l10n-%s | wc -l" % (language_code, language_code))
-                        if num_res != "0":                            
-                            self.run_in_chroot("apt-get install --yes --force-yes firefox-l10n-" + language_code)
-               
-                num_res = commands.getoutput("aptitude search thunderbird-l10n-%s | grep thunderbird-l10n-%s | wc -l" % (locale, locale))
-                if num_res != "0":
-                    self.run_in_chroot("apt-get install --yes --force-yes thunderbird-l10n-" + locale)
-                else:
-                    if "_" in self._locale:
-                        language_code = self._locale.split("_")[0]
-                        num_res = commands.getoutput("aptitude search thunderbird-l10n-%s | grep thunderbird-l10n-%s | wc -l" % (language_code, language_code))
-                        if num_res != "0":
-                            self.run_in_chroot("apt-get install --yes --force-yes thunderbird-l10n-" + language_code)                                                                                        
-
-            # set the keyboard options.. GENERIC
-            print " --> Setting the keyboard"
-            our_current += 1
-            self.update_progress(total=our_total, current=our_current, message=_("Setting keyboard options"))
-            consolefh = open("/target/etc/default/console-setup", "r")
-            newconsolefh = open("/target/etc/default/console-setup.new", "w")
-            for line in consolefh:
-                line = line.rstrip("\r\n")
-                if(line.startswith("XKBMODEL=")):
-                    newconsolefh.write("XKBMODEL=\"%s\"\n" % self._keyboard_model)
-                elif(line.startswith("XKBLAYOUT=")):
-                    newconsolefh.write("XKBLAYOUT=\"%s\"\n" % self._keyboard_layout)
-                else:
-                    newconsolefh.write("%s\n" % line)
-            consolefh.close()
-            newconsolefh.close()
-            self.run_in_chroot("rm /etc/default/console-setup")
-            self.run_in_chroot("mv /etc/default/console-setup.new /etc/default/console-setup")
-            
-            consolefh = open("/target/etc/default/keyboard", "r")
-            newconsolefh = open("/target/etc/default/keyboard.new", "w")
-            for line in consolefh:
-                line = line.rstrip("\r\n")
-                if(line.startswith("XKBMODEL=")):
-                    newconsolefh.write("XKBMODEL=\"%s\"\n" % self._keyboard_model)
-                elif(line.startswith("XKBLAYOUT=")):
-                    newconsolefh.write("XKBLAYOUT=\"%s\"\n" % self._keyboard_layout)
-                else:
-                    newconsolefh.write("%s\n" % line)
-            consolefh.close()
-            newconsolefh.close()
-            self.run_in_chroot("rm /etc/default/keyboard")
-            self.run_in_chroot("mv /etc/default/keyboard.new /etc/default/keyboard")
-
-            # write MBR (grub) SPECIFIC (here's using GRUB)
-            print " --> Configuring Grub"
-            our_current += 1
-            if(self._grub_device is not None):
-                self.update_progress(pulse=True, total=our_total, current=our_current, message=_("Installing bootloader"))
-                print " --> Running grub-install"
-                self.run_in_chroot("grub-install --force %s" % self._grub_device)
-                self.configure_grub(our_total, our_current)
-                grub_retries = 0
-                while (not self.check_grub(our_total, our_current)):
-                    self.configure_grub(our_total, our_current)
-                    grub_retries = grub_retries + 1
-                    if grub_retries >= 5:
-                        self.error_message(critical=True, message=_("WARNING: The grub bootloader was not configured properly! You need to configure it manually."))
-                        break
-                        
-            # write MBR (grub) SPECIFIC (here's using APT)
-            print " --> Cleaning APT"
-            our_current += 1
-            self.update_progress(pulse=True, total=our_total, current=our_current, message=_("Cleaning APT"))
-            os.system("chroot /target/ /bin/sh -c \"dpkg --configure -a\"")
-            
+            if(not extract):
+                self.mount_source(root, root_type)
+            mount_plan = self.mount_target(self._fstab, self._target)
+
+            self.check_cancelled()
+            if(extract):
+                self.extract_system(root, self._target + "/")
+            else:
+                self.copy_system("/source/", self._target + "/")
+            self.check_cancelled()
+
+            self.configure_target()
+
+            # the install is complete, there's nothing to resume anymore
+            if(self._checkpoint is not None):
+                self._checkpoint.remove()
+
             # now unmount it GENERIC
             print " --> Unmounting partitions"
-            os.system("umount --force /target/dev/shm")
-            os.system("umount --force /target/dev/pts")
-            os.system("umount --force /target/dev/")
-            os.system("umount --force /target/sys/")
-            os.system("umount --force /target/proc/")
-            os.system("rm -rf /target/etc/resolv.conf")
-            for item in self._fstab.get_entries():
-                if(item.mountpoint != "/" and item.mountpoint != "swap"):
-                    self.do_unmount("/target" + item.mountpoint)
-            self.do_unmount("/target")
-            self.do_unmount("/source")
+            self.unmount_target(mount_plan)
+            if(not extract):
+                self.do_unmount("/source")
+            self._mounted = []
 
             self.update_progress(done=True, message=_("Installation finished"))
             print " --> All done"
+            span.end()
+            self.get_tracer().finish()
+            return True
             
         except Exception:            
-            import traceback
+            return self._install_failed(span)
+
+    def install_fanout(self, targets):
+        ''' Install the live system onto several disks at once, one InstallTarget each. The source is walked and
+        read once, every file being written to all the targets; then every target is configured, one after the other,
+        with its own fstab, hostname, user and bootloader. Returns True if every target was installed.
+        The targets are mounted on /target0, /target1... and copied file by file, whatever the copy backend. '''
+        self._cancel.clear()
+        print " --> Installation of %d targets started" % len(targets)
+        span = self.get_tracer().begin("install", targets=len(targets))
+        self._mounted = []
+        settings = (self._target, self._fstab, self._hostname, self._user, self._grub_device)
+        try:
+            if(not os.path.exists("/source")):
+                os.mkdir("/source")
+            if(not os.path.exists(self._media)):
+                print "Base filesystem does not exist! Critical error (exiting)."
+                sys.exit(1) # change to report
+            if(self._resume):
+                print " ------ A fan-out install can't be resumed, starting over"
+                self._resume = False
+            # the partitions of all the disks are formatted at the same time
+            self.format_fstabs([target.fstab for target in targets])
+            self.check_cancelled()
+
+            print " --> Mounting partitions"
+            self.mount_source(self._media, self._media_type)
+            roots = ["/target%d" % i for i in range(len(targets))]
+            plans = [self.mount_target(target.fstab, root) for (target, root) in zip(targets, roots)]
+            self.check_cancelled()
+            self.copy_system("/source/", [root + "/" for root in roots])
+            self.check_cancelled()
+
+            for (target, root, plan) in zip(targets, roots, plans):
+                print " --> Configuring %s" % root
+                self._target = root
+                self._fstab = target.fstab
+                self._hostname = target.hostname or settings[2]
+                self._user = target.user or settings[3]
+                self._grub_device = target.grub_device
+                self.configure_target()
+                self.unmount_target(plan)
+
+            print " --> Unmounting partitions"
+            self.do_unmount("/source")
+            self._mounted = []
+
+            self.update_progress(done=True, message=_("Installation finished"))
+            print " --> All done"
+            span.end()
+            self.get_tracer().finish()
+            return True
+
+        except Exception:
+            return self._install_failed(span)
+        finally:
+            (self._target, self._fstab, self._hostname, self._user, self._grub_device) = settings
+
+    def _install_failed(self, span):
+        self.close_chroot()
+        span.end(error=str(sys.exc_info()[1]))
+        self.get_tracer().finish()
+        if(self.is_cancelled()):
+            print " --> Installation cancelled, unmounting partitions"
+            self.unmount_all()
+            self.update_progress(done=True, message=_("Installation cancelled"))
+            return False
+        import traceback
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        traceback.print_tb(exc_traceback, limit=1, file=sys.stdout)
+        return False
+
+    def format_fstabs(self, fstabs):
+        ''' Format the entries of the fstabs marked to be formatted (not when resuming) '''
+        to_format = []
+        for fstab in fstabs:
+            for item in fstab.get_entries():
+                if(item.format is not None and item.format):
+                    if(self._resume):
+                        print " ------ Resuming, %s is not formatted again" % item.device
+                    else:
+                        to_format.append(item)
+                    item.filesystem = item.format
+        self.format_partitions(to_format)
+
+    def mount_source(self, media, media_type):
+        ''' Mount the live media on /source '''
+        self.update_progress(total=4, current=2, message=_("Mounting %s on %s") % (media, "/source/"))
+        print " ------ Mounting %s on %s" % (media, "/source/")
+        self.do_mount(media, "/source/", media_type, options="loop")
+
+    def mount_target(self, fstab, root):
+        ''' Mount the root filesystem of fstab on root and the rest below it, returns their MountPlan '''
+        # a bad fstab (i.e. two entries on the same mountpoint) is refused before anything is mounted
+        mount_plan = fstab.get_mount_plan(root)
+        if(not os.path.exists(root)):
+            os.mkdir(root)
+        root_device = fstab.get_entry("/")
+        self.update_progress(total=4, current=3, message=_("Mounting %s on %s") % (root_device.device, root + "/"))
+        print " ------ Mounting %s on %s" % (root_device.device, root + "/")
+        self.do_mount(root_device.device, root, root_device.filesystem, None)
+        try:
+            self.mount_partitions(mount_plan)
+        except:
+            # leave nothing mounted on root, the install can be started again
             exc_type, exc_value, exc_traceback = sys.exc_info()
-            traceback.print_tb(exc_traceback, limit=1, file=sys.stdout)
-    
-    def run_in_chroot(self, command):
-        os.system("chroot /target/ /bin/sh -c \"%s\"" % command)
+            mount_plan.unmount(self.do_unmount)
+            self.do_unmount(root)
+            raise exc_type, exc_value, exc_traceback
+        return mount_plan
+
+    def configure_target(self):
+        ''' Chroot into the target and configure the new system '''
+        # chroot GENERIC
+        print " --> Chrooting"
+        self.update_progress(total=1, current=0, message=_("Entering new system.."))
+        self._bind_mount("/dev/", self._target + "/dev/")
+        self._bind_mount("/dev/shm", self._target + "/dev/shm")
+        self._bind_mount("/dev/pts", self._target + "/dev/pts")
+        self._bind_mount("/sys/", self._target + "/sys/")
+        self._bind_mount("/proc/", self._target + "/proc/")
+        self.run_command("cp -f /etc/resolv.conf %s/etc/resolv.conf" % self._target, "resolv_conf")
+        self.open_chroot()
+
+        # configure the new system, the steps not depending on each other run at the same time
+        self.configure_system()
+        self.close_chroot()
+
+    def unmount_target(self, mount_plan):
+        ''' Unmount the target and everything mounted below it '''
+        self.close_chroot()
+        for mountpoint in ("/dev/shm", "/dev/pts", "/dev/", "/sys/", "/proc/"):
+            self.run_command("umount --force %s%s" % (self._target, mountpoint), "unmount", mountpoint=self._target + mountpoint)
+        self.run_command("rm -rf %s/etc/resolv.conf" % self._target, "resolv_conf")
+        mount_plan.unmount(self.do_unmount)
+        self.do_unmount(self._target)
+
+    def install_async(self):
+        ''' Start install() on a thread of its own and return its InstallTask, to read the progress (and error) events from and to cancel it '''
+        # cleared here, a cancel() coming before the thread starts still stops it
+        self._cancel.clear()
+        from uinstallercore.installtask import InstallTask
+        return InstallTask(self, function=self._install).start()
+
+    def get_stages(self):
+        ''' Return the Stage list configuring the new system once it is copied, with what every step needs done before it.
+        The stages sharing a resource ('passwd' for the user database, 'dpkg' for the package manager) never run at the same time. '''
+        from uinstallercore.stages import Stage
+        stages = []
+        stages.append(Stage("live_user", self.remove_live_user, resources=("passwd",), message=_("Removing live configuration (user)")))
+        stages.append(Stage("live_packages", self.remove_live_packages, resources=("dpkg",), message=_("Removing live configuration (packages)")))
+        stages.append(Stage("user", self.add_user, requires=("live_user",), resources=("passwd",), message=_("Adding user to system")))
+        stages.append(Stage("fstab", self.write_fstab, message=_("Writing filesystem mount information")))
+        stages.append(Stage("hostname", self.write_hostname, message=_("Setting hostname")))
+        stages.append(Stage("gdm", self.configure_gdm, message=_("Configuring GDM")))
+        stages.append(Stage("locale", self.configure_locale, message=_("Setting locale")))
+        stages.append(Stage("timezone", self.configure_timezone, message=_("Setting timezone")))
+        stages.append(Stage("l10n", self.localize_packages, requires=("live_packages",), resources=("dpkg",), message=_("Localizing Firefox and Thunderbird")))
+        stages.append(Stage("keyboard", self.configure_keyboard, message=_("Setting keyboard options")))
+        # the package scripts may run update-initramfs or update-grub, let them finish first
+        stages.append(Stage("bootloader", self.install_bootloader, requires=("live_packages", "l10n"), message=_("Installing bootloader")))
+        stages.append(Stage("apt", self.clean_apt, requires=[stage.name for stage in stages], resources=("dpkg",), message=_("Cleaning APT")))
+        return stages
+
+    def configure_system(self):
+        ''' Run the stages configuring the new system (see get_stages), raises the error of the first one failing '''
+        from uinstallercore.stages import StageScheduler
+        scheduler = StageScheduler(self._stage_workers)
+        for stage in self.get_stages():
+            stage.function = self._cancellable(stage.function)
+            scheduler.add(stage)
+        self._stages_total = len(scheduler.get_stages())
+        self._stages_done = 0
+        spans = dict()
+        def started(stage):
+            print " --> Starting stage %s" % stage.name
+            spans[stage.name] = self.get_tracer().begin("stage", stage=stage.name)
+            self.update_progress(total=self._stages_total, current=self._stages_done, message=stage.message)
+        def finished(stage):
+            self._stages_done += 1
+            if(stage.succeeded):
+                outcome = "done"
+            else:
+                outcome = "failed (%s)" % stage.error[1]
+            print " ------ Stage %s %s in %.1fs" % (stage.name, outcome, stage.elapsed)
+            spans[stage.name].end(succeeded=stage.succeeded)
+            self.update_progress(total=self._stages_total, current=self._stages_done, message=stage.message)
+        try:
+            scheduler.run(started, finished)
+        finally:
+            path = scheduler.get_critical_path()
+            print " ------ Critical path: %s (%.1fs)" % (" -> ".join([stage.name for stage in path]), sum([stage.elapsed or 0 for stage in path]))
+
+    def _cancellable(self, function):
+        def run():
+            self.check_cancelled()
+            try:
+                return function()
+            finally:
+                # the next stage, on another thread, can use the shell of this one
+                self._release_chroot()
+        return run
+
+    def remove_live_user(self):
+        ''' Remove the user of the live session from the new system '''
+        # remove live user GENERIC
+        print " --> Removing live user"
+        live_user = self._live_user
+        self.run_in_chroot("deluser %s" % live_user)
+        # can happen GENERIC
+        if(os.path.exists(self._target + "/home/%s" % live_user)):
+            self.run_in_chroot("rm -rf /home/%s" % live_user)
+
+    def remove_live_packages(self):
+        ''' Remove the packages only the live session needs '''
+        # remove live-initramfs (or w/e) SPECIFIC (here's using APT)
+        print " --> Removing live-initramfs"
+        self.run_in_chroot("apt-get remove --purge --yes --force-yes live-initramfs live-installer")
+
+    def add_user(self):
+        ''' Add the main user to the new system, and set its password and the root one '''
+        # add new user GENERIC
+        print " --> Adding new user"
+        user = self.get_main_user()
+        self.run_in_chroot("useradd -s %s -c \'%s\' -G sudo -m %s" % ("/bin/bash", user.realname, user.username))
+        newusers = open(self._target + "/tmp/newusers.conf", "w")
+        newusers.write("%s:%s\n" % (user.username, user.password))
+        newusers.write("root:%s\n" % user.password)
+        newusers.close()
+        self.run_in_chroot("cat /tmp/newusers.conf | chpasswd")
+        self.run_in_chroot("rm -rf /tmp/newusers.conf")
+
+    def write_fstab(self):
+        ''' Write the /etc/fstab of the new system '''
+        # write the /etc/fstab GENERIC
+        print " --> Writing fstab"
+        # make sure fstab has default /proc and /sys entries
+        if(not os.path.exists(self._target + "/etc/fstab")):
+            self.run_command("echo \"#### Static Filesystem Table File\" > %s/etc/fstab" % self._target, "fstab")
+        fstabber = open(self._target + "/etc/fstab", "a")
+        fstabber.write("proc\t/proc\tproc\tnodev,noexec,nosuid\t0\t0\n")
+        self._fstab.write(fstabber)
+        fstabber.close()
+
+    def write_hostname(self):
+        ''' Write the /etc/hostname and /etc/hosts of the new system '''
+        # write host+hostname infos GENERIC
+        print " --> Writing hostname"
+        hostnamefh = open(self._target + "/etc/hostname", "w")
+        hostnamefh.write("%s\n" % self._hostname)
+        hostnamefh.close()
+        hostsfh = open(self._target + "/etc/hosts", "w")
+        hostsfh.write("127.0.0.1\tlocalhost\n")
+        hostsfh.write("127.0.1.1\t%s\n" % self._hostname)
+        hostsfh.write("# The following lines are desirable for IPv6 capable hosts\n")
+        hostsfh.write("::1     localhost ip6-localhost ip6-loopback\n")
+        hostsfh.write("fe00::0 ip6-localnet\n")
+        hostsfh.write("ff00::0 ip6-mcastprefix\n")
+        hostsfh.write("ff02::1 ip6-allnodes\n")
+        hostsfh.write("ff02::2 ip6-allrouters\n")
+        hostsfh.write("ff02::3 ip6-allhosts\n")
+        hostsfh.close()
+
+    def configure_gdm(self):
+        ''' Overwrite the GDM configuration left by the live session '''
+        # gdm overwrite (specific to Debian/live-initramfs) SPECIFIC (here's using GDM and its config files)
+        print " --> Configuring GDM"
+        gdmconffh = open(self._target + "/etc/gdm3/daemon.conf", "w")
+        gdmconffh.write("# GDM configuration storage\n")
+        gdmconffh.write("\n[daemon]\n")
+        gdmconffh.write("\n[security]\n")
+        gdmconffh.write("\n[xdmcp]\n")
+        gdmconffh.write("\n[greeter]\n")
+        gdmconffh.write("\n[chooser]\n")
+        gdmconffh.write("\n[debug]\n")
+        gdmconffh.close()
+
+    def configure_locale(self):
+        ''' Generate and set the locale of the new system '''
+        # set the locale REVISE, update-locale is general???
+        print " --> Setting the locale"
+        self.run_command("echo \"%s.UTF-8 UTF-8\" >> %s/etc/locale.gen" % (self._locale, self._target), "locale")
+        self.run_in_chroot("locale-gen")
+        self.run_command("echo \"\" > %s/etc/default/locale" % self._target, "locale")
+        self.run_in_chroot("update-locale LANG=\"%s.UTF-8\"" % self._locale)
+        self.run_in_chroot("update-locale LANG=%s.UTF-8" % self._locale)
+
+    def configure_timezone(self):
+        ''' Set the timezone of the new system '''
+        # set the timezone GENERAL
+        print " --> Setting the timezone"
+        self.run_command("echo \"%s\" > %s/etc/timezone" % (self._timezone_code, self._target), "timezone")
+        self.run_command("cp %s/home/ariel/Documentos/live-installer_2010.12.16.1_all/usr/share/zoneinfo/%s %s/etc/localtime" % (self._target, self._timezone, self._target), "timezone")
+
+    def localize_packages(self):
+        ''' Install the Firefox and Thunderbird packages of our locale '''
+        # localize Firefox and Thunderbird SPECIFIC (here's using APT, FIREFOX, THUNDERBIRD, APTITUDE)
+        print " --> Localizing Firefox and Thunderbird"
+        if self._locale != "en_US":
+            self.run_in_chroot("apt-get update")
+            from uinstallercore.aptindex import PackageIndex
+            packages = PackageIndex(self._target + "/var/lib/apt/lists").get_localized_packages(("firefox-l10n-", "thunderbird-l10n-"), self._locale)
+            if(packages):
+                self.run_in_chroot("apt-get install --yes --force-yes " + " ".join(packages))
+
+    def configure_keyboard(self):
+        ''' Set the keyboard layout and model of the console and X '''
+        # set the keyboard options.. GENERIC
+        print " --> Setting the keyboard"
+        consolefh = open(self._target + "/etc/default/console-setup", "r")
+        newconsolefh = open(self._target + "/etc/default/console-setup.new", "w")
+        for line in consolefh:
+            line = line.rstrip("\r\n")
+            if(line.startswith("XKBMODEL=")):
+                newconsolefh.write("XKBMODEL=\"%s\"\n" % self._keyboard_model)
+            elif(line.startswith("XKBLAYOUT=")):
+                newconsolefh.write("XKBLAYOUT=\"%s\"\n" % self._keyboard_layout)
+            else:
+                newconsolefh.write("%s\n" % line)
+        consolefh.close()
+        newconsolefh.close()
+
+        consolefh = open(self._target + "/etc/default/keyboard", "r")
+        newconsolefh = open(self._target + "/etc/default/keyboard.new", "w")
+        for line in consolefh:
+            line = line.rstrip("\r\n")
+            if(line.startswith("XKBMODEL=")):
+                newconsolefh.write("XKBMODEL=\"%s\"\n" % self._keyboard_model)
+            elif(line.startswith("XKBLAYOUT=")):
+                newconsolefh.write("XKBLAYOUT=\"%s\"\n" % self._keyboard_layout)
+            else:
+                newconsolefh.write("%s\n" % line)
+        consolefh.close()
+        newconsolefh.close()
+        self.run_batch_in_chroot(["rm /etc/default/console-setup; mv /etc/default/console-setup.new /etc/default/console-setup",
+                                  "rm /etc/default/keyboard; mv /etc/default/keyboard.new /etc/default/keyboard"])
+
+    def install_bootloader(self):
+        ''' Install grub on the bootloader device, if there is one, and configure it '''
+        # write MBR (grub) SPECIFIC (here's using GRUB)
+        print " --> Configuring Grub"
+        if(self._grub_device is not None):
+            self.update_progress(pulse=True, total=self._stages_total, current=self._stages_done, message=_("Installing bootloader"))
+            print " --> Running grub-install"
+            self.run_in_chroot("grub-install --force %s" % self._grub_device)
+            if(not self.configure_bootloader(self._stages_total, self._stages_done)):
+                self.error_message(critical=True, message=_("WARNING: The grub bootloader was not configured properly! You need to configure it manually."))
+
+    def clean_apt(self):
+        ''' Finish the configuration of the packages left half configured '''
+        # write MBR (grub) SPECIFIC (here's using APT)
+        print " --> Cleaning APT"
+        self.update_progress(pulse=True, total=self._stages_total, current=self._stages_done, message=_("Cleaning APT"))
+        self.run_in_chroot("dpkg --configure -a")
+
+    def copy_system(self, SOURCE, DEST):
+        ''' Copy the live system mounted on SOURCE into DEST, file by file.
+        DEST can be a list of directories, they all get a copy of the files read once from SOURCE (there's no resuming then). '''
+        dests = DEST
+        if(not isinstance(DEST, list)):
+            dests = [DEST]
+        elif(len(DEST) == 1):
+            DEST = DEST[0]
+        from uinstallercore.manifest import SourceManifest
+        from uinstallercore.copyengine import CopyEngine, FdCopyEngine, FanoutCopyEngine
+        from uinstallercore.checksums import ChecksumManifest
+        from uinstallercore.checkpoint import CopyCheckpoint
+        file_copier = self._get_file_copier()
+        # walk root filesystem. we're too lazy though :P GENERIC
+        os.chdir(SOURCE)
+        # index the files
+        print " --> Indexing files"
+        message = _("Indexing files to be copied..")
+        span = self.get_tracer().begin("index", source=SOURCE)
+        manifest = SourceManifest(SOURCE, self._blacklist).scan(lambda directory: self._progress.pulse(message))
+        span.end(files=len(manifest), bytes=manifest.get_total_size(), excluded=manifest.get_excluded())
+        if(len(self._blacklist)):
+            print " ------ %d blacklisted paths are not copied" % manifest.get_excluded()
+        if(manifest.get_links()):
+            print " ------ %d files are hard links to another one" % manifest.get_links()
+        if(self._copy_order == 'physical'):
+            span = self.get_tracer().begin("order", source=SOURCE)
+            located = manifest.order_by_location()
+            span.end(located=located)
+            print " ------ Copying in physical order, %d files located by their extents, the rest by inode" % located
+        print " --> Copying files"
+        # now show the world what we're doing
+        self._progress.start(len(manifest), manifest.get_total_size(), message=_("Copying %s"))
+        def copy_progress(entry):
+            self.check_cancelled()
+            if(entry.link is not None):
+                # no data was copied for another link of a file
+                self._progress.advance(0, entry.path)
+                self.get_tracer().count("hardlinks")
+            else:
+                self._progress.advance(entry.st_size, entry.path)
+            self.get_tracer().count("files_" + _FILE_TYPES.get(stat.S_IFMT(entry.st_mode), "other"))
+        self._checksums = None
+        if(self._checksum_algorithm is not None):
+            self._checksums = ChecksumManifest(self._checksum_algorithm)
+        if(len(dests) > 1):
+            self._checkpoint = None
+            print " ------ Copying to %d targets at once" % len(dests)
+            copier = FanoutCopyEngine(self.copy_fanout, workers=self._copy_workers, progress=copy_progress, checksums=self._checksums)
+        else:
+            checkpoint = CopyCheckpoint(os.path.join(DEST, self._checkpoint_file), interval=self._checkpoint_interval)
+            self._checkpoint = None
+            if(self._resume):
+                # the journal flushes the target every CHECKPOINT_INTERVAL, only pay for it when it can be resumed
+                self._checkpoint = checkpoint
+                print " ------ Resuming, %d files were already copied" % len(self._checkpoint.load())
+            else:
+                checkpoint.remove() # a stale journal of a previous run
+            # the descriptor-relative copy needs the files of a directory together, the physical order scatters them
+            if(self._fd_relative_copy and self._copy_order == 'walk' and FdCopyEngine.is_supported()):
+                copier = FdCopyEngine(self.copy_fd, workers=self._copy_workers, progress=copy_progress, checksums=self._checksums, checkpoint=self._checkpoint)
+            else:
+                copier = CopyEngine(self.copy_file, workers=self._copy_workers, progress=copy_progress, checksums=self._checksums, checkpoint=self._checkpoint)
+        file_copier.reset_stats()
+        span = self.get_tracer().begin("copy", source=SOURCE, dest=DEST)
+        copier.copy_tree(SOURCE, DEST, manifest)
+        span.end(bytes=file_copier.get_stats().get_total_bytes(), holes=file_copier.get_stats().get_hole_bytes())
+        self.get_tracer().count("bytes_holes", file_copier.get_stats().get_hole_bytes())
+        self._progress.finish()
+        print " ------ %s" % file_copier.get_stats()
+        cache = file_copier.get_cache_limiter()
+        if(cache is not None):
+            self._progress.pulse(_("Writing the files to disk"))
+            span = self.get_tracer().begin("writeback", dest=DEST)
+            cache.finish()
+            span.end(peak_dirty=cache.get_peak_dirty(), sync_time=cache.get_sync_time())
+            print " ------ Peak dirty memory %.1f MB, final sync %.1fs" % (cache.get_peak_dirty() / (1024.0 * 1024), cache.get_sync_time())
+        if(self._checksums is not None):
+            print " ------ Writing %s checksums of %d files" % (self._checksum_algorithm, len(self._checksums))
+            for dest in dests:
+                filename = os.path.join(dest, self._checksums_file)
+                try:
+                    if(not os.path.isdir(os.path.dirname(filename))):
+                        os.makedirs(os.path.dirname(filename))
+                    self._checksums.save(filename)
+                except (IOError, OSError), e:
+                    # the system is copied anyway, it just can't be verified later
+                    print " ------ Could not write the checksums to %s: %s" % (filename, e)
+        print " --> Restoring meta-info"
+        message = _("Restoring meta-information on %s")
+        span = self.get_tracer().begin("metadata", dest=DEST)
+        copier.restore_directory_times(lambda directory: self._progress.pulse(message, directory))
+        span.end()
+
+    def extract_system(self, image, DEST):
+        ''' Unpack the squashfs image of the live system into DEST '''
+        print " --> Extracting files"
+        if(self._checksum_algorithm is not None):
+            print " ------ No checksums are computed by the squashfs extractor"
+        self._checkpoint = None
+        self._progress.start(0, 0, message=_("Extracting %s"))
+        def extract_progress(current, total):
+            self.check_cancelled()
+            self._progress.set_total(total, 0)
+            self._progress.advance(files=current - self._progress.get_files(), name=image)
+        from uinstallercore.squashfs import SquashfsExtractor
+        extractor = SquashfsExtractor(image, processors=self._extract_processors, progress=extract_progress)
+        span = self.get_tracer().begin_command("extract", image=image, dest=DEST)
+        try:
+            extractor.extract(DEST, self._blacklist.get_extract_patterns())
+        finally:
+            span.end(files=self._progress.get_files())
+        self._progress.finish()
+
+    def open_chroot(self):
+        ''' Start using chroot sessions in the target; every thread running commands gets its own one, so the
+        stages run their commands at the same time (the ones sharing a resource are kept apart by the StageScheduler) '''
+        self._chroot_results = []
+        self._chroot_open = True
+
+    def run_in_chroot(self, command, output=None):
+        ''' Run a shell command inside the target, through the chroot session when it is open. Returns its exit code.
+        output, if given, gets every line of output of the command while it runs. '''
+        self.check_cancelled()
+        span = self.get_tracer().begin_command("chroot", command=command)
+        returncode = None
+        try:
+            session = self._get_chroot()
+            if(session is None):
+                if(output is None):
+                    returncode = os.WEXITSTATUS(os.system("chroot %s/ /bin/sh -c \"%s\"" % (self._target, command)))
+                else:
+                    import subprocess
+                    p = subprocess.Popen("chroot %s/ /bin/sh -c \"%s\"" % (self._target, command), shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                    for line in iter(p.stdout.readline, ""):
+                        output(line)
+                    p.stdout.close()
+                    returncode = p.wait()
+            else:
+                returncode = self._log_chroot(session.run(command, output), output is None).returncode
+            return returncode
+        finally:
+            span.end(returncode=returncode)
+
+    def run_batch_in_chroot(self, commands):
+        ''' Run independent shell commands inside the target at the same time. Returns their exit codes '''
+        session = self._get_chroot()
+        if(session is None):
+            return [self.run_in_chroot(command) for command in commands]
+        span = self.get_tracer().begin_command("chroot_batch", commands=commands)
+        returncodes = None
+        try:
+            returncodes = [self._log_chroot(result).returncode for result in session.run_batch(commands)]
+            return returncodes
+        finally:
+            span.end(returncodes=returncodes)
+
+    def close_chroot(self):
+        ''' Leave the chroot sessions, if they are open '''
+        self._chroot_lock.acquire()
+        try:
+            self._chroot_open = False
+            for session in self._chroot_sessions:
+                session.close()
+            self._chroot_sessions = []
+            self._chroot_idle = []
+            self._chroot_local = threading.local()
+        finally:
+            self._chroot_lock.release()
+
+    def get_chroot_results(self):
+        ''' Return the ChrootResult (command, exit code, output and wall time) of every command run in the chroot session '''
+        return self._chroot_results
+
+    def _get_chroot(self):
+        # a thread keeps its session until _release_chroot(), then it goes back to the idle ones
+        session = getattr(self._chroot_local, "session", None)
+        if(session is not None and session.is_running()):
+            return session
+        self._chroot_lock.acquire()
+        try:
+            if(not self._chroot_open):
+                return None
+            session = None
+            while(self._chroot_idle and session is None):
+                session = self._chroot_idle.pop()
+                if(not session.is_running()):
+                    session = None
+            if(session is None):
+                from uinstallercore.chroot import ChrootSession
+                session = ChrootSession(self._target + "/").start()
+                self._chroot_sessions.append(session)
+            self._chroot_local.session = session
+            return session
+        finally:
+            self._chroot_lock.release()
+
+    def _release_chroot(self):
+        session = getattr(self._chroot_local, "session", None)
+        if(session is None):
+            return
+        self._chroot_local.session = None
+        self._chroot_lock.acquire()
+        try:
+            if(self._chroot_open and session.is_running()):
+                self._chroot_idle.append(session)
+        finally:
+            self._chroot_lock.release()
+
+    def _log_chroot(self, result, echo=True):
+        self._chroot_results.append(result)
+        if(echo and result.output):
+            print result.output.rstrip("\n")
+        if(result.elapsed is None):
+            print " ------ '%s' returned %s" % (result.command, result.returncode)
+        else:
+            print " ------ '%s' returned %s in %.1fs" % (result.command, result.returncode, result.elapsed)
+        return result
         
     def configure_grub(self, our_total, our_current):
+        ''' Generate grub.cfg in the target, streaming the output of grub-mkconfig to its log. Returns its exit code '''
         self.update_progress(pulse=True, total=our_total, current=our_current, message=_("Configuring bootloader"))
         print " --> Running grub-mkconfig"
-        self.run_in_chroot("grub-mkconfig -o /boot/grub/grub.cfg")
-        grub_output = commands.getoutput("chroot /target/ /bin/sh -c \"grub-mkconfig -o /boot/grub/grub.cfg\"")
         grubfh = open("/var/log/live-installer-grub-output.log", "w")
-        grubfh.writelines(grub_output)
-        grubfh.close()
-        
-    
+        def log(line):
+            grubfh.write(line)
+            grubfh.flush()
+            sys.stdout.write(line)
+        try:
+            return self.run_in_chroot("grub-mkconfig -o /boot/grub/grub.cfg", output=log)
+        finally:
+            grubfh.close()
+
     def check_grub(self, our_total, our_current):
+        ''' Returns True/False as to whether grub.cfg has an entry matching GRUB_ENTRY_PATTERN '''
         self.update_progress(pulse=True, total=our_total, current=our_current, message=_("Checking bootloader"))
         print " --> Checking Grub configuration"
-        time.sleep(5)
         found_theme = False
         found_entry = False
-        if os.path.exists("/target/boot/grub/grub.cfg"):
-            grubfh = open("/target/boot/grub/grub.cfg", "r")
+        if os.path.exists(self._target + "/boot/grub/grub.cfg"):
+            grubfh = open(self._target + "/boot/grub/grub.cfg", "r")
             for line in grubfh:
                 line = line.rstrip("\r\n")
-                if("linuxmint.png" in line):
+                if(self._grub_theme_pattern in line):
                     found_theme = True
                     print " --> Found Grub theme: %s " % line
-                if ("menuentry" in line and "Mint" in line):
+                if ("menuentry" in line and self._grub_entry_pattern in line):
                     found_entry = True
                     print " --> Found Grub entry: %s " % line
             grubfh.close()
             return (found_entry)
         else:
-            print "!No /target/boot/grub/grub.cfg file found!"
+            print "!No %s/boot/grub/grub.cfg file found!" % self._target
             return False
 
+    def configure_bootloader(self, our_total, our_current):
+        ''' Generate and check grub.cfg; it's only generated again (waiting a bit longer every time) when the check fails.
+        Returns True/False as to whether a good grub.cfg was generated. '''
+        delay = self._grub_retry_delay
+        span = self.get_tracer().begin("grub", device=self._grub_device)
+        for attempt in range(self._grub_attempts):
+            if(attempt > 0):
+                print " --> Grub configuration is not right, trying again in %.1fs" % delay
+                time.sleep(delay)
+                delay = delay * 2
+            self.configure_grub(our_total, our_current)
+            if(self.check_grub(our_total, our_current)):
+                span.end(attempts=attempt + 1, succeeded=True)
+                return True
+        span.end(attempts=self._grub_attempts, succeeded=False)
+        return False
+
     def do_mount(self, device, dest, type, options=None):
         ''' Mount a filesystem '''
         p = None
@@ -589,29 +1174,71 @@ class UInstallerEngine:
             cmd = "mount -o %s -t %s %s %s" % (options, type, device, dest)
         else:
             cmd = "mount -t %s %s %s" % (type, device, dest)
-        print "EXECUTING: '%s'" % cmd
-        p = Popen(cmd ,shell=True)
-        p.wait()
-        return p.returncode
+        returncode = self.run_command(cmd, "mount", device=device, mountpoint=dest, filesystem=type)
+        if(returncode == 0):
+            self._mounted.append(dest)
+        return returncode
+
+    def _bind_mount(self, source, dest):
+        if(self.run_command("mount --bind %s %s" % (source, dest), "mount", device=source, mountpoint=dest, filesystem="bind") == 0):
+            self._mounted.append(dest)
+
+    def unmount_all(self):
+        ''' Leave the chroot and unmount, last first, everything the install mounted so far '''
+        self.close_chroot()
+        while(self._mounted):
+            mountpoint = self._mounted.pop()
+            if(self.do_unmount(mountpoint) != 0):
+                self.run_command("umount --force %s" % mountpoint, "unmount", mountpoint=mountpoint)
 
     def do_unmount(self, mountpoint):
         ''' Unmount a filesystem '''
-        cmd = "umount %s" % mountpoint
-        print "EXECUTING: '%s'" % cmd
-        p = Popen(cmd, shell=True)
-        p.wait()
+        return self.run_command("umount %s" % mountpoint, "unmount", mountpoint=mountpoint)
+
+    def run_command(self, command, phase="command", **fields):
+        ''' Run a shell command on the host, traced as phase (with fields) and counted as a subprocess. Returns its exit code '''
+        print "EXECUTING: '%s'" % command
+        span = self.get_tracer().begin_command(phase, command=command, **fields)
+        from subprocess import Popen
+        p = Popen(command, shell=True)
+        p.wait() # this blocks
+        span.end(returncode=p.returncode)
         return p.returncode
 
-    def copy_file(self, source, dest):
-        # TODO: Add md5 checks. BADLY needed..
-        BUF_SIZE = 16 * 1024
-        input = open(source, "rb")
-        dst = open(dest, "wb")
-        while(True):
-            read = input.read(BUF_SIZE)
-            if not read:
-                break
-            dst.write(read)
-        input.close()
-        dst.close()
+    def copy_file(self, source, dest, digest=None):
+        ''' Copy the data of a regular file, returns the number of bytes copied; digest (a hashlib object) is fed with the data '''
+        nbytes = self._get_file_copier().copy(source, dest, digest)
+        self.get_tracer().count("bytes_copied", nbytes)
+        return nbytes
+
+    def copy_fanout(self, source, dests, digest=None):
+        ''' Copy the data of a regular file to several files reading it once, returns the number of bytes copied to each of them '''
+        nbytes = self._get_file_copier().copy_fanout(source, dests, digest)
+        self.get_tracer().count("bytes_read", nbytes)
+        self.get_tracer().count("bytes_copied", nbytes * len(dests))
+        return nbytes
+
+    def copy_fd(self, src, dst, digest=None):
+        ''' Copy the data between two open files, returns the number of bytes copied; digest (a hashlib object) is fed with the data '''
+        nbytes = self._get_file_copier().copy_fd(src, dst, digest)
+        self.get_tracer().count("bytes_copied", nbytes)
+        return nbytes
+
+    def verify_install(self, target="/target", workers=None):
+        ''' Check the files of an installed system against the checksums written while it was copied.
+        Returns a list of (path, problem) for the files that don't match. '''
+        if(workers is None):
+            workers = self._copy_workers
+        from uinstallercore.checksums import ChecksumManifest
+        checksums = ChecksumManifest.load(os.path.join(target, self._checksums_file))
+        message = _("Verifying %s")
+        self._progress.start(len(checksums), checksums.get_total_size(), message=message)
+        failures = checksums.verify(target, workers=workers, progress=lambda path, size: self._progress.advance(size, path))
+        self._progress.finish()
+        for (path, problem) in failures:
+            print " ------ %s: %s" % (path, problem)
+        return failures
 
+    def get_copy_stats(self):
+        ''' Return the CopyStats (bytes and files per copy method) of the last install '''
+        return self._get_file_copier().get_stats()
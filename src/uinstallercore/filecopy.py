@@ -0,0 +1,461 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import io
+import errno
+import threading
+
+from uinstallercore.syscalls import reflink, copy_file_range, sendfile, fallocate, SEEK_DATA, SEEK_HOLE
+
+__all__ = ['FileCopier', 'CopyStats', 'COPY_METHODS']
+
+COPY_METHODS = ('reflink', 'copy_file_range', 'sendfile', 'read')
+
+# errors meaning "this method can't copy these files", not "the copy failed"
+_FALLBACK_ERRORS = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF)
+
+_KERNEL_CHUNK = 1 << 30
+
+# the read path of sparse files leaves a hole instead of writing blocks of zeros this big
+_ZERO_BLOCK = 64 * 1024
+_ZEROS = bytearray(_ZERO_BLOCK)
+
+class CopyStats(object):
+    ''' Counts the files and bytes that went through every copy method, and the bytes left as holes '''
+
+    def __init__(self):
+        ''' Creates a new, empty, set of counters '''
+        self._lock = threading.Lock()
+        self._files = dict()
+        self._bytes = dict()
+        self._holes = 0
+        for method in COPY_METHODS:
+            self._files[method] = 0
+            self._bytes[method] = 0
+
+    def add(self, method, files, nbytes):
+        ''' Account files and nbytes to the given method '''
+        self._lock.acquire()
+        try:
+            self._files[method] += files
+            self._bytes[method] += nbytes
+        finally:
+            self._lock.release()
+
+    def add_holes(self, nbytes):
+        ''' Account nbytes of a sparse file that were left as holes instead of being written '''
+        self._lock.acquire()
+        try:
+            self._holes += nbytes
+        finally:
+            self._lock.release()
+
+    def get_hole_bytes(self):
+        ''' Return how many bytes were left as holes '''
+        return self._holes
+
+    def get_files(self, method):
+        ''' Return how many files were finished by the given method '''
+        return self._files[method]
+
+    def get_bytes(self, method):
+        ''' Return how many bytes were copied by the given method '''
+        return self._bytes[method]
+
+    def get_total_bytes(self):
+        ''' Return how many bytes were copied by all the methods '''
+        return sum(self._bytes.values())
+
+    def __str__(self):
+        return ", ".join(["%s: %d files/%d bytes" % (method, self._files[method], self._bytes[method]) for method in COPY_METHODS] + ["holes: %d bytes" % self._holes])
+
+class FileCopier(object):
+    ''' Copies the data of regular files letting the kernel do the work whenever it can.
+    The methods are tried in order: a reflink clone (only inside a filesystem), copy_file_range(2),
+    sendfile(2) and, as the last resort, read/write through a big buffer reused by every thread.
+    A method failing on a pair of filesystems is not tried again for them.
+    Files of sparse_threshold bytes or more are copied extent by extent: the holes are kept as holes
+    and the data extents are preallocated before they are written, so big files aren't fragmented. '''
+
+    def __init__(self, buffer_size=1024 * 1024, methods=COPY_METHODS, cache=None, sparse_threshold=16 * 1024 * 1024):
+        ''' Creates a new copier;
+        * buffer_size is the size of the buffer used by the 'read' method.
+        * methods is the ordered list of methods to try, any of COPY_METHODS.
+        * cache, if given, is the PageCacheLimiter keeping the copied data out of the page cache.
+        * sparse_threshold is the size from which files take the extent by extent path, 0 to never take it. '''
+        for method in methods:
+            if(method not in COPY_METHODS):
+                raise ValueError("Unknown copy method: %s" % method)
+        self._buffer_size = int(buffer_size)
+        self._methods = list(methods)
+        self._unsupported = set()
+        self._local = threading.local()
+        self._stats = CopyStats()
+        self._sparse_threshold = int(sparse_threshold)
+        self._can_preallocate = True
+        self.set_cache_limiter(cache)
+
+    def set_cache_limiter(self, cache):
+        ''' Set the PageCacheLimiter told about every file copied, None to let the page cache be '''
+        self._cache = cache
+        self._chunk = _KERNEL_CHUNK
+        if(cache is not None):
+            self._chunk = cache.get_batch_size()
+
+    def get_cache_limiter(self):
+        ''' Return the PageCacheLimiter in use, if any '''
+        return self._cache
+
+    def get_stats(self):
+        ''' Return the CopyStats of this copier '''
+        return self._stats
+
+    def reset_stats(self):
+        ''' Start counting again from zero '''
+        self._stats = CopyStats()
+
+    def copy(self, source, dest, digest=None):
+        ''' Copy the data of source into dest (created or truncated), returns the number of bytes copied.
+        If digest (i.e. a hashlib object) is given it's updated with the data while it is copied. '''
+        src = os.open(source, os.O_RDONLY)
+        try:
+            dst = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0666)
+            try:
+                return self.copy_fd(src, dst, digest)
+            finally:
+                os.close(dst)
+        finally:
+            os.close(src)
+
+    def copy_fanout(self, source, dests, digest=None):
+        ''' Copy the data of source into every file of dests (created or truncated) reading it only once,
+        returns the number of bytes copied (to each of them). digest is updated as in copy().
+        Big files take the extent by extent path, as in copy(), their holes are kept in every target. '''
+        if(len(dests) == 1):
+            return self.copy(source, dests[0], digest)
+        src = os.open(source, os.O_RDONLY)
+        dsts = []
+        try:
+            for dest in dests:
+                dsts.append(os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0666))
+            src_st = os.fstat(src)
+            if(self._sparse_threshold > 0 and src_st.st_size >= self._sparse_threshold):
+                return self._copy_large_fanout(src, dsts, src_st, digest)
+            copied = self._copy_read_fanout(src, dsts, digest)
+            self._stats.add('read', 1, copied)
+            return copied
+        finally:
+            for dst in dsts:
+                os.close(dst)
+            os.close(src)
+
+    def copy_fd(self, src, dst, digest=None):
+        ''' Copy from the current offset of the src descriptor to the current offset of dst until the end of file '''
+        if(self._cache is None):
+            return self._copy_fd(src, dst, digest)
+        self._cache.begin(src, dst)
+        copied = self._copy_fd(src, dst, digest)
+        self._cache.end(src, dst)
+        return copied
+
+    def _copy_fd(self, src, dst, digest):
+        src_st = os.fstat(src)
+        if(self._sparse_threshold > 0 and src_st.st_size >= self._sparse_threshold and os.lseek(src, 0, os.SEEK_CUR) == 0):
+            return self._copy_large(src, dst, src_st, digest)
+        if(digest is not None):
+            # the data has to go through us to be digested, the kernel methods are useless here
+            (copied, done) = self._copy_read(src, dst, None, digest)
+            self._stats.add('read', 1, copied)
+            return copied
+        devices = (src_st.st_dev, os.fstat(dst).st_dev)
+        total = 0
+        for method in self._methods:
+            if((method, devices) in self._unsupported):
+                continue
+            if(method == 'reflink' and (total != 0 or devices[0] != devices[1])):
+                continue
+            (copied, done) = getattr(self, "_copy_" + method)(src, dst, src_st.st_size - total)
+            total += copied
+            if(done):
+                self._stats.add(method, 1, copied)
+                return total
+            self._stats.add(method, 0, copied)
+            if(copied == 0):
+                self._unsupported.add((method, devices))
+        raise OSError(errno.ENOSYS, "No copy method could copy this file")
+
+    def _copy_reflink(self, src, dst, remaining):
+        try:
+            reflink(src, dst)
+        except OSError, e:
+            if(e.errno not in _FALLBACK_ERRORS + (errno.EPERM,)):
+                raise
+            return (0, False)
+        return (remaining, True)
+
+    def _copy_copy_file_range(self, src, dst, remaining):
+        return self._copy_kernel(copy_file_range, src, dst, remaining)
+
+    def _copy_sendfile(self, src, dst, remaining):
+        return self._copy_kernel(lambda src, dst, count: sendfile(dst, src, count), src, dst, remaining)
+
+    def _copy_kernel(self, function, src, dst, remaining):
+        copied = 0
+        while(True):
+            try:
+                n = function(src, dst, self._chunk)
+            except OSError, e:
+                if(e.errno == errno.EINTR):
+                    continue
+                if(e.errno not in _FALLBACK_ERRORS):
+                    raise
+                return (copied, False)
+            if(n == 0):
+                # some filesystems answer 0 instead of an error, don't trust an empty first call
+                return (copied, copied > 0 or remaining <= 0)
+            copied += n
+            if(self._cache is not None):
+                self._cache.written(src, dst)
+
+    def _copy_read(self, src, dst, remaining, digest=None):
+        buf = getattr(self._local, "buffer", None)
+        if(buf is None):
+            buf = self._local.buffer = bytearray(self._buffer_size)
+        input = io.FileIO(src, "r", closefd=False)
+        output = io.FileIO(dst, "w", closefd=False)
+        copied = 0
+        while(True):
+            n = input.readinto(buf)
+            if not n:
+                break
+            chunk = buf
+            if(n < len(buf)):
+                chunk = buf[:n]
+            if(digest is not None):
+                digest.update(chunk)
+            written = 0
+            while(written < n):
+                written += output.write(chunk[written:] if written else chunk)
+            copied += n
+            if(self._cache is not None):
+                self._cache.written(src, dst)
+        return (copied, True)
+
+    def _copy_large(self, src, dst, src_st, digest):
+        size = src_st.st_size
+        devices = (src_st.st_dev, os.fstat(dst).st_dev)
+        if(digest is None and 'reflink' in self._methods and devices[0] == devices[1] and ('reflink', devices) not in self._unsupported):
+            (copied, done) = self._copy_reflink(src, dst, size)
+            if(done):
+                self._stats.add('reflink', 1, copied)
+                return copied
+            self._unsupported.add(('reflink', devices))
+        extents = self.get_data_extents(src, size)
+        # squashfs and others can't tell where their holes are, but their block count tells the file has some
+        skip_zeros = (len(extents) == 1 and src_st.st_blocks * 512 < size)
+        # the holes are made by the final size, only the data extents are written
+        os.ftruncate(dst, size)
+        end = 0
+        written = dict()
+        for (offset, length) in extents:
+            if(digest is not None and offset > end):
+                self._digest_zeros(digest, offset - end)
+            os.lseek(src, offset, os.SEEK_SET)
+            os.lseek(dst, offset, os.SEEK_SET)
+            if(not skip_zeros):
+                self._preallocate(dst, offset, length)
+            (method, copied, nbytes) = self._copy_extent(src, dst, length, digest, devices, skip_zeros)
+            end = offset + copied
+            written[method] = written.get(method, 0) + nbytes
+            if(copied < length):
+                # the file shrank while it was copied, the target ends where the data did
+                os.ftruncate(dst, end)
+                size = end
+                break
+        return self._end_large(size, end, written, digest)
+
+    def _end_large(self, size, end, written, digest):
+        # written is the bytes every method wrote, the file counts for the one that wrote the most
+        if(digest is not None and size > end):
+            self._digest_zeros(digest, size - end)
+        method = 'read'
+        if(written):
+            method = max(written.keys(), key=lambda name: written[name])
+        for (name, nbytes) in written.items():
+            self._stats.add(name, int(name == method), nbytes)
+        if(not written):
+            self._stats.add(method, 1, 0)
+        self._stats.add_holes(size - sum(written.values()))
+        return size
+
+    def _copy_large_fanout(self, src, dsts, src_st, digest):
+        # like _copy_large, every extent read once is written to all of dsts
+        size = src_st.st_size
+        extents = self.get_data_extents(src, size)
+        skip_zeros = (len(extents) == 1 and src_st.st_blocks * 512 < size)
+        for dst in dsts:
+            os.ftruncate(dst, size)
+        end = 0
+        written = 0
+        for (offset, length) in extents:
+            if(digest is not None and offset > end):
+                self._digest_zeros(digest, offset - end)
+            os.lseek(src, offset, os.SEEK_SET)
+            for dst in dsts:
+                os.lseek(dst, offset, os.SEEK_SET)
+                if(not skip_zeros):
+                    self._preallocate(dst, offset, length)
+            (copied, nbytes) = self._copy_read_range(src, dsts, length, digest, skip_zeros)
+            end = offset + copied
+            written += nbytes
+            if(copied < length):
+                for dst in dsts:
+                    os.ftruncate(dst, end)
+                size = end
+                break
+        return self._end_large(size, end, {'read': written}, digest)
+
+    def get_data_extents(self, fd, size):
+        ''' Return the (offset, length) of the data extents of the first size bytes of the open file fd;
+        a file whose filesystem doesn't know about holes is a single extent '''
+        extents = []
+        offset = 0
+        try:
+            while(offset < size):
+                start = os.lseek(fd, offset, SEEK_DATA)
+                if(start >= size):
+                    break
+                end = min(os.lseek(fd, start, SEEK_HOLE), size)
+                extents.append((start, end - start))
+                offset = end
+        except (OSError, IOError), e:
+            if(e.errno == errno.ENXIO):
+                pass # no data after offset, the rest is a hole
+            elif(e.errno in _FALLBACK_ERRORS):
+                return [(0, size)]
+            else:
+                raise
+        return extents
+
+    def _preallocate(self, fd, offset, length):
+        if(not self._can_preallocate or length <= 0):
+            return
+        try:
+            fallocate(fd, offset, length)
+        except OSError, e:
+            if(e.errno in (errno.ENOSYS, errno.EOPNOTSUPP)):
+                self._can_preallocate = False # not on this filesystem, or not with this libc
+            elif(e.errno not in _FALLBACK_ERRORS):
+                raise
+
+    def _copy_extent(self, src, dst, length, digest, devices, skip_zeros):
+        # returns (method, bytes copied, bytes written), the current offsets of src and dst are moved past the extent
+        copied = 0
+        if(digest is None and not skip_zeros):
+            for method in ('copy_file_range', 'sendfile'):
+                if(method not in self._methods or (method, devices) in self._unsupported):
+                    continue
+                if(method == 'copy_file_range'):
+                    function = copy_file_range
+                else:
+                    function = lambda src, dst, count: sendfile(dst, src, count)
+                (n, done) = self._copy_kernel_range(function, src, dst, length - copied)
+                copied += n
+                if(done or copied >= length):
+                    return (method, copied, copied)
+                if(n == 0):
+                    self._unsupported.add((method, devices))
+        (n, written) = self._copy_read_range(src, [dst], length - copied, digest, skip_zeros)
+        return ('read', copied + n, copied + written)
+
+    def _copy_kernel_range(self, function, src, dst, length):
+        # returns (bytes copied, whether the end of the range or of the file was reached)
+        copied = 0
+        while(copied < length):
+            try:
+                n = function(src, dst, min(self._chunk, length - copied))
+            except OSError, e:
+                if(e.errno == errno.EINTR):
+                    continue
+                if(e.errno not in _FALLBACK_ERRORS):
+                    raise
+                return (copied, False)
+            if(n == 0):
+                return (copied, copied > 0)
+            copied += n
+            if(self._cache is not None):
+                self._cache.written(src, dst)
+        return (copied, True)
+
+    def _copy_read_range(self, src, dsts, length, digest, skip_zeros):
+        # returns (bytes copied, bytes written to each of dsts), blocks of zeros are skipped with skip_zeros
+        buf = getattr(self._local, "buffer", None)
+        if(buf is None):
+            buf = self._local.buffer = bytearray(self._buffer_size)
+        input = io.FileIO(src, "r", closefd=False)
+        outputs = [io.FileIO(dst, "w", closefd=False) for dst in dsts]
+        view = memoryview(buf)
+        copied = 0
+        written = 0
+        while(copied < length):
+            n = input.readinto(view[:min(len(buf), length - copied)])
+            if not n:
+                break
+            chunk = buf
+            if(n < len(buf)):
+                chunk = buf[:n]
+            if(digest is not None):
+                digest.update(chunk)
+            for start in range(0, n, _ZERO_BLOCK if skip_zeros else n):
+                block = chunk
+                if(skip_zeros):
+                    block = chunk[start:start + _ZERO_BLOCK]
+                    if(block == _ZEROS[:len(block)]):
+                        for output in outputs:
+                            output.seek(len(block), os.SEEK_CUR)
+                        continue
+                for output in outputs:
+                    done = 0
+                    while(done < len(block)):
+                        done += output.write(block[done:] if done else block)
+                written += len(block)
+            copied += n
+            if(self._cache is not None and len(dsts) == 1):
+                self._cache.written(src, dsts[0])
+        return (copied, written)
+
+    def _copy_read_fanout(self, src, dsts, digest):
+        buf = getattr(self._local, "buffer", None)
+        if(buf is None):
+            buf = self._local.buffer = bytearray(self._buffer_size)
+        input = io.FileIO(src, "r", closefd=False)
+        outputs = [io.FileIO(dst, "w", closefd=False) for dst in dsts]
+        copied = 0
+        while(True):
+            n = input.readinto(buf)
+            if not n:
+                break
+            chunk = buf
+            if(n < len(buf)):
+                chunk = buf[:n]
+            if(digest is not None):
+                digest.update(chunk)
+            for output in outputs:
+                written = 0
+                while(written < n):
+                    written += output.write(chunk[written:] if written else chunk)
+            copied += n
+        return copied
+
+    def _digest_zeros(self, digest, nbytes):
+        while(nbytes > 0):
+            n = min(nbytes, _ZERO_BLOCK)
+            digest.update(_ZEROS if n == _ZERO_BLOCK else _ZEROS[:n])
+            nbytes -= n
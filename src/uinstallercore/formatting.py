@@ -0,0 +1,138 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import re
+import sys
+import time
+import threading
+
+__all__ = ['FormatScheduler', 'FormatResult']
+
+# /dev/sda1 -> sda, /dev/nvme0n1p2 -> nvme0n1, /dev/mmcblk0p1 -> mmcblk0
+_PARTITION = re.compile(r"^(.*\d)p\d+$|^(\D+)\d+$")
+
+class FormatResult(object):
+    ''' The outcome of formatting a device '''
+
+    def __init__(self, device, filesystem, disks):
+        ''' Creates a new (pending) result for device, which sits on the physical disks (a list of names) '''
+        self.device = device
+        self.filesystem = filesystem
+        self.disks = disks
+        self.disk = ",".join(disks) # i.e. 'sda', or 'sda,sdb' for a logical volume over two disks
+        self.returncode = None
+        self.error = None
+        self.elapsed = None
+
+    def succeeded(self):
+        ''' Returns True/False as to whether the device was formatted '''
+        return self.returncode == 0 and self.error is None
+
+class FormatScheduler(object):
+    ''' Runs the mkfs/mkswap jobs of an install. Jobs on different physical disks run at the same time,
+    the ones sharing a disk (a logical volume or a RAID sits on all the disks below it) are run one after
+    the other, in the order they were added. '''
+
+    def __init__(self, format_device, sysfs="/sys"):
+        ''' Creates a new scheduler;
+        * format_device is the function formatting a device, format_device(device, filesystem) -> return code.
+        * sysfs is where sysfs is mounted, to find the disks of every device. '''
+        self._format_device = format_device
+        self._sysfs = sysfs
+        self._results = []
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._done = set()
+
+    def get_disks(self, device):
+        ''' Return the sorted names of the physical disks holding device (i.e. /dev/sda2 -> ['sda'],
+        /dev/mapper/vg-root -> the disks of the physical volumes of vg) '''
+        return sorted(self._find_disks(os.path.basename(os.path.realpath(device)), set()))
+
+    def get_disk(self, device):
+        ''' Return the name of the physical disk holding device (i.e. /dev/sda2 -> sda), the first one if it spans several '''
+        return self.get_disks(device)[0]
+
+    def add(self, device, filesystem):
+        ''' Queue the format of device as filesystem '''
+        self._results.append(FormatResult(device, filesystem, self.get_disks(device)))
+
+    def run(self, started=None, finished=None):
+        ''' Format everything, returns the FormatResult list in the order the jobs were added.
+        started(result) and finished(result), if given, are called around every job, one at a time. '''
+        self._done = set()
+        threads = []
+        for (index, result) in enumerate(self._results):
+            # the jobs added before on one of the same disks go first
+            before = [other for other in self._results[:index] if set(other.disks) & set(result.disks)]
+            thread = threading.Thread(target=self._run_job, args=(result, before, started, finished), name="uinstaller-format-%s" % result.disk)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return self._results
+
+    def _find_disks(self, name, seen):
+        block = os.path.join(self._sysfs, "class", "block", name)
+        slaves = os.path.join(block, "slaves")
+        if(os.path.isdir(slaves) and os.listdir(slaves) and name not in seen):
+            # device-mapper (LVM, dm-crypt) and md devices, down to the disks under them
+            seen.add(name)
+            disks = set()
+            for slave in os.listdir(slaves):
+                disks.update(self._find_disks(slave, seen))
+            return disks
+        if(os.path.exists(os.path.join(block, "partition"))):
+            # the device holding the partition, itself maybe a RAID (md0p1 -> md0)
+            return self._find_disks(os.path.basename(os.path.dirname(os.path.realpath(block))), seen)
+        if(os.path.exists(block)):
+            return set([name]) # a whole disk
+        match = _PARTITION.match(name)
+        if(match is not None):
+            return set([match.group(1) or match.group(2)])
+        return set([name])
+
+    def _run_job(self, result, before, started, finished):
+        self._condition.acquire()
+        try:
+            while([other for other in before if other not in self._done]):
+                self._condition.wait()
+        finally:
+            self._condition.release()
+        try:
+            start = time.time()
+            try:
+                # a failing callback fails this job, not the ones after it
+                self._notify(started, result)
+                start = time.time()
+                result.returncode = self._format_device(result.device, result.filesystem)
+            except:
+                result.error = sys.exc_info()[1]
+            result.elapsed = time.time() - start
+            try:
+                self._notify(finished, result)
+            except:
+                if(result.error is None):
+                    result.error = sys.exc_info()[1]
+        finally:
+            self._condition.acquire()
+            try:
+                self._done.add(result)
+                self._condition.notify_all()
+            finally:
+                self._condition.release()
+
+    def _notify(self, callback, result):
+        if(callback is not None):
+            self._lock.acquire()
+            try:
+                callback(result)
+            finally:
+                self._lock.release()
@@ -0,0 +1,145 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import json
+import threading
+import commands
+from subprocess import Popen
+
+__all__ = ['HostProbe', 'HostProfile']
+
+# the SMBIOS chassis types of portable machines (the ones laptop-detect looks for and the newer 2-in-1)
+_PORTABLE_CHASSIS = set([8, 9, 10, 11, 14, 30, 31, 32])
+
+class HostProfile(object):
+    ''' What was found out about the host, it can be saved and loaded again '''
+
+    def __init__(self, laptop=False, model=None, manufacturer=None):
+        ''' Creates a new profile '''
+        self.laptop = laptop
+        self.model = model
+        self.manufacturer = manufacturer
+
+    def to_dict(self):
+        ''' Return this profile as a dict of plain values '''
+        return {"laptop": self.laptop, "model": self.model, "manufacturer": self.manufacturer}
+
+    @classmethod
+    def from_dict(cls, values):
+        ''' Creates a profile from the values of to_dict() '''
+        return cls(bool(values.get("laptop", False)), values.get("model"), values.get("manufacturer"))
+
+    def save(self, filename):
+        ''' Write this profile to filename '''
+        profilefh = open(filename, "w")
+        try:
+            json.dump(self.to_dict(), profilefh)
+        finally:
+            profilefh.close()
+
+    @classmethod
+    def load(cls, filename):
+        ''' Read a profile written by save() '''
+        profilefh = open(filename, "r")
+        try:
+            return cls.from_dict(json.load(profilefh))
+        finally:
+            profilefh.close()
+
+class HostProbe(object):
+    ''' Finds out the HostProfile of the host from sysfs (/sys/class/dmi/id and /sys/class/power_supply),
+    laptop-detect and dmidecode are only run when sysfs has no answer. The host is probed once, the
+    first time the profile is asked for. '''
+
+    def __init__(self, sysfs="/sys"):
+        ''' Creates a new probe reading the sysfs mounted on sysfs '''
+        self._sysfs = sysfs
+        self._profile = None
+        self._lock = threading.Lock()
+
+    def get_profile(self):
+        ''' Return the HostProfile of the host, probing it the first time '''
+        self._lock.acquire()
+        try:
+            if(self._profile is None):
+                self._profile = HostProfile(self.probe_laptop(), self.probe_model(), self.probe_manufacturer())
+            return self._profile
+        finally:
+            self._lock.release()
+
+    def set_profile(self, profile):
+        ''' Use profile (i.e. one loaded from a file) instead of probing the host '''
+        self._profile = profile
+
+    def probe_laptop(self):
+        ''' Returns True/False as to whether the host is a laptop '''
+        chassis = self._read_dmi("chassis_type")
+        if(chassis is not None and chassis.isdigit()):
+            if(int(chassis) in _PORTABLE_CHASSIS):
+                return True
+            return self._has_battery()
+        if(self._has_battery()):
+            return True
+        if(os.path.isdir(os.path.join(self._sysfs, "class", "dmi", "id"))):
+            return False
+        try:
+            p = Popen("laptop-detect", shell=True)
+            return p.wait() == 0 # we want the return code
+        except:
+            return False # doesn't matter, laptop-detect doesnt exist on the host
+
+    def probe_model(self):
+        ''' Return the model of the pc '''
+        model = self._read_dmi("product_name")
+        if(model is None):
+            model = self._dmidecode("system-product-name")
+        return model
+
+    def probe_manufacturer(self):
+        ''' Return the system manufacturer '''
+        manufacturer = self._read_dmi("sys_vendor")
+        if(manufacturer is None):
+            manufacturer = self._dmidecode("system-manufacturer")
+        return manufacturer
+
+    def _has_battery(self):
+        supplies = os.path.join(self._sysfs, "class", "power_supply")
+        try:
+            names = os.listdir(supplies)
+        except OSError:
+            return False
+        for name in names:
+            # the batteries of mice and the like have a 'Device' scope
+            if(self._read(os.path.join(supplies, name, "type")) == "Battery" and self._read(os.path.join(supplies, name, "scope")) != "Device"):
+                return True
+        return False
+
+    def _read_dmi(self, name):
+        return self._read(os.path.join(self._sysfs, "class", "dmi", "id", name))
+
+    def _read(self, filename):
+        try:
+            valuefh = open(filename, "r")
+            try:
+                value = valuefh.read().strip()
+            finally:
+                valuefh.close()
+        except (IOError, OSError):
+            return None
+        return value or None
+
+    def _dmidecode(self, keyword):
+        try:
+            (status, value) = commands.getstatusoutput("dmidecode --string %s" % keyword)
+        except:
+            return None # doesn't matter
+        if(status != 0):
+            return None # dmidecode doesnt exist on the host or can't read the tables
+        return value.strip() or None
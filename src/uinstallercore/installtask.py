@@ -0,0 +1,127 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import threading
+import Queue
+
+__all__ = ['InstallTask', 'ProgressEvent']
+
+class ProgressEvent(object):
+    ''' One update of the progress of an install, as sent to the progress hook;
+    the errors sent to the error hook are events too, with error set (and critical as the hook got it). '''
+
+    def __init__(self, total=None, current=None, pulse=False, done=False, message=None, error=False, critical=False):
+        ''' Creates a new event with the arguments the progress (or error) hook got '''
+        self.total = total
+        self.current = current
+        self.pulse = pulse
+        self.done = done
+        self.message = message
+        self.error = error
+        self.critical = critical
+
+class InstallTask(object):
+    ''' An install running on its own thread, so the frontend never blocks on it nor gets called back from it.
+    The progress updates and the errors are queued as ProgressEvent and read with get_event()/events() from the thread
+    of the frontend (i.e. from a timer of its main loop); cancel() stops the install at its next safe point,
+    unmounting what it mounted. '''
+
+    def __init__(self, engine, backlog=1000, function=None):
+        ''' Creates a new (not started) task installing with engine, running function (engine.install by default);
+        at most backlog events are kept, the oldest pending ones are dropped when the frontend doesn't keep up. '''
+        self._engine = engine
+        self._function = function or engine.install
+        self._events = Queue.Queue(backlog)
+        self._thread = None
+        self._result = None
+        self._hook = None
+        self._error_hook = None
+
+    def start(self):
+        ''' Start the install in the background '''
+        self._hook = getattr(self._engine, 'update_progress', None)
+        self._error_hook = getattr(self._engine, 'error_message', None)
+        self._engine.set_progress_hook(self._queue_event)
+        self._engine.set_error_hook(self._queue_error)
+        self._thread = threading.Thread(target=self._run, name="uinstaller-install")
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        ''' Ask the install to stop; see is_done() or wait() to know when it did '''
+        self._engine.cancel()
+
+    def is_done(self):
+        ''' Returns True/False as to whether the install is over (finished, failed or cancelled) '''
+        return self._thread is not None and not self._thread.isAlive()
+
+    def wait(self, timeout=None):
+        ''' Wait up to timeout seconds (forever by default) for the install; returns True if it is over '''
+        self._thread.join(timeout)
+        return self.is_done()
+
+    def get_result(self):
+        ''' Return True if the system was installed, False if the install failed or was cancelled,
+        None while it is running '''
+        return self._result
+
+    def get_event(self, timeout=None):
+        ''' Return the next ProgressEvent, waiting up to timeout seconds for it (0 doesn't wait);
+        returns None if there was none in time. '''
+        try:
+            if(timeout == 0):
+                return self._events.get_nowait()
+            return self._events.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+    def events(self, timeout=None):
+        ''' Iterate over the ProgressEvent of the install until it is over;
+        with a timeout, it also stops after timeout seconds without any event. '''
+        while(True):
+            event = self.get_event(0.1 if timeout is None else timeout)
+            if(event is not None):
+                yield event
+                if(event.done):
+                    return
+            elif(self.is_done()):
+                # the last events may have come right before the thread ended
+                event = self.get_event(0)
+                if(event is None):
+                    return
+                yield event
+            elif(timeout is not None):
+                return
+
+    def _run(self):
+        try:
+            self._result = self._function()
+        finally:
+            if(self._hook is not None):
+                self._engine.set_progress_hook(self._hook)
+            if(self._error_hook is not None):
+                self._engine.set_error_hook(self._error_hook)
+
+    def _queue_event(self, total=None, current=None, pulse=False, done=False, message=None):
+        self._put(ProgressEvent(total, current, pulse, done, message))
+
+    def _queue_error(self, critical=False, message=None):
+        self._put(ProgressEvent(message=message, error=True, critical=critical))
+
+    def _put(self, event):
+        while(True):
+            try:
+                self._events.put_nowait(event)
+                return
+            except Queue.Full:
+                try:
+                    self._events.get_nowait()
+                except Queue.Empty:
+                    pass
@@ -0,0 +1,191 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import stat
+import errno
+
+from uinstallercore.syscalls import fiemap_first
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None # listdir() + lstat() does the same amount of syscalls, just slower
+
+__all__ = ['SourceManifest', 'ManifestEntry']
+
+class ManifestEntry(object):
+    ''' An entry of the source tree, it has the same st_* names than the result of os.lstat().
+    link is the path of the first entry of the same inode when this one is another hard link to it, None otherwise. '''
+    __slots__ = ('path', 'st_mode', 'st_uid', 'st_gid', 'st_size', 'st_atime', 'st_mtime', 'st_rdev', 'st_dev', 'st_ino', 'st_nlink', 'link')
+
+    def __init__(self, path, st):
+        ''' Creates a new entry for the relative path with the stat result st '''
+        self.path = path
+        self.st_mode = st.st_mode
+        self.st_uid = st.st_uid
+        self.st_gid = st.st_gid
+        self.st_size = st.st_size
+        self.st_atime = st.st_atime
+        self.st_mtime = st.st_mtime
+        self.st_rdev = st.st_rdev
+        self.st_dev = st.st_dev
+        self.st_ino = st.st_ino
+        self.st_nlink = st.st_nlink
+        self.link = None
+
+class SourceManifest(object):
+    ''' Everything below a source directory, stat'ed only once.
+    The entries keep the order of a top-down os.walk(): a directory always comes before its children.
+    Regular files with more than one link are indexed by (st_dev, st_ino): the first one found is copied,
+    the next ones point to it (ManifestEntry.link) to be made hard links.
+    Blacklisted paths are left out before they are stat'ed, and blacklisted directories are not walked.
+    order_by_location() moves the regular files after every other entry, sorted by where their data is in the source. '''
+
+    def __init__(self, source, blacklist=None):
+        ''' Creates a new (empty) manifest for the given source directory, without the paths matching blacklist (a Blacklist) '''
+        self._source = source
+        self._blacklist = blacklist
+        self._entries = []
+        self._total_size = 0
+        self._excluded = 0
+        self._inodes = dict()
+        self._links = 0
+
+    def get_source(self):
+        ''' Return the directory this manifest describes '''
+        return self._source
+
+    def scan(self, progress=None):
+        ''' Index the source tree; progress, if given, is called as progress(directory) for every directory read '''
+        self._entries = []
+        self._total_size = 0
+        self._excluded = 0
+        self._inodes = dict()
+        self._links = 0
+        pending = [""]
+        while(pending):
+            dirpath = pending.pop()
+            if(progress is not None):
+                progress(dirpath)
+            dirs = []
+            files = []
+            for (name, st) in self._list(dirpath):
+                entry = ManifestEntry(os.path.join(dirpath, name), st)
+                if stat.S_ISDIR(st.st_mode):
+                    dirs.append(entry)
+                else:
+                    files.append(entry)
+                    # the other links of an inode don't add to the data to copy
+                    if stat.S_ISREG(st.st_mode) and not (st.st_nlink > 1 and self._index_link(entry)):
+                        self._total_size += st.st_size
+            self._entries.extend(dirs)
+            self._entries.extend(files)
+            for entry in reversed(dirs):
+                pending.append(entry.path)
+        return self
+
+    def order_by_location(self):
+        ''' Put the regular files last, in the order their data is laid out in the source (the physical offset
+        of their first extent, or their inode number where the filesystem has no FIEMAP, i.e. squashfs), so
+        reading them one after the other doesn't seek back and forth on slow media. The other entries keep
+        their order, a directory still comes before its children. Returns how many files were located by their extents. '''
+        others = []
+        files = []
+        located = 0
+        unsupported = set()
+        for (index, entry) in enumerate(self._entries):
+            if(not stat.S_ISREG(entry.st_mode) or entry.link is not None):
+                others.append(entry)
+                continue
+            location = None
+            if(entry.st_dev not in unsupported):
+                try:
+                    location = self._locate(entry)
+                except (OSError, IOError), e:
+                    if(e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS)):
+                        raise
+                    unsupported.add(entry.st_dev)
+            if(location is None):
+                # files sharing a filesystem get the same kind of key, the inode comes after any extent
+                files.append(((entry.st_dev, 1, entry.st_ino, index), entry))
+            else:
+                located += 1
+                files.append(((entry.st_dev, 0, location, index), entry))
+        files.sort(key=lambda item: item[0])
+        self._entries = others + [entry for (key, entry) in files]
+        return located
+
+    def get_entries(self):
+        ''' Return our list of entries '''
+        return self._entries
+
+    def get_directories(self):
+        ''' Return the entries that are directories, parents first '''
+        return [entry for entry in self._entries if stat.S_ISDIR(entry.st_mode)]
+
+    def get_excluded(self):
+        ''' Return how many blacklisted paths were left out (a directory counts once, whatever is in it) '''
+        return self._excluded
+
+    def get_total_size(self):
+        ''' Return the sum of the sizes of the regular files (every inode counted once) '''
+        return self._total_size
+
+    def get_links(self):
+        ''' Return how many entries are hard links to a previous one '''
+        return self._links
+
+    def get_link_target(self, entry):
+        ''' Return the path of the first entry of the inode of entry, None if it has no other link in the tree '''
+        return self._inodes.get((entry.st_dev, entry.st_ino))
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _list(self, dirpath):
+        directory = os.path.join(self._source, dirpath)
+        if(scandir is not None):
+            for item in scandir(directory):
+                if(not self._is_excluded(dirpath, item.name)):
+                    yield (item.name, item.stat(follow_symlinks=False))
+        else:
+            for name in os.listdir(directory):
+                if(not self._is_excluded(dirpath, name)):
+                    yield (name, os.lstat(os.path.join(directory, name)))
+
+    def _locate(self, entry):
+        fd = os.open(os.path.join(self._source, entry.path), os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+        try:
+            return fiemap_first(fd)
+        finally:
+            os.close(fd)
+
+    def _index_link(self, entry):
+        # only the inodes with several links are kept, so the index stays small; True when the entry is a new link
+        key = (entry.st_dev, entry.st_ino)
+        first = self._inodes.get(key)
+        if(first is None):
+            self._inodes[key] = entry.path
+            return False
+        entry.link = first
+        self._links += 1
+        return True
+
+    def _is_excluded(self, dirpath, name):
+        if(self._blacklist is None or not self._blacklist.matches(os.path.join(dirpath, name))):
+            return False
+        self._excluded += 1
+        return True
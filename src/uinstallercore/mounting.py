@@ -0,0 +1,139 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import sys
+import time
+import threading
+
+__all__ = ['MountPlan', 'MountResult']
+
+class MountResult(object):
+    ''' The outcome of mounting (or unmounting) an fstab entry '''
+
+    def __init__(self, entry, target):
+        ''' Creates a new (pending) result for entry, mounted on target '''
+        self.entry = entry
+        self.target = target
+        self.returncode = None
+        self.error = None
+        self.elapsed = None
+
+    def succeeded(self):
+        ''' Returns True/False as to whether the entry was mounted (or unmounted) '''
+        return self.returncode == 0
+
+class MountPlan(object):
+    ''' The order to mount the entries of an fstab below a root directory.
+    An entry is only mounted once the entries holding its mountpoint (i.e. /home for /home/user/data)
+    are, entries not nested in each other are mounted at the same time; unmounting goes the other way. '''
+
+    def __init__(self, entries, root="/target"):
+        ''' Creates a new plan for the fstab entries mounted below root; the root filesystem,
+        swap and the entries with no mountpoint are left out. Raises ValueError if two entries have the same mountpoint. '''
+        self._root = root.rstrip("/")
+        self._lock = threading.Lock()
+        seen = dict()
+        depths = dict()
+        for entry in entries:
+            mountpoint = self._normalize(entry.mountpoint)
+            if(mountpoint is None or entry.filesystem == "swap"):
+                continue
+            if(mountpoint in seen):
+                raise ValueError("%s and %s are both mounted on %s" % (seen[mountpoint].device, entry.device, mountpoint))
+            seen[mountpoint] = entry
+            if(mountpoint != "/"):
+                depths[mountpoint] = entry
+        # every mountpoint goes one level below the deepest planned mountpoint holding it
+        levels = dict()
+        for mountpoint in sorted(depths.keys(), key=lambda path: path.count("/")):
+            level = 0
+            parent = os.path.dirname(mountpoint)
+            while(parent != "/"):
+                if(parent in levels):
+                    level = levels[parent] + 1
+                    break
+                parent = os.path.dirname(parent)
+            levels[mountpoint] = level
+        self._levels = []
+        for mountpoint in sorted(levels.keys()):
+            while(len(self._levels) <= levels[mountpoint]):
+                self._levels.append([])
+            self._levels[levels[mountpoint]].append(depths[mountpoint])
+
+    def get_levels(self):
+        ''' Return the lists of entries mounted together, the first one mounted first '''
+        return self._levels
+
+    def get_target(self, entry):
+        ''' Return where entry is mounted '''
+        return self._root + self._normalize(entry.mountpoint)
+
+    def mount(self, mount, started=None, finished=None):
+        ''' Mount the entries, level by level, creating the mountpoints; returns the MountResult list.
+        mount is mount(entry, target) -> return code; started(result) and finished(result), if given, are
+        called around every mount, one at a time. Once a level fails nothing deeper is mounted. '''
+        results = []
+        for entries in self._levels:
+            level = []
+            for entry in entries:
+                target = self.get_target(entry)
+                if(not os.path.isdir(target)):
+                    os.makedirs(target)
+                level.append(MountResult(entry, target))
+            self._run_level(level, lambda result: mount(result.entry, result.target), started, finished)
+            results.extend(level)
+            if([result for result in level if not result.succeeded()]):
+                break
+        return results
+
+    def unmount(self, unmount, started=None, finished=None):
+        ''' Unmount the entries, deepest first; returns the MountResult list.
+        unmount is unmount(target) -> return code, started and finished as in mount(). '''
+        results = []
+        for entries in reversed(self._levels):
+            level = [MountResult(entry, self.get_target(entry)) for entry in entries]
+            self._run_level(level, lambda result: unmount(result.target), started, finished)
+            results.extend(level)
+        return results
+
+    def _run_level(self, results, function, started, finished):
+        if(len(results) == 1):
+            self._run(results[0], function, started, finished)
+            return
+        threads = []
+        for result in results:
+            thread = threading.Thread(target=self._run, args=(result, function, started, finished), name="uinstaller-mount-%s" % result.target)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def _run(self, result, function, started, finished):
+        self._notify(started, result)
+        start = time.time()
+        try:
+            result.returncode = function(result)
+        except:
+            result.error = sys.exc_info()[1]
+        result.elapsed = time.time() - start
+        self._notify(finished, result)
+
+    def _notify(self, callback, result):
+        if(callback is not None):
+            self._lock.acquire()
+            try:
+                callback(result)
+            finally:
+                self._lock.release()
+
+    def _normalize(self, mountpoint):
+        if(not mountpoint or not mountpoint.startswith("/")):
+            return None # swap, none...
+        return os.path.normpath(mountpoint)
@@ -0,0 +1,169 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import time
+import errno
+import threading
+import collections
+
+from uinstallercore.syscalls import sync, posix_fadvise, sync_file_range, POSIX_FADV_SEQUENTIAL, POSIX_FADV_DONTNEED, \
+    SYNC_FILE_RANGE_WAIT_BEFORE, SYNC_FILE_RANGE_WRITE, SYNC_FILE_RANGE_WAIT_AFTER
+
+__all__ = ['PageCacheLimiter']
+
+_WAIT = SYNC_FILE_RANGE_WAIT_BEFORE | SYNC_FILE_RANGE_WRITE | SYNC_FILE_RANGE_WAIT_AFTER
+
+# /proc/meminfo is read at most this often
+_SAMPLE_INTERVAL = 0.25
+
+class PageCacheLimiter(object):
+    ''' Keeps a copy from filling the page cache, for live sessions running from RAM.
+    The sources are read with a sequential read-ahead hint and dropped from the cache once copied.
+    The writeback of the target is started every batch_size bytes, and the range written before it
+    is waited for and dropped, so every thread has at most about two batches of dirty pages.
+    Whole files are kept open (a batch worth of them per thread, at most max_files) until their writeback is done.
+    One sync() at the end (see finish()) flushes whatever is left.
+    It is used by a FileCopier: begin(), written() after every chunk and end() for every file. '''
+
+    def __init__(self, batch_size=32 * 1024 * 1024, meminfo="/proc/meminfo", max_files=64):
+        ''' Creates a new limiter flushing every batch_size bytes, keeping at most max_files files open per thread
+        while they are written back (trees of small files fill the descriptors way before a batch);
+        meminfo is read to know the dirty memory '''
+        self._batch_size = max(int(batch_size), 1024 * 1024)
+        self._max_files = max(int(max_files), 1)
+        self._meminfo = meminfo
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._queues = []
+        self._supported = True
+        self._peak_dirty = 0
+        self._last_sample = 0
+        self._sync_time = None
+
+    def get_batch_size(self):
+        ''' Return the bytes written between two flushes '''
+        return self._batch_size
+
+    def get_peak_dirty(self):
+        ''' Return the most dirty memory (Dirty + Writeback of /proc/meminfo, in bytes) seen while copying '''
+        return self._peak_dirty
+
+    def get_sync_time(self):
+        ''' Return the seconds the final sync took, None if finish() was not called '''
+        return self._sync_time
+
+    def begin(self, src, dst):
+        ''' A file is going to be copied from the current offset of src to the one of dst '''
+        self._advise(posix_fadvise, src, 0, 0, POSIX_FADV_SEQUENTIAL)
+        offset = os.lseek(dst, 0, os.SEEK_CUR)
+        # [waited, started) has its writeback started, what follows isn't flushed at all
+        self._local.file = [dst, offset, offset]
+
+    def written(self, src, dst):
+        ''' Some data was copied from src to dst, flush it if a batch is complete '''
+        state = getattr(self._local, "file", None)
+        if(state is None or state[0] != dst):
+            return
+        (dst, waited, started) = state
+        offset = os.lseek(dst, 0, os.SEEK_CUR)
+        if(offset - started < self._batch_size):
+            return
+        self._advise(sync_file_range, dst, started, offset - started, SYNC_FILE_RANGE_WRITE)
+        if(started > waited):
+            # the writeback of the previous batch was started one batch ago, it should be done by now
+            self._advise(sync_file_range, dst, waited, started - waited, _WAIT)
+            self._advise(posix_fadvise, dst, waited, started - waited, POSIX_FADV_DONTNEED)
+            self._advise(posix_fadvise, src, waited, started - waited, POSIX_FADV_DONTNEED)
+        state[1] = started
+        state[2] = offset
+        self._sample()
+
+    def end(self, src, dst):
+        ''' The file copied from src to dst is complete (both are still open) '''
+        state = getattr(self._local, "file", None)
+        self._local.file = None
+        self._advise(posix_fadvise, src, 0, 0, POSIX_FADV_DONTNEED)
+        if(state is None or state[0] != dst):
+            return
+        (dst, waited, started) = state
+        offset = os.lseek(dst, 0, os.SEEK_CUR)
+        if(offset <= waited):
+            return # nothing was written (i.e. a reflink)
+        if(offset > started):
+            self._advise(sync_file_range, dst, started, offset - started, SYNC_FILE_RANGE_WRITE)
+        queue = getattr(self._local, "queue", None)
+        if(queue is None):
+            queue = self._local.queue = [collections.deque(), 0]
+            self._lock.acquire()
+            try:
+                self._queues.append(queue)
+            finally:
+                self._lock.release()
+        # the caller closes dst, keep our own descriptor until the writeback is done
+        queue[0].append((os.dup(dst), waited, offset - waited))
+        queue[1] += offset - waited
+        while(queue[1] > self._batch_size or len(queue[0]) > self._max_files):
+            self._retire(queue)
+        self._sample()
+
+    def finish(self):
+        ''' Wait for the writeback of every file copied, then sync() the filesystems; call it once the copy is over '''
+        self._lock.acquire()
+        try:
+            for queue in self._queues:
+                while(queue[0]):
+                    self._retire(queue)
+            self._queues = []
+        finally:
+            self._lock.release()
+        self._sample(force=True)
+        start = time.time()
+        sync()
+        self._sync_time = time.time() - start
+
+    def _retire(self, queue):
+        (fd, offset, nbytes) = queue[0].popleft()
+        queue[1] -= nbytes
+        try:
+            self._advise(sync_file_range, fd, offset, nbytes, _WAIT)
+            self._advise(posix_fadvise, fd, offset, nbytes, POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+    def _advise(self, function, *args):
+        if(not self._supported):
+            return
+        try:
+            function(*args)
+        except OSError, e:
+            if(e.errno == errno.ENOSYS):
+                self._supported = False # the kernel (or libc) doesn't have it, the copy still works
+            elif(e.errno not in (errno.EINVAL, errno.ESPIPE, errno.EOPNOTSUPP)):
+                raise
+
+    def _sample(self, force=False):
+        now = time.time()
+        if(not force and now - self._last_sample < _SAMPLE_INTERVAL):
+            return
+        self._last_sample = now
+        dirty = 0
+        try:
+            meminfofh = open(self._meminfo, "r")
+            try:
+                for line in meminfofh:
+                    fields = line.split()
+                    if(fields and fields[0] in ("Dirty:", "Writeback:")):
+                        dirty += int(fields[1]) * 1024
+            finally:
+                meminfofh.close()
+        except (IOError, OSError, ValueError):
+            return
+        if(dirty > self._peak_dirty):
+            self._peak_dirty = dirty
@@ -0,0 +1,152 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import time
+import threading
+
+__all__ = ['ProgressReporter']
+
+# every entry weighs as much as this many bytes, so trees of empty files still move the bar
+ENTRY_WEIGHT = 4096
+
+class ProgressReporter(object):
+    ''' Sits between the engine and the progress hook set with set_progress_hook().
+    Updates are coalesced so the hook is called at most 'frequency' times per second, progress
+    is weighted by bytes instead of by entries and the live throughput and ETA are kept.
+    The hook keeps its signature: hook(total=, current=, pulse=, done=, message=) '''
+
+    def __init__(self, hook=None, frequency=10):
+        ''' Creates a new reporter calling hook (if any) at most frequency times per second '''
+        self._hook = hook
+        self._interval = 1.0 / max(float(frequency), 0.001)
+        self._lock = threading.Lock()
+        self._last_emit = 0
+        self.start(0, 0)
+
+    def set_hook(self, hook):
+        ''' Set the callback receiving the coalesced updates '''
+        self._hook = hook
+
+    def set_frequency(self, frequency):
+        ''' Set the maximum number of updates per second '''
+        self._interval = 1.0 / max(float(frequency), 0.001)
+
+    def start(self, total_files, total_bytes, message="%s"):
+        ''' Start a new measured phase of total_files entries and total_bytes bytes;
+        message is formatted with the name of the last entry done when an update is sent. '''
+        self._lock.acquire()
+        try:
+            self._total_files = total_files
+            self._total_bytes = total_bytes
+            self._message = message
+            self._files = 0
+            self._bytes = 0
+            self._name = ""
+            self._started = time.time()
+            self._sample = (self._started, 0, 0)
+            self._files_rate = 0.0
+            self._bytes_rate = 0.0
+        finally:
+            self._lock.release()
+
+    def set_total(self, total_files, total_bytes):
+        ''' Change the size of the current phase, for phases that only know it while they run '''
+        self._total_files = total_files
+        self._total_bytes = total_bytes
+
+    def advance(self, nbytes=0, name=None, files=1):
+        ''' Account files entries and nbytes bytes as done (it's safe to call it from any thread) '''
+        self._lock.acquire()
+        try:
+            self._files += files
+            self._bytes += nbytes
+            if(name is not None):
+                self._name = name
+            now = time.time()
+            if(now - self._last_emit >= self._interval):
+                self._update_rates(now)
+                self._emit(now, total=self.get_total(), current=self.get_current(), message=self._format_message())
+        finally:
+            self._lock.release()
+
+    def pulse(self, message, *args):
+        ''' Send a pulse update, unless another update was sent too recently; message is only formatted with args when sent '''
+        self._lock.acquire()
+        try:
+            now = time.time()
+            if(now - self._last_emit >= self._interval):
+                if(args):
+                    message = message % args
+                self._emit(now, pulse=True, message=message)
+        finally:
+            self._lock.release()
+
+    def finish(self):
+        ''' Send the final state of the current phase, whatever the frequency '''
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._update_rates(now)
+            self._emit(now, total=self.get_total(), current=self.get_current(), message=self._format_message())
+        finally:
+            self._lock.release()
+
+    def get_total(self):
+        ''' Return the weight of the whole phase (bytes plus ENTRY_WEIGHT per entry) '''
+        return self._total_bytes + self._total_files * ENTRY_WEIGHT
+
+    def get_current(self):
+        ''' Return the weight already done '''
+        return min(self._bytes + self._files * ENTRY_WEIGHT, self.get_total())
+
+    def get_files(self):
+        ''' Return the entries already done '''
+        return self._files
+
+    def get_files_rate(self):
+        ''' Return the current throughput in entries per second '''
+        return self._files_rate
+
+    def get_bytes_rate(self):
+        ''' Return the current throughput in bytes per second '''
+        return self._bytes_rate
+
+    def get_eta(self):
+        ''' Return the estimated seconds left for the current phase, or None when still unknown '''
+        weight_rate = self._bytes_rate + self._files_rate * ENTRY_WEIGHT
+        if(weight_rate <= 0):
+            return None
+        return (self.get_total() - self.get_current()) / weight_rate
+
+    def _update_rates(self, now):
+        (when, files, nbytes) = self._sample
+        elapsed = now - when
+        if(elapsed < self._interval):
+            return
+        files_rate = (self._files - files) / elapsed
+        bytes_rate = (self._bytes - nbytes) / elapsed
+        if(when == self._started):
+            (self._files_rate, self._bytes_rate) = (files_rate, bytes_rate)
+        else:
+            # smooth it a bit, small files and big files come in bursts
+            self._files_rate = 0.7 * self._files_rate + 0.3 * files_rate
+            self._bytes_rate = 0.7 * self._bytes_rate + 0.3 * bytes_rate
+        self._sample = (now, self._files, self._bytes)
+
+    def _format_message(self):
+        message = self._message % self._name
+        eta = self.get_eta()
+        if(eta is None):
+            return message
+        return "%s (%d files/s, %.1f MB/s, %d:%02d left)" % (message, self._files_rate, self._bytes_rate / (1024 * 1024), eta / 60, eta % 60)
+
+    def _emit(self, now, **kwargs):
+        self._last_emit = now
+        if(self._hook is not None):
+            self._hook(**kwargs)
@@ -0,0 +1,90 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import re
+import subprocess
+from subprocess import Popen
+
+__all__ = ['SquashfsExtractor', 'ExtractionError']
+
+# the progress bar of unsquashfs ends with "current/total percentage%"
+_PROGRESS = re.compile(r"(\d+)/(\d+)\s+\d+%")
+
+class ExtractionError(Exception):
+    ''' Raised when the extractor fails '''
+    pass
+
+class SquashfsExtractor(object):
+    ''' Unpacks a squashfs image straight onto the target with unsquashfs, instead of loop-mounting it
+    and copying it file by file. The decompression runs on several processors at once. '''
+
+    def __init__(self, image, processors=None, progress=None, command="unsquashfs"):
+        ''' Creates a new extractor;
+        * image is the squashfs file to unpack.
+        * processors is the number of decompressing threads, all the processors of the host by default.
+        * progress, if given, is called as progress(current, total) with the inodes done so far; if it raises, the extraction stops.
+        * command is the unsquashfs executable. '''
+        self._image = image
+        if(processors is None):
+            try:
+                import multiprocessing
+                processors = multiprocessing.cpu_count()
+            except (ImportError, NotImplementedError):
+                processors = 1
+        self._processors = int(processors)
+        self._progress = progress
+        self._command = command
+
+    def get_command(self, dest, excludes=None):
+        ''' Return the command line extracting the image into dest, without the excluded paths;
+        their components are POSIX extended regular expressions (see Blacklist.get_extract_patterns) '''
+        # the live system copy never took the extended attributes, keep the same result
+        cmd = [self._command, "-f", "-no-xattrs", "-processors", str(self._processors), "-d", dest]
+        if(excludes):
+            cmd.extend(["-regex", "-excludes"])
+        cmd.append(self._image)
+        if(excludes):
+            cmd.extend([path.lstrip("/") for path in excludes])
+        return cmd
+
+    def extract(self, dest, excludes=None):
+        ''' Unpack the image into dest (which may exist already), raises ExtractionError if it fails '''
+        cmd = self.get_command(dest, excludes)
+        print "EXECUTING: '%s'" % " ".join(cmd)
+        p = Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=True)
+        pending = ""
+        try:
+            while(True):
+                data = os.read(p.stdout.fileno(), 4096)
+                if not data:
+                    break
+                # the progress bar is redrawn with carriage returns
+                lines = (pending + data).replace("\r", "\n").split("\n")
+                pending = lines.pop()
+                for line in lines:
+                    self._parse_line(line)
+            self._parse_line(pending)
+        except:
+            # i.e. the progress callback cancelled the install, don't leave unsquashfs running
+            p.kill()
+            p.wait()
+            p.stdout.close()
+            raise
+        p.stdout.close()
+        if(p.wait() != 0):
+            raise ExtractionError("%s failed with code %d" % (self._command, p.returncode))
+
+    def _parse_line(self, line):
+        match = _PROGRESS.search(line)
+        if(match is not None):
+            if(self._progress is not None):
+                self._progress(int(match.group(1)), int(match.group(2)))
+        elif(line.strip()):
+            print " ------ %s" % line.strip()
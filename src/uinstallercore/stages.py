@@ -0,0 +1,161 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import sys
+import time
+import threading
+
+__all__ = ['Stage', 'StageScheduler']
+
+class Stage(object):
+    ''' A step of the install; it is run once the stages it requires are done, and never at
+    the same time than another stage holding one of its resources (i.e. 'dpkg' for the dpkg lock) '''
+
+    def __init__(self, name, function, requires=(), resources=(), message=None):
+        ''' Creates a new stage;
+        * name identifies the stage.
+        * function is called, with no arguments, to run it.
+        * requires are the names of the stages that must be done before this one.
+        * resources are the names of the things this stage can't share.
+        * message is what the progress hook shows while it runs. '''
+        self.name = name
+        self.function = function
+        self.requires = tuple(requires)
+        self.resources = tuple(resources)
+        self.message = message
+        self.succeeded = None
+        self.error = None
+        self.started = None
+        self.elapsed = None
+
+class StageScheduler(object):
+    ''' Runs a set of stages, at the same time when they don't depend on each other.
+    When a stage fails nothing new is started and, once the running ones are done, its error is raised again. '''
+
+    def __init__(self, workers=4):
+        ''' Creates a new scheduler running up to workers stages at once '''
+        self._workers = max(int(workers), 1)
+        self._stages = []
+        self._names = dict()
+        self._condition = threading.Condition()
+        self._callback_lock = threading.Lock()
+        self._finished = []
+
+    def add(self, stage):
+        ''' Add a stage; the stages it requires must have been added before '''
+        for name in stage.requires:
+            if(name not in self._names):
+                raise ValueError("Stage %s requires an unknown stage: %s" % (stage.name, name))
+        if(stage.name in self._names):
+            raise ValueError("There is already a stage called %s" % stage.name)
+        self._stages.append(stage)
+        self._names[stage.name] = stage
+
+    def get_stages(self):
+        ''' Return our list of stages '''
+        return self._stages
+
+    def run(self, started=None, finished=None):
+        ''' Run every stage, returns the list of stages (with their outcome and duration).
+        started(stage) and finished(stage), if given, are called around every stage, one at a time. '''
+        pending = list(self._stages)
+        running = []
+        done = set()
+        busy = set()
+        error = None
+        self._finished = []
+        self._condition.acquire()
+        try:
+            while(True):
+                while(self._finished):
+                    stage = self._finished.pop(0)
+                    running.remove(stage)
+                    busy.difference_update(stage.resources)
+                    if(stage.succeeded):
+                        done.add(stage.name)
+                    elif(error is None):
+                        error = stage.error
+                if(error is None):
+                    for stage in list(pending):
+                        if(len(running) >= self._workers):
+                            break
+                        if(self._is_ready(stage, done, busy)):
+                            pending.remove(stage)
+                            running.append(stage)
+                            busy.update(stage.resources)
+                            thread = threading.Thread(target=self._run_stage, args=(stage, started, finished), name="uinstaller-stage-%s" % stage.name)
+                            thread.setDaemon(True)
+                            thread.start()
+                if(not running):
+                    break # done, or whatever is left can't run
+                self._condition.wait()
+        finally:
+            self._condition.release()
+        if(error is not None):
+            (exc_type, exc_value, exc_traceback) = error
+            raise exc_type, exc_value, exc_traceback
+        return self._stages
+
+    def get_critical_path(self):
+        ''' Return the chain of stages (first one first), following what every stage requires, that took the longest '''
+        longest = dict()
+        for stage in self._stages:
+            (before, path) = (0, [])
+            for name in stage.requires:
+                if(longest[name][0] > before):
+                    (before, path) = longest[name]
+            longest[stage.name] = (before + (stage.elapsed or 0), path + [stage])
+        if(not longest):
+            return []
+        return max(longest.values(), key=lambda item: item[0])[1]
+
+    def _is_ready(self, stage, done, busy):
+        for name in stage.requires:
+            if(name not in done):
+                return False
+        for resource in stage.resources:
+            if(resource in busy):
+                return False
+        return True
+
+    def _run_stage(self, stage, started, finished):
+        # whatever happens (even in the callbacks) the stage is handed back, or run() would wait forever
+        try:
+            try:
+                self._notify(started, stage)
+                stage.started = time.time()
+                stage.function()
+                stage.succeeded = True
+            except:
+                stage.error = sys.exc_info()
+                stage.succeeded = False
+            stage.elapsed = 0
+            if(stage.started is not None):
+                stage.elapsed = time.time() - stage.started
+            try:
+                self._notify(finished, stage)
+            except:
+                if(stage.error is None):
+                    stage.error = sys.exc_info()
+                stage.succeeded = False
+        finally:
+            self._condition.acquire()
+            try:
+                self._finished.append(stage)
+                self._condition.notify_all()
+            finally:
+                self._condition.release()
+
+    def _notify(self, callback, stage):
+        if(callback is not None):
+            self._callback_lock.acquire()
+            try:
+                callback(stage)
+            finally:
+                self._callback_lock.release()
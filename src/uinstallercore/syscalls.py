@@ -0,0 +1,250 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+# Thin wrappers around the linux system calls the copy code relies on. The os module
+# is used when it already has them, libc (through ctypes) otherwise; when neither can
+# do it an OSError with ENOSYS is raised so the caller can fall back to something else.
+#
+
+import os
+import errno
+import fcntl
+import struct
+import array
+import ctypes
+import ctypes.util
+
+__all__ = ['reflink', 'copy_file_range', 'sendfile', 'sync', 'syncfs', 'openat', 'mkdirat', 'mknodat', 'symlinkat', 'readlinkat',
+           'unlinkat', 'fchownat', 'fchmodat', 'utimensat', 'futimens', 'AT_SYMLINK_NOFOLLOW', 'AT_REMOVEDIR', 'O_DIRECTORY', 'O_NOFOLLOW', 'supports_dir_fd',
+           'posix_fadvise', 'sync_file_range', 'fallocate', 'SEEK_DATA', 'SEEK_HOLE', 'fiemap_first', 'POSIX_FADV_SEQUENTIAL', 'POSIX_FADV_DONTNEED',
+           'SYNC_FILE_RANGE_WAIT_BEFORE', 'SYNC_FILE_RANGE_WRITE', 'SYNC_FILE_RANGE_WAIT_AFTER']
+
+FICLONE = 0x40049409 # _IOW(0x94, 9, int)
+FS_IOC_FIEMAP = 0xc020660b # _IOWR('f', 11, struct fiemap)
+AT_SYMLINK_NOFOLLOW = 0x100
+AT_REMOVEDIR = 0x200
+O_DIRECTORY = getattr(os, 'O_DIRECTORY', 0200000)
+O_NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0400000)
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+POSIX_FADV_SEQUENTIAL = 2
+POSIX_FADV_DONTNEED = 4
+SYNC_FILE_RANGE_WAIT_BEFORE = 1
+SYNC_FILE_RANGE_WRITE = 2
+SYNC_FILE_RANGE_WAIT_AFTER = 4
+
+# os takes dir_fd (and does the *at calls itself) since python 3.3
+_DIR_FD = hasattr(os, 'supports_dir_fd') and os.open in os.supports_dir_fd
+
+_ssize_t = getattr(ctypes, 'c_ssize_t', ctypes.c_long)
+_libc = None
+_functions = dict()
+
+def _get_libc():
+    global _libc
+    if(_libc is None):
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        except OSError:
+            _libc = False
+    return _libc
+
+def _libc_function(name, argtypes, restype=_ssize_t):
+    # the prototypes are set once, the copy loops call these for every file
+    function = _functions.get(name)
+    if(function is None):
+        libc = _get_libc()
+        if(not libc or not hasattr(libc, name)):
+            raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS))
+        function = getattr(libc, name)
+        function.argtypes = argtypes
+        function.restype = restype
+        _functions[name] = function
+    return function
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+def _timespecs(times):
+    # the same rounding than os.utime() (microseconds, truncated) so the results don't depend on the call used
+    values = (_timespec * 2)()
+    for (i, value) in enumerate(times):
+        seconds = int(value)
+        values[i].tv_sec = seconds
+        values[i].tv_nsec = max(int((value - seconds) * 1e6), 0) * 1000
+    return values
+
+def _check(result):
+    if(result < 0):
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+def reflink(src_fd, dst_fd):
+    ''' Make dst_fd share the data extents of src_fd (FICLONE), both must live in the same filesystem '''
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except IOError, e:
+        raise OSError(e.errno, e.strerror)
+
+def copy_file_range(src_fd, dst_fd, count):
+    ''' Copy up to count bytes from the current offset of src_fd to the current offset of dst_fd inside the kernel '''
+    if(hasattr(os, 'copy_file_range')):
+        return os.copy_file_range(src_fd, dst_fd, count)
+    function = _libc_function("copy_file_range", [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint])
+    return _check(function(src_fd, None, dst_fd, None, count, 0))
+
+def sendfile(dst_fd, src_fd, count):
+    ''' Copy up to count bytes from the current offset of src_fd to dst_fd inside the kernel '''
+    if(hasattr(os, 'sendfile')):
+        return os.sendfile(dst_fd, src_fd, None, count)
+    function = _libc_function("sendfile", [ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t])
+    return _check(function(dst_fd, src_fd, None, count))
+
+def posix_fadvise(fd, offset, length, advice):
+    ''' Tell the kernel how the range [offset, offset + length) of fd is going to be used (length 0 is up to the end) '''
+    if(hasattr(os, 'posix_fadvise')):
+        return os.posix_fadvise(fd, offset, length, advice)
+    function = _libc_function("posix_fadvise64", [ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong, ctypes.c_int], ctypes.c_int)
+    # it returns the error number instead of setting errno
+    err = function(fd, offset, length, advice)
+    if(err != 0):
+        raise OSError(err, os.strerror(err))
+
+def sync_file_range(fd, offset, nbytes, flags):
+    ''' Start and/or wait for the writeback of the range [offset, offset + nbytes) of fd (nbytes 0 is up to the end) '''
+    function = _libc_function("sync_file_range", [ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong, ctypes.c_uint], ctypes.c_int)
+    _check(function(fd, offset, nbytes, flags))
+
+def fallocate(fd, offset, length, mode=0):
+    ''' Allocate the blocks of the range [offset, offset + length) of fd (extending the file if needed with mode 0).
+    Unlike posix_fallocate() it never falls back to writing zeros, filesystems that can't do it raise EOPNOTSUPP. '''
+    function = _libc_function("fallocate64", [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong], ctypes.c_int)
+    _check(function(fd, mode, offset, length))
+
+def fiemap_first(fd):
+    ''' Return the physical offset, in bytes, of the first data extent of the open file fd, None if it has no data on the disk.
+    Filesystems without FIEMAP (i.e. squashfs) raise an OSError (EOPNOTSUPP or ENOTTY). '''
+    # struct fiemap (32 bytes) asking for a single struct fiemap_extent (56 bytes)
+    request = array.array("B", struct.pack("=QQIIII", 0, 0xffffffffffffffff, 0, 0, 1, 0) + "\0" * 56)
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, request, True)
+    except IOError, e:
+        raise OSError(e.errno, e.strerror)
+    (mapped,) = struct.unpack_from("=I", request, 20)
+    if(mapped == 0):
+        return None
+    (logical, physical) = struct.unpack_from("=QQ", request, 32)
+    return physical
+
+def supports_dir_fd():
+    ''' Returns True/False as to whether the *at wrappers work here (mknodat() may still raise ENOSYS) '''
+    if(_DIR_FD):
+        return True
+    libc = _get_libc()
+    if(not libc):
+        return False
+    for name in ("openat", "mkdirat", "symlinkat", "readlinkat", "unlinkat", "fchownat", "fchmodat", "utimensat", "futimens"):
+        if(not hasattr(libc, name)):
+            return False
+    return True
+
+def openat(dir_fd, path, flags, mode=0777):
+    ''' Open path relative to the directory dir_fd, returns the new descriptor '''
+    if(_DIR_FD):
+        return os.open(path, flags, mode, dir_fd=dir_fd)
+    function = _libc_function("openat", [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_uint], ctypes.c_int)
+    return _check(function(dir_fd, path, flags, mode))
+
+def mkdirat(dir_fd, path, mode=0777):
+    ''' Create the directory path relative to dir_fd '''
+    if(_DIR_FD):
+        return os.mkdir(path, mode, dir_fd=dir_fd)
+    function = _libc_function("mkdirat", [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint], ctypes.c_int)
+    _check(function(dir_fd, path, mode))
+
+def mknodat(dir_fd, path, mode, device=0):
+    ''' Create the special file path relative to dir_fd '''
+    if(_DIR_FD):
+        return os.mknod(path, mode, device, dir_fd=dir_fd)
+    # only exported by glibc >= 2.33, older ones get ENOSYS
+    function = _libc_function("mknodat", [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint, ctypes.c_ulonglong], ctypes.c_int)
+    _check(function(dir_fd, path, mode, device))
+
+def symlinkat(target, dir_fd, path):
+    ''' Create path, relative to dir_fd, as a symbolic link to target '''
+    if(_DIR_FD):
+        return os.symlink(target, path, dir_fd=dir_fd)
+    function = _libc_function("symlinkat", [ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p], ctypes.c_int)
+    _check(function(target, dir_fd, path))
+
+def readlinkat(dir_fd, path):
+    ''' Return the target of the symbolic link path, relative to dir_fd '''
+    if(_DIR_FD):
+        return os.readlink(path, dir_fd=dir_fd)
+    function = _libc_function("readlinkat", [ctypes.c_int, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_size_t])
+    size = 4096
+    while(True):
+        buf = ctypes.create_string_buffer(size)
+        n = _check(function(dir_fd, path, buf, size))
+        if(n < size):
+            return buf.raw[:n]
+        size *= 2
+
+def unlinkat(dir_fd, path, flags=0):
+    ''' Remove path relative to dir_fd (a directory, if flags has AT_REMOVEDIR) '''
+    if(_DIR_FD):
+        if(flags & AT_REMOVEDIR):
+            return os.rmdir(path, dir_fd=dir_fd)
+        return os.unlink(path, dir_fd=dir_fd)
+    function = _libc_function("unlinkat", [ctypes.c_int, ctypes.c_char_p, ctypes.c_int], ctypes.c_int)
+    _check(function(dir_fd, path, flags))
+
+def fchownat(dir_fd, path, uid, gid, flags=0):
+    ''' Change the owner of path relative to dir_fd; with AT_SYMLINK_NOFOLLOW the one of a link itself '''
+    if(_DIR_FD):
+        return os.chown(path, uid, gid, dir_fd=dir_fd, follow_symlinks=not (flags & AT_SYMLINK_NOFOLLOW))
+    function = _libc_function("fchownat", [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint, ctypes.c_uint, ctypes.c_int], ctypes.c_int)
+    _check(function(dir_fd, path, uid, gid, flags))
+
+def fchmodat(dir_fd, path, mode):
+    ''' Change the mode of path relative to dir_fd (symbolic links are followed, linux can't change their mode) '''
+    if(_DIR_FD):
+        return os.chmod(path, mode, dir_fd=dir_fd)
+    function = _libc_function("fchmodat", [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint, ctypes.c_int], ctypes.c_int)
+    _check(function(dir_fd, path, mode, 0))
+
+def utimensat(dir_fd, path, times, flags=0):
+    ''' Set the (atime, mtime) of path relative to dir_fd; with AT_SYMLINK_NOFOLLOW the ones of a link itself '''
+    if(_DIR_FD):
+        return os.utime(path, times, dir_fd=dir_fd, follow_symlinks=not (flags & AT_SYMLINK_NOFOLLOW))
+    function = _libc_function("utimensat", [ctypes.c_int, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_int], ctypes.c_int)
+    _check(function(dir_fd, path, _timespecs(times), flags))
+
+def futimens(fd, times):
+    ''' Set the (atime, mtime) of the open file fd '''
+    if(_DIR_FD):
+        return os.utime(fd, times)
+    function = _libc_function("futimens", [ctypes.c_int, ctypes.c_void_p], ctypes.c_int)
+    _check(function(fd, _timespecs(times)))
+
+def syncfs(fd):
+    ''' Flush the dirty pages of the filesystem holding the open file fd, and only of it '''
+    function = _libc_function("syncfs", [ctypes.c_int], ctypes.c_int)
+    _check(function(fd))
+
+def sync():
+    ''' Flush every dirty page of every filesystem to disk '''
+    if(hasattr(os, 'sync')):
+        os.sync()
+        return
+    libc = _get_libc()
+    if(libc):
+        libc.sync()
+    else:
+        os.system("sync")
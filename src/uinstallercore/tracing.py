@@ -0,0 +1,197 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import os
+import time
+import json
+import random
+import threading
+
+__all__ = ['Tracer', 'Span', 'FileSink', 'CallbackSink']
+
+class FileSink(object):
+    ''' Appends every trace event to a file, one JSON object per line '''
+
+    def __init__(self, filename):
+        ''' Creates a new sink writing to filename '''
+        self._filename = filename
+        self._fh = None
+
+    def write(self, event):
+        if(self._fh is None):
+            directory = os.path.dirname(self._filename)
+            if(directory and not os.path.isdir(directory)):
+                os.makedirs(directory)
+            self._fh = open(self._filename, "a")
+        self._fh.write(json.dumps(event, sort_keys=True) + "\n")
+        self._fh.flush()
+
+    def close(self):
+        if(self._fh is not None):
+            self._fh.close()
+            self._fh = None
+
+class CallbackSink(object):
+    ''' Hands every trace event (a dict) to a function '''
+
+    def __init__(self, callback):
+        ''' Creates a new sink calling callback(event) '''
+        self._callback = callback
+
+    def write(self, event):
+        self._callback(event)
+
+    def close(self):
+        pass
+
+class Span(object):
+    ''' A phase being traced; end() it (or use it in a with statement) when the phase is over '''
+
+    def __init__(self, tracer, phase, fields, command=False):
+        self._tracer = tracer
+        self.phase = phase
+        self.fields = fields
+        self.command = command
+        self.started = time.time()
+        self.elapsed = None
+
+    def end(self, **fields):
+        ''' Close the span, fields are added to its end event. Returns the elapsed seconds '''
+        if(self.elapsed is None):
+            self.elapsed = time.time() - self.started
+            self.fields.update(fields)
+            self._tracer._end(self)
+        return self.elapsed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if(exc_type is not None):
+            self.end(error=str(exc_value))
+        else:
+            self.end()
+        return False
+
+class _NullSpan(object):
+    # what a disabled tracer hands out, it does nothing at all
+    phase = None
+    elapsed = None
+
+    def end(self, **fields):
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Tracer(object):
+    ''' Emits structured trace events of an install: a 'start' and an 'end' event for every phase
+    (with their timestamps, duration and fields) and the totals of its counters.
+    Every event carries the install id, so the traces of many installs can be put together.
+    With no sink the tracer is disabled and costs next to nothing. '''
+
+    def __init__(self, sink=None, install_id=None):
+        ''' Creates a new tracer writing to sink (a FileSink, a CallbackSink or None to disable it) '''
+        if(install_id is None):
+            install_id = "%08x%08x" % (int(time.time()), random.getrandbits(32))
+        self._install_id = install_id
+        self._lock = threading.Lock()
+        self._counters = dict()
+        self.set_sink(sink)
+
+    def set_sink(self, sink):
+        ''' Set where the events go, None to disable the tracer '''
+        self._sink = sink
+
+    def is_enabled(self):
+        ''' Returns True/False as to whether the events go somewhere '''
+        return self._sink is not None
+
+    def get_install_id(self):
+        ''' Return the id stamped on every event '''
+        return self._install_id
+
+    def begin(self, phase, **fields):
+        ''' Start tracing a phase (i.e. 'copy', 'mount'), returns its Span '''
+        if(self._sink is None):
+            return _NULL_SPAN
+        span = Span(self, phase, fields)
+        self._emit("start", span.phase, span.started, span.fields)
+        return span
+
+    def begin_command(self, phase, **fields):
+        ''' Like begin(), for a phase running a subprocess: it is added to the subprocess counters when it ends '''
+        if(self._sink is None):
+            return _NULL_SPAN
+        span = Span(self, phase, fields, command=True)
+        self._emit("start", span.phase, span.started, span.fields)
+        return span
+
+    def count(self, name, value=1):
+        ''' Add value to the counter name (i.e. 'bytes_copied') '''
+        if(self._sink is None):
+            return
+        self._lock.acquire()
+        try:
+            self._counters[name] = self._counters.get(name, 0) + value
+        finally:
+            self._lock.release()
+
+    def get_counters(self):
+        ''' Return a copy of the counters '''
+        self._lock.acquire()
+        try:
+            return dict(self._counters)
+        finally:
+            self._lock.release()
+
+    def finish(self):
+        ''' Emit the counters and close the sink; the counters start over afterwards '''
+        if(self._sink is None):
+            return
+        self._emit("counters", None, time.time(), self.get_counters())
+        self._lock.acquire()
+        try:
+            self._counters = dict()
+            self._sink.close()
+        finally:
+            self._lock.release()
+
+    def _end(self, span):
+        if(span.command):
+            self._lock.acquire()
+            try:
+                self._counters["subprocesses"] = self._counters.get("subprocesses", 0) + 1
+                self._counters["subprocess_seconds"] = self._counters.get("subprocess_seconds", 0) + span.elapsed
+            finally:
+                self._lock.release()
+        fields = dict(span.fields)
+        fields["elapsed"] = span.elapsed
+        self._emit("end", span.phase, span.started + span.elapsed, fields)
+
+    def _emit(self, event, phase, timestamp, fields):
+        record = dict(fields)
+        record["event"] = event
+        record["time"] = timestamp
+        record["install"] = self._install_id
+        record["thread"] = threading.currentThread().getName()
+        if(phase is not None):
+            record["phase"] = phase
+        self._lock.acquire()
+        try:
+            sink = self._sink
+            if(sink is not None):
+                sink.write(record)
+        finally:
+            self._lock.release()
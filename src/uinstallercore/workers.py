@@ -0,0 +1,73 @@
+#
+# This is UInstaller "The Universal Distro Installer", a project who aims to be
+# a installer for every popular linux distro and easy to adapt to a new linux based
+# distro, this project is based on the Linux Mint's work "Live Installer", who was
+# a startpoint for this job.
+# "Use it, adapt it and enjoy it!"
+# The Uremix Team.
+#
+
+import sys
+import threading
+import Queue
+
+__all__ = ['WorkerPool']
+
+class WorkerPool(object):
+    ''' A fixed set of threads consuming jobs from a bounded queue.
+    The first error raised by a job is kept and raised again on the thread that calls join(). '''
+
+    def __init__(self, workers=4, backlog=None):
+        ''' Creates a new pool; with less than two workers the jobs are run inline by submit() '''
+        self._workers = max(int(workers), 1)
+        self._error = None
+        self._threads = []
+        if(backlog is None):
+            backlog = self._workers * 64
+        self._queue = Queue.Queue(backlog)
+        if(self._workers > 1):
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._run, name="uinstaller-worker-%d" % i)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+
+    def get_workers(self):
+        ''' Return the number of workers of this pool '''
+        return self._workers
+
+    def submit(self, function, *args):
+        ''' Queue function(*args) to be run by one of the workers (blocks while the backlog is full) '''
+        self._raise_error()
+        if(not self._threads):
+            function(*args)
+        else:
+            self._queue.put((function, args))
+
+    def join(self):
+        ''' Wait for every queued job and stop the workers; raises the first error of a job, if any '''
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._raise_error()
+
+    def _run(self):
+        while(True):
+            job = self._queue.get()
+            if(job is None):
+                break
+            if(self._error is not None):
+                continue # something failed already, just drain the queue
+            (function, args) = job
+            try:
+                function(*args)
+            except:
+                if(self._error is None):
+                    self._error = sys.exc_info()
+
+    def _raise_error(self):
+        if(self._error is not None):
+            (exc_type, exc_value, exc_traceback) = self._error
+            raise exc_type, exc_value, exc_traceback